@@ -0,0 +1,107 @@
+"""Compare the RandomForest CPT model against the linear hashing model.
+
+Run from the project root:
+
+    python ai_model/compare_models.py [--data dataset/labeled_data.csv] [--output ai_model/model_comparison.md]
+"""
+import os
+import io
+import sys
+import time
+import pickle
+import argparse
+import statistics
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from linear_model import train_linear
+
+
+def artifact_size(obj):
+    buffer = io.BytesIO()
+    pickle.dump(obj, buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    return buffer.tell()
+
+
+def linear_artifact_size(model):
+    buffer = io.BytesIO()
+    model.write(buffer)
+    return buffer.tell()
+
+
+def measure(predict_batch, texts, repeats):
+    """Return (median single-item latency in ms, batch throughput in items/s)."""
+    single = []
+    for text in texts:
+        start = time.perf_counter()
+        predict_batch([text])
+        single.append((time.perf_counter() - start) * 1000)
+
+    batch = texts * repeats
+    start = time.perf_counter()
+    predict_batch(batch)
+    elapsed = time.perf_counter() - start
+    return statistics.median(single), len(batch) / elapsed if elapsed else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join("dataset", "labeled_data.csv"))
+    parser.add_argument("--output", default=None, help="Write the markdown report here")
+    parser.add_argument("--repeats", type=int, default=200, help="Batch size multiplier for throughput")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data)
+    X = df["Report Description"].astype(str)
+    y = df["CPT Code"].astype(str)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    test_texts = list(X_test)
+
+    # Current production model (same settings as train_model.py)
+    start = time.perf_counter()
+    vectorizer = TfidfVectorizer(ngram_range=(1, 3), max_features=5000)
+    rf = RandomForestClassifier(n_estimators=200, class_weight='balanced', random_state=42)
+    rf.fit(vectorizer.fit_transform(X_train), y_train)
+    rf_train = time.perf_counter() - start
+    rf_predict = lambda texts: rf.predict(vectorizer.transform(texts))
+
+    start = time.perf_counter()
+    linear = train_linear(X_train, y_train)
+    linear_train = time.perf_counter() - start
+
+    rows = []
+    for name, predict, train_time, size in (
+        ("RandomForest (TF-IDF, 200 trees)", rf_predict, rf_train, artifact_size((rf, vectorizer))),
+        ("Linear SGD (hashing, sparse weights)", linear.predict, linear_train, linear_artifact_size(linear)),
+    ):
+        accuracy = accuracy_score(y_test, predict(test_texts))
+        latency, throughput = measure(predict, test_texts, args.repeats)
+        rows.append((name, accuracy, latency, throughput, size, train_time))
+
+    lines = [
+        f"# CPT model comparison on `{args.data}`",
+        "",
+        f"{len(X_train)} training rows, {len(X_test)} test rows (test_size=0.2, random_state=42).",
+        "",
+        "| Model | Accuracy | Latency / item (ms) | Batch throughput (items/s) | Artifact size (KB) | Train time (s) |",
+        "|---|---|---|---|---|---|",
+    ]
+    for name, accuracy, latency, throughput, size, train_time in rows:
+        lines.append(
+            f"| {name} | {accuracy:.2f} | {latency:.3f} | {throughput:,.0f} | {size / 1024:,.1f} | {train_time:.2f} |"
+        )
+    report = "\n".join(lines) + "\n"
+
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+        print(f"💾 Report saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
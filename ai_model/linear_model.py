@@ -0,0 +1,258 @@
+import os
+import json
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+# Determine absolute path
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LINEAR_MODEL_PATH = os.path.join(BASE_DIR, "cpt_linear.npz")
+
+# Hashing parameters are part of the artifact, there is no vocabulary to ship
+N_FEATURES = 2 ** 18
+NGRAM_RANGE = (1, 3)
+
+TEXT_COLUMN = "Report Description"
+LABEL_COLUMN = "CPT Code"
+
+
+def build_vectorizer(n_features=N_FEATURES, ngram_range=NGRAM_RANGE):
+    """Stateless text featurizer shared by training and inference."""
+    return HashingVectorizer(
+        n_features=n_features,
+        ngram_range=tuple(ngram_range),
+        alternate_sign=False,
+        norm="l2",
+        dtype=np.float32,
+    )
+
+
+def build_classifier(random_state=42):
+    """Linear classifier trained by SGD, supports partial_fit."""
+    return SGDClassifier(
+        loss="log_loss",
+        alpha=1e-4,
+        max_iter=50,
+        tol=None,
+        random_state=random_state,
+    )
+
+
+class LinearCPTModel:
+    """CPT classifier stored as a sparse weight matrix plus an intercept vector.
+
+    Prediction is one sparse matrix product of the hashed input against the
+    weights, no sklearn estimator is needed once the model is exported.
+    """
+
+    def __init__(self, weights, intercept, classes, n_features=N_FEATURES,
+                 ngram_range=NGRAM_RANGE, metadata=None):
+        self.weights = sp.csr_matrix(weights, dtype=np.float32)
+        self.intercept = np.asarray(intercept, dtype=np.float32)
+        self.classes = np.asarray(classes).astype(str)
+        self.n_features = int(n_features)
+        self.ngram_range = tuple(int(n) for n in ngram_range)
+        self.metadata = dict(metadata or {})
+        self.vectorizer = build_vectorizer(self.n_features, self.ngram_range)
+
+    @classmethod
+    def from_classifier(cls, clf, vectorizer, metadata=None):
+        """Export a fitted SGDClassifier/LogisticRegression to plain arrays."""
+        coef = np.asarray(clf.coef_, dtype=np.float32)
+        intercept = np.asarray(clf.intercept_, dtype=np.float32)
+        classes = np.asarray(clf.classes_).astype(str)
+        # Binary sklearn models keep a single row for the positive class
+        if coef.shape[0] == 1 and len(classes) == 2:
+            coef = np.vstack([-coef, coef])
+            intercept = np.concatenate([-intercept, intercept])
+        coef[np.abs(coef) < 1e-6] = 0.0
+        return cls(coef, intercept, classes, vectorizer.n_features,
+                   vectorizer.ngram_range, metadata)
+
+    def decision_function(self, texts):
+        X = self.vectorizer.transform([str(t) for t in texts])
+        scores = (X @ self.weights.T).toarray()
+        return scores + self.intercept
+
+    def predict(self, texts):
+        if not len(texts):
+            return np.array([], dtype=str)
+        return self.classes[self.decision_function(texts).argmax(axis=1)]
+
+    def to_classifier(self, classes=(), random_state=42):
+        """Rebuild a warm SGDClassifier so partial_fit continues from these weights.
+
+        Labels in ``classes`` the model has never seen start with zero weights.
+        """
+        all_classes = np.union1d(self.classes, np.asarray(classes, dtype=str))
+        if len(all_classes) < 2:
+            raise ValueError("Incremental training needs at least two CPT classes.")
+
+        coef = np.zeros((len(all_classes), self.n_features), dtype=np.float32)
+        intercept = np.zeros(len(all_classes), dtype=np.float32)
+        rows = np.searchsorted(all_classes, self.classes)
+        coef[rows] = self.weights.toarray()
+        intercept[rows] = self.intercept
+        if len(all_classes) == 2:
+            # Undo the two-row export of binary models
+            coef = (coef[1:] - coef[:1]) / 2
+            intercept = (intercept[1:] - intercept[:1]) / 2
+
+        clf = build_classifier(random_state)
+        clf.classes_ = all_classes
+        clf.coef_ = coef
+        clf.intercept_ = intercept
+        # Resume the learning-rate schedule instead of restarting it
+        clf.t_ = float(self.metadata.get("t", 1.0))
+        return clf
+
+    def write(self, fileobj):
+        """Serialize the arrays into an open binary file object."""
+        np.savez_compressed(
+            fileobj,
+            data=self.weights.data,
+            indices=self.weights.indices,
+            indptr=self.weights.indptr,
+            shape=np.array(self.weights.shape),
+            intercept=self.intercept,
+            classes=self.classes,
+            n_features=np.array(self.n_features),
+            ngram_range=np.array(self.ngram_range),
+            metadata=np.array(json.dumps(self.metadata)),
+        )
+
+    def save(self, path=LINEAR_MODEL_PATH):
+        """Write the model atomically so readers never see a partial file.
+
+        Each save writes its own temporary file next to ``path``, two
+        concurrent retrains never write into the same one.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                        prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                self.write(f)
+            os.chmod(tmp_path, 0o644)  # mkstemp makes it private to the owner
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return path
+
+    @classmethod
+    def load(cls, path=LINEAR_MODEL_PATH):
+        with np.load(path, allow_pickle=False) as npz:
+            weights = sp.csr_matrix(
+                (npz["data"], npz["indices"], npz["indptr"]),
+                shape=tuple(npz["shape"]),
+            )
+            return cls(
+                weights,
+                npz["intercept"],
+                npz["classes"],
+                int(npz["n_features"]),
+                tuple(npz["ngram_range"]),
+                json.loads(str(npz["metadata"])),
+            )
+
+
+_current = {"key": None, "model": None}
+_current_lock = threading.Lock()
+
+
+def load_current_model(path=LINEAR_MODEL_PATH):
+    """Return the served model, reloading it when the file has been swapped.
+
+    Costs one stat() per call, so running workers pick up a retrained
+    artifact without a restart. Returns None when no artifact exists.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (path, st.st_mtime_ns, st.st_size, st.st_ino)
+    if _current["key"] != key:
+        with _current_lock:
+            if _current["key"] != key:
+                _current["model"] = LinearCPTModel.load(path)
+                _current["key"] = key
+    return _current["model"]
+
+
+def train_linear(texts, labels, random_state=42):
+    """Fit the linear model in memory and return the exported LinearCPTModel."""
+    vectorizer = build_vectorizer()
+    X = vectorizer.transform([str(t) for t in texts])
+    clf = build_classifier(random_state)
+    clf.fit(X, np.asarray(labels).astype(str))
+    metadata = {"t": float(clf.t_), "samples_seen": X.shape[0]}
+    return LinearCPTModel.from_classifier(clf, vectorizer, metadata)
+
+
+# ---------- STREAMING TRAINING ----------
+def iter_csv_chunks(csv_path, chunksize=10000, text_column=TEXT_COLUMN, label_column=LABEL_COLUMN):
+    """Yield (texts, labels) batches from a labeled CSV without loading it whole."""
+    reader = pd.read_csv(
+        csv_path,
+        usecols=[text_column, label_column],
+        dtype=str,
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        chunk = chunk.dropna()
+        if not chunk.empty:
+            yield chunk[text_column].tolist(), chunk[label_column].str.strip().tolist()
+
+
+def collect_classes(csv_path, chunksize=100000, label_column=LABEL_COLUMN):
+    """Scan only the label column to find every CPT class before partial_fit."""
+    classes = set()
+    for chunk in pd.read_csv(csv_path, usecols=[label_column], dtype=str, chunksize=chunksize):
+        classes.update(chunk[label_column].dropna().str.strip())
+    return np.array(sorted(classes))
+
+
+def train_streaming(batches, classes, model=None, random_state=42):
+    """Train with partial_fit over an iterable of (texts, labels) batches.
+
+    Starts from ``model`` when given, so the same call serves incremental
+    retraining. Each batch is scored before it is learned from (progressive
+    validation). Returns the exported model and a stats dict.
+    """
+    if model is None:
+        vectorizer = build_vectorizer()
+        clf = build_classifier(random_state)
+        metadata = {}
+    else:
+        vectorizer = model.vectorizer
+        clf = model.to_classifier(classes, random_state)
+        metadata = dict(model.metadata)
+    classes = getattr(clf, "classes_", np.asarray(classes, dtype=str))
+
+    stats = {"samples": 0, "batches": 0, "evaluated": 0, "correct": 0}
+    for texts, labels in batches:
+        X = vectorizer.transform([str(t) for t in texts])
+        y = np.asarray(labels).astype(str)
+        if hasattr(clf, "coef_"):
+            stats["correct"] += int((clf.predict(X) == y).sum())
+            stats["evaluated"] += len(y)
+        clf.partial_fit(X, y, classes=classes)
+        stats["samples"] += len(y)
+        stats["batches"] += 1
+
+    if not hasattr(clf, "coef_"):
+        raise ValueError("No training rows were provided.")
+
+    metadata["t"] = float(clf.t_)
+    metadata["samples_seen"] = int(metadata.get("samples_seen", 0)) + stats["samples"]
+    stats["progressive_accuracy"] = (
+        stats["correct"] / stats["evaluated"] if stats["evaluated"] else None
+    )
+    return LinearCPTModel.from_classifier(clf, vectorizer, metadata), stats
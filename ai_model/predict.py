@@ -1,16 +1,56 @@
 import pickle
 import pandas as pd
 import os
+import logging
+import threading
+
+from django.conf import settings
+
+from ai_model.linear_model import LINEAR_MODEL_PATH, load_current_model
+
+logger = logging.getLogger(__name__)
 
 # Determine absolute path
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Load Model & Vectorizer
-model = pickle.load(open(os.path.join(BASE_DIR, "cpt_model.pkl"), "rb"))
-vectorizer = pickle.load(open(os.path.join(BASE_DIR, "vectorizer.pkl"), "rb"))
+# Model & Vectorizer, unpickled on first use
+_forest = {}
+_forest_lock = threading.Lock()
+
+
+def load_forest():
+    """(model, vectorizer) of the RandomForest, loaded once."""
+    with _forest_lock:
+        if not _forest:
+            with open(os.path.join(BASE_DIR, "cpt_model.pkl"), "rb") as f:
+                model = pickle.load(f)
+            with open(os.path.join(BASE_DIR, "vectorizer.pkl"), "rb") as f:
+                vectorizer = pickle.load(f)
+            _forest.update(model=model, vectorizer=vectorizer)
+        return _forest["model"], _forest["vectorizer"]
+
+
+def load_linear():
+    """The linear model when CPT_LINEAR_MODEL is on and its artifact loads, else None."""
+    if not getattr(settings, 'CPT_LINEAR_MODEL', False):
+        return None
+    try:
+        return load_current_model(LINEAR_MODEL_PATH)  # picks up retrained artifacts
+    except Exception:
+        logger.exception("Could not load %s, falling back to the RandomForest", LINEAR_MODEL_PATH)
+        return None
+
 
 def predict_cpt(description):
-    """Predict CPT code based on medical description."""
+    """Predict CPT code based on medical description.
+
+    With CPT_LINEAR_MODEL the trained linear artifact is served instead
+    of the RandomForest, as long as it exists and loads.
+    """
+    linear_model = load_linear()
+    if linear_model is not None:
+        return linear_model.predict([description])[0]
+    model, vectorizer = load_forest()
     transformed_desc = vectorizer.transform([description])
     predicted_cpt = model.predict(transformed_desc)
     return predicted_cpt[0]
@@ -1,22 +1,142 @@
-import pandas as pd
-import re
+"""Normalize the text columns of CSV datasets into Parquet.
 
-# Load datasets
-cpt_df = pd.read_csv("dataset/cpt_codes.csv")
-medical_df = pd.read_csv("dataset/medical_reports.csv")
+Text is normalized with the same rules the CPT matcher applies
+(coding/normalization.py), run as Arrow compute kernels over whole
+column chunks. The CSV is streamed in blocks of --block-size bytes, the
+blocks are normalized in --workers processes and written in input
+order, so memory stays flat whatever the file size.
 
-# Preprocessing function
-def clean_text(text):
-    text = str(text).lower()  # Convert to lowercase
-    text = re.sub(r"[^a-z0-9\s]", "", text)  # Remove special characters
-    return text
+    python ai_model/preprocess.py                      # the default datasets
+    python ai_model/preprocess.py dataset/labeled_data.csv --output labeled.parquet
+"""
+import os
+import sys
+import csv
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-# Apply preprocessing
-cpt_df["Description"] = cpt_df["Description"].apply(clean_text)
-medical_df["Report Description"] = medical_df["Report Description"].apply(clean_text)
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 
-# Save preprocessed data
-cpt_df.to_csv("dataset/cpt_codes_clean.csv", index=False)
-medical_df.to_csv("dataset/medical_reports_clean.csv", index=False)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from coding.normalization import normalize_array
 
-print("✅ CPT & Medical Reports preprocessing complete!")
+DEFAULT_INPUTS = (
+    os.path.join("dataset", "cpt_codes.csv"),
+    os.path.join("dataset", "medical_reports.csv"),
+)
+# Columns normalized when none are named
+TEXT_COLUMNS = ("Description", "Report Description", "text")
+FORMATS = ("parquet", "csv")
+BLOCK_SIZE = 8 << 20
+
+
+def read_header(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+
+def iter_csv_batches(path, block_size=BLOCK_SIZE):
+    """Record batches of ``path``, every column read as a string."""
+    header = read_header(path)
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in header}),
+    )
+    for batch in reader:
+        if batch.num_rows:
+            yield batch
+
+
+def clean_batch(batch, columns):
+    """``batch`` with ``columns`` normalized."""
+    arrays = [normalize_array(batch.column(name)) if name in columns else batch.column(name)
+              for name in batch.schema.names]
+    return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+
+def iter_clean_batches(path, columns, workers=1, block_size=BLOCK_SIZE):
+    """Normalized batches of ``path`` in input order, at most 2 blocks per worker in flight."""
+    batches = iter_csv_batches(path, block_size)
+    if workers <= 1:
+        for batch in batches:
+            yield clean_batch(batch, columns)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(clean_batch, batch, columns))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def default_output(path, fmt):
+    return f"{os.path.splitext(path)[0]}_clean.{fmt}"
+
+
+def preprocess(path, output=None, columns=None, workers=None, fmt="parquet", block_size=BLOCK_SIZE):
+    """Write ``path`` with its text columns normalized to ``output``, return the number of rows."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    header = read_header(path)
+    columns = list(columns or [name for name in TEXT_COLUMNS if name in header])
+    missing = [name for name in columns if name not in header]
+    if missing:
+        raise ValueError(f"{path} has no column {', '.join(missing)}")
+    output = output or default_output(path, fmt)
+    workers = workers or os.cpu_count() or 1
+
+    rows = 0
+    writer = None
+    try:
+        for batch in iter_clean_batches(path, columns, workers, block_size):
+            if writer is None:
+                if fmt == "parquet":
+                    writer = pq.ParquetWriter(output, batch.schema, compression="zstd")
+                else:
+                    writer = pa_csv.CSVWriter(output, batch.schema)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        # Header only: still write an empty file with the right columns
+        schema = pa.schema([(name, pa.string()) for name in header])
+        if fmt == "parquet":
+            pq.write_table(schema.empty_table(), output)
+        else:
+            pa_csv.write_csv(schema.empty_table(), output)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Normalize the text columns of CSV datasets.")
+    parser.add_argument("inputs", nargs="*", default=list(DEFAULT_INPUTS))
+    parser.add_argument("--output", help="Output file, only with a single input (default: <input>_clean.<format>)")
+    parser.add_argument("--column", action="append", dest="columns",
+                        help=f"Column to normalize, repeatable (default: any of {', '.join(TEXT_COLUMNS)})")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--workers", type=int, default=0, help="Processes normalizing blocks (default: CPU count)")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Bytes of CSV per block")
+    args = parser.parse_args(argv)
+    if args.output and len(args.inputs) > 1:
+        parser.error("--output needs a single input")
+
+    for path in args.inputs:
+        started = time.perf_counter()
+        output = args.output or default_output(path, args.format)
+        rows = preprocess(path, output, args.columns, args.workers, args.format, args.block_size)
+        elapsed = time.perf_counter() - started
+        print(f"✅ {path}: {rows} rows -> {output} in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import argparse
+import itertools
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, classification_report
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from linear_model import (
+    LINEAR_MODEL_PATH,
+    TEXT_COLUMN,
+    LABEL_COLUMN,
+    collect_classes,
+    iter_csv_chunks,
+    train_linear,
+    train_streaming,
+)
+
+
+DATA_PATH = os.path.join("dataset", "labeled_data.csv")
+
+parser = argparse.ArgumentParser(description="Train the linear hashing CPT model.")
+parser.add_argument("--data", default=DATA_PATH)
+parser.add_argument("--output", default=LINEAR_MODEL_PATH)
+parser.add_argument("--chunksize", type=int, default=0,
+                    help="Stream the CSV in chunks of this many rows with partial_fit (0 = in memory)")
+parser.add_argument("--epochs", type=int, default=5, help="Passes over the CSV in streaming mode")
+args = parser.parse_args()
+
+
+if args.chunksize:
+    # Out-of-core: only one chunk of rows is held in memory at a time
+    classes = collect_classes(args.data)
+    batches = itertools.chain.from_iterable(
+        iter_csv_chunks(args.data, args.chunksize) for _ in range(args.epochs)
+    )
+    model, stats = train_streaming(batches, classes)
+
+    accuracy = stats["progressive_accuracy"]
+    print(f"\n✅ Linear model trained on {stats['samples']} rows in {stats['batches']} chunks "
+          f"({len(classes)} CPT codes).")
+    if accuracy is not None:
+        print(f"📊 Progressive validation accuracy: {accuracy:.2f}")
+else:
+    df = pd.read_csv(args.data)
+
+    if TEXT_COLUMN not in df.columns or LABEL_COLUMN not in df.columns:
+        raise ValueError("CSV must contain 'Report Description' and 'CPT Code' columns.")
+
+    X = df[TEXT_COLUMN].astype(str)
+    y = df[LABEL_COLUMN].astype(str)
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
+
+    model = train_linear(X_train, y_train)
+
+    y_pred = model.predict(list(X_test))
+    accuracy = accuracy_score(y_test, y_pred)
+
+    print(f"\n✅ Linear model trained successfully! Accuracy: {accuracy:.2f}\n")
+    print("📊 Classification Report:\n")
+    print(classification_report(y_test, y_pred, zero_division=0))
+
+    # Refit on every labeled row before exporting
+    model = train_linear(X, y)
+
+model.save(args.output)
+
+print(f"\n💾 Linear model saved to: {args.output}")
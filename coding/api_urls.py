@@ -1,8 +1,31 @@
 from django.urls import path
-from .views import predict_cpt_from_image, predict_cpt_from_text
+from .views import (
+    predict_cpt_from_image,
+    predict_cpt_from_image_stream,
+    predict_cpt_from_text,
+    predict_cpt_from_image_async,
+    predict_cpt_from_text_async,
+    export_reports,
+    search_code_catalogue,
+    readiness_check,
+    metrics_snapshot,
+    memory_report,
+    profile_list,
+    profile_detail,
+)
 
 urlpatterns = [
     path('predict/image/', predict_cpt_from_image, name='predict_cpt_image'),
+    path('predict/image/stream/', predict_cpt_from_image_stream, name='predict_cpt_image_stream'),
     path('predict/text/', predict_cpt_from_text, name='predict_cpt_text'),
     path('predict/', predict_cpt_from_text, name='predict_cpt_fallback'),  # ✅ changed this
+    path('predict/image/async/', predict_cpt_from_image_async, name='predict_cpt_image_async'),
+    path('predict/text/async/', predict_cpt_from_text_async, name='predict_cpt_text_async'),
+    path('reports/export/', export_reports, name='export_reports'),
+    path('codes/search/', search_code_catalogue, name='search_codes'),
+    path('health/ready/', readiness_check, name='readiness'),
+    path('health/metrics/', metrics_snapshot, name='metrics'),
+    path('health/memory/', memory_report, name='memory'),
+    path('profiles/', profile_list, name='profiles'),
+    path('profiles/<str:profile_id>/', profile_detail, name='profile_detail'),
 ]
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CodingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'coding'
+
+    def ready(self):
+        if getattr(settings, 'WARMUP_ON_READY', False):
+            from .warmup import run_warmup
+
+            run_warmup()
@@ -0,0 +1,128 @@
+"""CPT / ICD-10 catalogue held in the database.
+
+load_catalogue() bulk-imports a ``{description: code}`` mapping into
+CodeDescription (every description) and CPTCode/ICD10Code (one row per
+code). Search goes through the FTS5 table created by migration 0002 on
+SQLite, or a pg_trgm similarity query on PostgreSQL. Other backends get
+a plain ``icontains`` filter.
+
+search_codes() is the typeahead query: every word must match and the
+last one is a prefix. catalogue_candidates() is the matcher query: any
+word may match and rows are ranked by bm25, so the fuzzy scorers only
+see the best few hundred rows instead of the whole mapping.
+"""
+import re
+import time
+import logging
+
+from django.db import connection, transaction
+
+from .models import CodeDescription, CPTCode, ICD10Code
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'coding_codedescription_fts'
+CODE_MODELS = {'cpt': CPTCode, 'icd': ICD10Code}
+WORD = re.compile(r"\w+", re.UNICODE)
+
+# How long a process trusts its "is the catalogue loaded" answer
+LOADED_CHECK_TTL = 60
+
+_loaded = {}
+
+
+def load_catalogue(kind, mapping, preprocess, batch_size=2000):
+    """Replace the ``kind`` catalogue with ``mapping``, return (descriptions, codes) added."""
+    code_model = CODE_MODELS[kind]
+    rows = [
+        CodeDescription(kind=kind, code=str(code).strip(), description=key, normalized=preprocess(key))
+        for key, code in mapping.items()
+    ]
+    first_description = {}
+    for row in rows:
+        first_description.setdefault(row.code, row.description)
+
+    with transaction.atomic():
+        CodeDescription.objects.filter(kind=kind).delete()
+        CodeDescription.objects.bulk_create(rows, batch_size=batch_size)
+        existing = set(code_model.objects.values_list('code', flat=True))
+        created = code_model.objects.bulk_create(
+            [code_model(code=code, description=description)
+             for code, description in first_description.items() if code not in existing],
+            batch_size=batch_size,
+        )
+    _loaded.pop(kind, None)
+    return len(rows), len(created)
+
+
+def catalogue_loaded(kind):
+    """True when the ``kind`` catalogue has rows, cached for LOADED_CHECK_TTL seconds."""
+    cached = _loaded.get(kind)
+    now = time.monotonic()
+    if cached and now - cached[0] < LOADED_CHECK_TTL:
+        return cached[1]
+    try:
+        loaded = CodeDescription.objects.filter(kind=kind).exists()
+    except Exception as e:
+        logger.warning(f"Code catalogue unavailable: {e}")
+        loaded = False
+    _loaded[kind] = (now, loaded)
+    return loaded
+
+
+def _fts_match(words, match_all):
+    """FTS5 MATCH expression from plain words, quoted so no word is read as syntax."""
+    terms = [f'"{w}"' for w in words]
+    if match_all:
+        terms[-1] += "*"
+        return " AND ".join(terms)
+    return " OR ".join(terms)
+
+
+def _query(text, kind, limit, match_all):
+    """Return [(id, kind, code, description, normalized)] best first."""
+    words = WORD.findall(text.lower())
+    if not words:
+        return []
+
+    if connection.vendor == 'sqlite':
+        sql = (
+            f"SELECT c.id, c.kind, c.code, c.description, c.normalized "
+            f"FROM {FTS_TABLE} f JOIN coding_codedescription c ON c.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s" + (" AND c.kind = %s" if kind else "") +
+            f" ORDER BY bm25({FTS_TABLE}) LIMIT %s"
+        )
+        params = [_fts_match(words, match_all), *([kind] if kind else []), limit]
+    elif connection.vendor == 'postgresql':
+        sql = (
+            "SELECT id, kind, code, description, normalized FROM coding_codedescription "
+            "WHERE normalized %% %s" + (" AND kind = %s" if kind else "") +
+            " ORDER BY similarity(normalized, %s) DESC LIMIT %s"
+        )
+        query = " ".join(words)
+        params = [query, *([kind] if kind else []), query, limit]
+    else:
+        queryset = CodeDescription.objects.all()
+        if kind:
+            queryset = queryset.filter(kind=kind)
+        for word in words:
+            queryset = queryset.filter(normalized__icontains=word)
+        return list(queryset.values_list('id', 'kind', 'code', 'description', 'normalized')[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search_codes(text, kind=None, limit=20):
+    """Typeahead search, returns dicts with kind, code and description."""
+    return [
+        {"kind": row_kind, "code": code, "description": description}
+        for _, row_kind, code, description, _ in _query(text, kind, limit, match_all=True)
+    ]
+
+
+def catalogue_candidates(kind, text, limit=200):
+    """Best ``limit`` (original key, code, normalized key) rows sharing a word with ``text``."""
+    return [(description, code, normalized)
+            for _, _, code, description, normalized in _query(text, kind, limit, match_all=False)]
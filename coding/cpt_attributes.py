@@ -0,0 +1,173 @@
+"""Structured attributes of CPT descriptions.
+
+Every normalized CPT key is parsed once into modality, body part,
+laterality, number of views and contrast, and the entries are indexed by
+(modality, body part) and by (modality, body token). match_cpt_code
+parses its input the same way and narrows the catalogue with dictionary
+lookups before any fuzzy scoring. Tokens are compared whole, so "us"
+no longer matches inside "thus".
+"""
+import itertools
+import re
+import threading
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+# Modality tokens as they appear after normalize(), mapped to one name. Every
+# token is searched, except in guidance phrases: "puncture with fl or ct guidance" has none.
+MODALITIES = {
+    'xr': 'xr', 'xrm': 'xrm', 'ct': 'ct', 'cta': 'cta', 'mri': 'mri', 'mr': 'mri', 'mra': 'mra',
+    'mrv': 'mrv', 'us': 'us', 'nm': 'nm', 'pet': 'pet', 'fl': 'fl', 'dxa': 'dxa', 'ivc': 'ivc',
+}
+GUIDANCE_PATTERN = re.compile(r"\bwith\b.*?\bguidance\b")
+LATERALITY = {'rt': 'right', 'right': 'right', 'lt': 'left', 'left': 'left',
+              'bilat': 'bilateral', 'bilateral': 'bilateral'}
+
+# Words that end the body part: contrast, laterality and view descriptors
+BODY_STOP_WORDS = frozenset({
+    'w', 'wo', 'with', 'without', 'contrast', 'noncontrast', 'views', 'view', 'limited', 'ltd', 'comp',
+    'min', 'andor', 'or',
+}) | frozenset(LATERALITY)
+
+# normalize() turns "w/o" into "without" even inside words ("w/out" -> "withoutut"),
+# the patterns accept the mangled forms the keys end up with
+CONTRAST_PATTERNS = (
+    ('with_and_without', re.compile(r"\b(?:with and without|w ?w ?(?:o|out|ithout(?:ut)?)|wwo)\b(?: contrast)?")),
+    ('without', re.compile(r"\b(?:without(?:ut)?|wo|non ?contrast)\b(?: contrast)?")),
+    ('with', re.compile(r"\bw(?:ith)? contrast\b")),
+)
+VIEWS_PATTERN = re.compile(r"\b(\d+)\s*views?\b")
+
+# Score adjustments for the exact features, added to the fuzzy score
+FEATURE_MATCH_BONUS = 10
+FEATURE_MISMATCH_PENALTY = 15
+
+
+class CPTAttributes(NamedTuple):
+    modality: str
+    body_tokens: Tuple[str, ...]
+    laterality: Optional[str]
+    views: Optional[int]
+    contrast: Optional[str]
+    contrast_text: str = ""
+
+    @property
+    def body_part(self):
+        return " ".join(self.body_tokens)
+
+
+@lru_cache(maxsize=65536)
+def parse_cpt_attributes(norm_text):
+    """Attributes of a normalize()d CPT description or exam text.
+
+    The body part follows the modality ("xr lt knee"), or precedes it
+    when nothing follows ("lt knee xr").
+    """
+    tokens = norm_text.split()
+    searched = GUIDANCE_PATTERN.sub(" ", norm_text).split()
+    modality, at = "", 0
+    for i, token in enumerate(searched):
+        if token in MODALITIES:
+            modality, at = MODALITIES[token], i
+            break
+
+    body = _body_tokens(searched[at + 1:]) if modality else []
+    if modality and not body:
+        body = _body_tokens(searched[:at])
+
+    laterality = next((LATERALITY[t] for t in tokens if t in LATERALITY), None)
+    views_match = VIEWS_PATTERN.search(norm_text)
+    contrast, contrast_text = None, ""
+    for name, pattern in CONTRAST_PATTERNS:
+        match = pattern.search(norm_text)
+        if match:
+            contrast, contrast_text = name, match.group(0)
+            break
+    return CPTAttributes(modality, tuple(body), laterality, int(views_match.group(1)) if views_match else None,
+                         contrast, contrast_text)
+
+
+def _body_tokens(tokens):
+    """The body part at the start of ``tokens``, after any laterality."""
+    body = []
+    for token in itertools.dropwhile(LATERALITY.__contains__, tokens):
+        if token in BODY_STOP_WORDS or token[0].isdigit():
+            break
+        body.append(token)
+    return body
+
+
+def feature_score(query, key):
+    """Bonus/penalty for laterality, views and contrast given by the query.
+
+    A key that does not state a feature is neither rewarded nor penalized,
+    most CPT descriptions carry no laterality.
+    """
+    score = 0
+    for field in ('laterality', 'views', 'contrast'):
+        wanted, offered = getattr(query, field), getattr(key, field)
+        if wanted is None or offered is None:
+            continue
+        score += FEATURE_MATCH_BONUS if wanted == offered else -FEATURE_MISMATCH_PENALTY
+    return score
+
+
+class CPTAttributeIndex:
+    """Entries of a MappingStore keyed by (modality, body part) and (modality, body token)."""
+
+    def __init__(self, store):
+        self.attributes = [parse_cpt_attributes(store.norm_key(i)) for i in range(len(store))]
+        self.by_body = {}
+        self.by_token = {}
+        self.by_modality = {}
+        for i, attrs in enumerate(self.attributes):
+            if not attrs.modality:
+                continue
+            self.by_modality.setdefault(attrs.modality, []).append(i)
+            self.by_body.setdefault((attrs.modality, attrs.body_part), []).append(i)
+            for token in set(attrs.body_tokens):
+                self.by_token.setdefault((attrs.modality, token), set()).add(i)
+
+    def candidates(self, query):
+        """Entry ids for the query's modality, narrowed as far as its body part allows."""
+        if not query.modality:
+            return []
+        if not query.body_tokens:
+            return self.by_modality.get(query.modality, [])
+        exact = self.by_body.get((query.modality, query.body_part))
+        if exact:
+            return exact
+        postings = [self._postings(query.modality, t) for t in query.body_tokens]
+        both = set.intersection(*postings)
+        if both:
+            return sorted(both)
+        return sorted(set().union(*postings))
+
+    def _postings(self, modality, token):
+        """Entries whose body has ``token``, or a word starting with it (OCR-truncated input)."""
+        exact = self.by_token.get((modality, token))
+        if exact or len(token) < 2:
+            return exact or set()
+        matched = set()
+        for (key_modality, key_token), ids in self.by_token.items():
+            if key_modality == modality and key_token.startswith(token):
+                matched |= ids
+        return matched
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_cpt_attribute_index(store):
+    """Attribute index for ``store``, built once per store object."""
+    cached = _indexes.get('cpt')
+    if cached and cached[0] is store:
+        return cached[1]
+    with _indexes_lock:
+        cached = _indexes.get('cpt')
+        if cached and cached[0] is store:
+            return cached[1]
+        index = CPTAttributeIndex(store)
+        _indexes['cpt'] = (store, index)
+        return index
@@ -0,0 +1,136 @@
+"""Per-request latency budgets.
+
+A predict request gets a deadline from its ``deadline_ms`` parameter
+(query string or body), capped at REQUEST_DEADLINE_MAX_MS, or
+REQUEST_DEADLINE_MS when it sends none. The deadline follows the
+request through the lanes (coding.executors), into OCR threads and
+processes, and every stage checks the budget left before it picks a
+strategy:
+
+* tesseract runs with the remaining budget as its timeout, the OCR
+  retry is skipped with less than DEADLINE_OCR_RETRY_MS left, and PDF
+  pages stop once the deadline has passed;
+* the full-mapping fuzzy scans of CPT and ICD-10 matching run only with
+  DEADLINE_FUZZY_MS left, otherwise matching keeps to index candidates
+  and stops early with the best match so far.
+
+Each shortcut is recorded as a degraded stage and the response is
+marked ``degraded`` with the list. A request out of time gets the
+partial result, never an error.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DEFAULT_MS = getattr(settings, 'REQUEST_DEADLINE_MS', 60000)
+MAX_MS = getattr(settings, 'REQUEST_DEADLINE_MAX_MS', 110000)
+OCR_RETRY_MS = getattr(settings, 'DEADLINE_OCR_RETRY_MS', 5000)
+FUZZY_MS = getattr(settings, 'DEADLINE_FUZZY_MS', 1000)
+PARAMETER = 'deadline_ms'
+
+_current = ContextVar('coding_request_deadline', default=None)
+
+
+class Deadline:
+    """When a request's budget runs out, and which stages cut corners to meet it."""
+
+    def __init__(self, expires_at, degraded=()):
+        # Wall clock time, comparable in the OCR processes
+        self.expires_at = expires_at
+        self.degraded = list(degraded)
+
+    def remaining(self):
+        """Seconds left, negative once the deadline has passed."""
+        return self.expires_at - time.time()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def degrade(self, *stages):
+        for name in stages:
+            if name not in self.degraded:
+                self.degraded.append(name)
+
+
+def from_request(request, data=None, started=None):
+    """The Deadline of a request: its ``deadline_ms`` parameter, or the server default.
+
+    The query string wins over ``data`` (the parsed body). The budget
+    counts from ``started``, the time the view was entered, so the
+    upload is part of it. An invalid or out of range value falls back to
+    the default or is clamped, a budget is never refused.
+    """
+    value = request.GET.get(PARAMETER)
+    if value is None and data is not None:
+        value = data.get(PARAMETER)
+    try:
+        ms = float(value) if value not in (None, '') else DEFAULT_MS
+    except (TypeError, ValueError):
+        ms = DEFAULT_MS
+    if ms != ms:  # NaN
+        ms = DEFAULT_MS
+    return Deadline((started or time.time()) + min(max(ms, 0), MAX_MS) / 1000)
+
+
+def current():
+    """The Deadline of the request being handled, or None."""
+    return _current.get()
+
+
+@contextmanager
+def scope(deadline):
+    """Make ``deadline`` current in the enclosed block."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def remaining():
+    """Seconds left for the current request, None without a deadline."""
+    deadline = _current.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def allows(ms):
+    """Whether the current request has at least ``ms`` milliseconds left (always without a deadline)."""
+    deadline = _current.get()
+    return deadline is None or deadline.remaining() * 1000 >= ms
+
+
+def expired():
+    deadline = _current.get()
+    return deadline is not None and deadline.expired()
+
+
+def degrade(*stages):
+    """Record that ``stages`` took a cheaper path to meet the current request's deadline."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.degrade(*stages)
+
+
+def degraded():
+    """Stages degraded so far for the current request."""
+    deadline = _current.get()
+    return list(deadline.degraded) if deadline is not None else []
+
+
+def bounded(items, stage, every=256):
+    """Iterate ``items`` until the current request's deadline passes, then record ``stage`` as degraded.
+
+    The clock is read every ``every`` items, a scoring loop stops with
+    the best match found so far.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        yield from items
+        return
+    for index, item in enumerate(items):
+        if index % every == 0 and deadline.expired():
+            deadline.degrade(stage)
+            return
+        yield item
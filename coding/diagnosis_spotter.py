@@ -0,0 +1,190 @@
+"""Multi-term diagnosis spotting over report text.
+
+The cleaned ICD-10 descriptions (and the head of each one, the part
+before the first comma) plus the synonyms in scripts/icd10_synonyms.json
+are compiled into one word-level Aho-Corasick automaton. A report section
+is then scanned once, token by token, and every diagnosis phrase it
+contains comes back as a Span with character offsets into the original
+text, however long the section is and whether or not it is punctuated.
+Overlapping hits are resolved leftmost-longest.
+"""
+import os
+import re
+import json
+import logging
+import threading
+from collections import deque
+from typing import NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SYNONYMS_FILE = getattr(settings, 'ICD_SYNONYMS_FILE',
+                        os.path.join(settings.BASE_DIR, 'scripts', 'icd10_synonyms.json'))
+
+TOKEN = re.compile(r"[a-z0-9]+", re.IGNORECASE)
+
+# Mapping phrases shorter than this, or longer than this many words, are not spotted
+MIN_PATTERN_CHARS = 4
+MAX_PATTERN_WORDS = 8
+
+# Phrases made only of these words ("other specified disorders") name no diagnosis
+GENERIC_WORDS = frozenset({
+    'other', 'others', 'unspecified', 'specified', 'encounter', 'initial', 'subsequent', 'sequela',
+    'history', 'personal', 'family', 'disease', 'diseases', 'disorder', 'disorders', 'condition',
+    'conditions', 'injury', 'site', 'type', 'part', 'of', 'and', 'or', 'the', 'in', 'with', 'to',
+})
+
+
+def tokenize(text):
+    """[(start, end, lowercased word)] of ``text``, offsets into ``text`` itself."""
+    return [(m.start(), m.end(), m.group(0).lower()) for m in TOKEN.finditer(text)]
+
+
+class Span(NamedTuple):
+    start: int
+    end: int
+    text: str
+    term: str
+
+    def as_dict(self):
+        return self._asdict()
+
+
+class DiagnosisSpotter:
+    """Aho-Corasick automaton whose alphabet is words, not characters."""
+
+    def __init__(self, patterns=()):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.terms = {}
+        for phrase, term in patterns:
+            self.add(phrase, term)
+        self._link()
+
+    def __len__(self):
+        return len(self.terms)
+
+    def add(self, phrase, term):
+        """Add ``phrase``, reported as ``term``, the first term for a phrase wins."""
+        words = tuple(TOKEN.findall(phrase.lower()))
+        if not words or words in self.terms:
+            return
+        self.terms[words] = term
+        node = 0
+        for word in words:
+            nxt = self.goto[node].get(word)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][word] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((len(words), term))
+
+    def _link(self):
+        """Breadth-first failure links, each node also reports its suffixes' outputs."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and word not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(word, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def matches(self, text, tokens=None):
+        """Every (start, end, term) hit in ``text``, overlapping ones included."""
+        tokens = tokenize(text) if tokens is None else tokens
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, (_, end, word) in enumerate(tokens):
+            while node and word not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(word, 0)
+            for length, term in out[node]:
+                yield tokens[i - length + 1][0], end, term
+
+    def spot(self, text, tokens=None):
+        """Non-overlapping spans, the leftmost then longest hit wins.
+
+        ``tokens`` is tokenize(text), for callers that scan the same text
+        with several automata.
+        """
+        if not text:
+            return []
+        spans, last_end = [], -1
+        for start, end, term in sorted(self.matches(text, tokens), key=lambda m: (m[0], -m[1])):
+            if start >= last_end:
+                spans.append(Span(start, end, text[start:end], term))
+                last_end = end
+        return spans
+
+
+def load_synonyms(path=None):
+    """``{phrase: canonical phrase}`` from the synonyms file, empty when it is missing."""
+    path = path or SYNONYMS_FILE
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to load diagnosis synonyms {path}: {e}")
+        return {}
+
+
+def mapping_patterns(store):
+    """(phrase, term) pairs for every cleaned ICD-10 description and its head."""
+    for i in range(len(store)):
+        norm = store.norm_key(i)
+        for phrase in (norm.split(",", 1)[0], norm):
+            phrase = " ".join(TOKEN.findall(phrase))
+            words = phrase.split()
+            if len(phrase) < MIN_PATTERN_CHARS or len(words) > MAX_PATTERN_WORDS:
+                continue
+            if GENERIC_WORDS.issuperset(words):
+                continue
+            yield phrase, phrase
+
+
+def build_diagnosis_spotter(store=None, synonyms=None, preprocess=None):
+    """Spotter over ``synonyms`` (canonical phrases run through ``preprocess``) and ``store``."""
+    preprocess = preprocess or str.lower
+
+    def patterns():
+        for phrase, canonical in (synonyms or {}).items():
+            yield phrase, " ".join(TOKEN.findall(preprocess(canonical).lower())) or canonical
+        if store is not None:
+            yield from mapping_patterns(store)
+
+    return DiagnosisSpotter(patterns())
+
+
+_spotters = {}
+_spotters_lock = threading.Lock()
+
+
+def get_diagnosis_spotter(store=None, preprocess=None):
+    """Spotter for the ICD-10 ``store``, rebuilt when the store or synonyms file changes."""
+    try:
+        synonyms_mtime = os.stat(SYNONYMS_FILE).st_mtime_ns
+    except OSError:
+        synonyms_mtime = None
+
+    cached = _spotters.get('icd')
+    if cached and cached[0] is store and cached[1] == synonyms_mtime:
+        return cached[2]
+    with _spotters_lock:
+        cached = _spotters.get('icd')
+        if cached and cached[0] is store and cached[1] == synonyms_mtime:
+            return cached[2]
+        spotter = build_diagnosis_spotter(store, load_synonyms(), preprocess)
+        logger.info(f"Diagnosis spotter built with {len(spotter)} phrases")
+        _spotters['icd'] = (store, synonyms_mtime, spotter)
+        return spotter
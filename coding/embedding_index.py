@@ -0,0 +1,306 @@
+"""Dense embedding index over the CPT/ICD mapping keys.
+
+The offline build embeds every mapping key, stores the vectors as a
+float16 or int8 ``.npy`` matrix that is memory-mapped at query time, and
+partitions them with an IVF (inverted file) index: k-means centroids plus
+one posting list per centroid. A query only scores the rows of the
+``nprobe`` closest lists.
+
+Two encoders are supported:
+
+* ``tfidf`` (default): character n-gram TF-IDF reduced with TruncatedSVD,
+  needs only scikit-learn. Good for spelling and OCR variants.
+* any sentence-transformers model name, when that package is installed.
+  Those vectors are semantic (synonyms such as "cephalgia"/"headache"),
+  so the index is flagged ``semantic`` and matchers may trust its scores.
+
+A build writes into a temporary directory next to the live one and swaps
+it in whole, workers that still map the old files keep reading them. The
+manifest records the sha256 of the source mapping JSON, an index built
+from another version of the mapping is not served.
+"""
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .mapping_store import MAPPING_FILES, source_digest
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_ROOT = os.path.join(settings.BASE_DIR, 'scripts', 'embeddings')
+
+# Below this many keys a single flat list is faster than probing centroids
+MIN_KEYS_FOR_IVF = 2000
+
+
+class TfidfSvdEncoder:
+    """Character n-gram TF-IDF followed by LSA, L2-normalized."""
+
+    semantic = False
+
+    def __init__(self, dims=128):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.decomposition import TruncatedSVD
+
+        self.vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 5), sublinear_tf=True)
+        self.svd = TruncatedSVD(n_components=dims, random_state=42)
+
+    def fit(self, texts):
+        X = self.vectorizer.fit_transform(texts)
+        self.svd.n_components = max(1, min(self.svd.n_components, X.shape[1] - 1, X.shape[0] - 1))
+        self.svd.fit(X)
+        return self
+
+    def encode(self, texts):
+        return _l2_normalize(self.svd.transform(self.vectorizer.transform(texts)))
+
+    def save(self, path):
+        import joblib
+
+        joblib.dump({'vectorizer': self.vectorizer, 'svd': self.svd}, path)
+
+    @classmethod
+    def load(cls, path):
+        import joblib
+
+        encoder = cls.__new__(cls)
+        state = joblib.load(path)
+        encoder.vectorizer, encoder.svd = state['vectorizer'], state['svd']
+        return encoder
+
+
+class SentenceTransformerEncoder:
+    """Pretrained sentence embedding model, loaded by name."""
+
+    semantic = True
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device='cpu')
+
+    def fit(self, texts):
+        return self
+
+    def encode(self, texts):
+        return _l2_normalize(self.model.encode(list(texts), batch_size=64, show_progress_bar=False))
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'model_name': self.model_name}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f)['model_name'])
+
+
+def _l2_normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _quantize(vectors, dtype):
+    """Return (stored matrix, per-dimension scale or None)."""
+    if dtype == 'float16':
+        return vectors.astype(np.float16), None
+    if dtype == 'int8':
+        scale = np.abs(vectors).max(axis=0)
+        scale[scale == 0] = 1.0
+        scale = (scale / 127.0).astype(np.float32)
+        return np.round(vectors / scale).astype(np.int8), scale
+    raise ValueError(f"Unsupported dtype: {dtype}")
+
+
+def build_embedding_index(mapping, out_dir, preprocess=None, encoder='tfidf', dims=128,
+                          dtype='float16', n_lists=None, source_sha256=None):
+    """Embed every key of ``mapping`` ({description: code}) and replace the index in ``out_dir``.
+
+    ``source_sha256`` is the hex digest of the mapping file the index is
+    built from, get_embedding_index() only serves a matching index.
+    """
+    keys = list(mapping.keys())
+    codes = [str(mapping[k]).strip() for k in keys]
+    texts = [preprocess(k) if preprocess else k.lower() for k in keys]
+    if not keys:
+        raise ValueError("Mapping is empty, nothing to index.")
+
+    if encoder == 'tfidf':
+        model = TfidfSvdEncoder(dims).fit(texts)
+        encoder_file = 'encoder.joblib'
+    else:
+        model = SentenceTransformerEncoder(encoder)
+        encoder_file = 'encoder.json'
+    vectors = model.encode(texts)
+
+    if n_lists is None:
+        n_lists = 1 if len(keys) < MIN_KEYS_FOR_IVF else int(np.sqrt(len(keys)))
+    n_lists = max(1, min(n_lists, len(keys)))
+    if n_lists > 1:
+        from sklearn.cluster import MiniBatchKMeans
+
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=42, n_init=3).fit(vectors)
+        centroids = _l2_normalize(kmeans.cluster_centers_)
+        assignments = kmeans.labels_
+    else:
+        centroids = np.zeros((1, vectors.shape[1]), dtype=np.float32)
+        assignments = np.zeros(len(keys), dtype=np.int64)
+
+    # Posting lists stored CSR-style: ids sorted by list, offsets per list
+    order = np.argsort(assignments, kind='stable')
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=n_lists), out=offsets[1:])
+
+    stored, scale = _quantize(vectors, dtype)
+
+    out_dir = os.path.abspath(out_dir)
+    parent, name = os.path.split(out_dir)
+    os.makedirs(parent, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=parent, prefix=f".{name}.")
+    try:
+        np.save(os.path.join(build_dir, 'vectors.npy'), stored)
+        np.save(os.path.join(build_dir, 'centroids.npy'), centroids.astype(np.float32))
+        np.save(os.path.join(build_dir, 'list_ids.npy'), order.astype(np.int32))
+        np.save(os.path.join(build_dir, 'list_offsets.npy'), offsets)
+        if scale is not None:
+            np.save(os.path.join(build_dir, 'scale.npy'), scale)
+        model.save(os.path.join(build_dir, encoder_file))
+        with open(os.path.join(build_dir, 'keys.json'), 'w', encoding='utf-8') as f:
+            json.dump({'keys': keys, 'codes': codes}, f, ensure_ascii=False)
+
+        manifest = {
+            'version': INDEX_VERSION,
+            'encoder': encoder,
+            'encoder_file': encoder_file,
+            'semantic': model.semantic,
+            'dims': int(vectors.shape[1]),
+            'dtype': dtype,
+            'count': len(keys),
+            'n_lists': n_lists,
+            'source_sha256': source_sha256,
+        }
+        # Written last: a directory without a manifest is never loaded
+        with open(os.path.join(build_dir, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=4)
+        os.chmod(build_dir, 0o755)
+        _swap_in(build_dir, out_dir)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    return manifest
+
+
+def _swap_in(build_dir, out_dir):
+    """Move ``build_dir`` to ``out_dir``, replacing the index there.
+
+    The old files are unlinked, never rewritten, so workers that have them
+    memory-mapped keep a consistent view until they reload.
+    """
+    if not os.path.exists(out_dir):
+        os.rename(build_dir, out_dir)
+        return
+    parent, name = os.path.split(out_dir)
+    old_dir = tempfile.mkdtemp(dir=parent, prefix=f".{name}.old.")
+    os.rename(out_dir, os.path.join(old_dir, name))
+    os.rename(build_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class EmbeddingIndex:
+    """Read-only view of a built index, vectors are memory-mapped."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'index.json'), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported embedding index version in {path}")
+
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        self.centroids = np.load(os.path.join(path, 'centroids.npy'))
+        self.list_ids = np.load(os.path.join(path, 'list_ids.npy'), mmap_mode='r')
+        self.list_offsets = np.load(os.path.join(path, 'list_offsets.npy'))
+        scale_path = os.path.join(path, 'scale.npy')
+        self.scale = np.load(scale_path) if os.path.exists(scale_path) else None
+        with open(os.path.join(path, 'keys.json'), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.keys, self.codes = data['keys'], data['codes']
+
+        encoder_cls = TfidfSvdEncoder if self.manifest['encoder'] == 'tfidf' else SentenceTransformerEncoder
+        self.encoder = encoder_cls.load(os.path.join(path, self.manifest['encoder_file']))
+        self.semantic = bool(self.manifest.get('semantic'))
+
+    def _rows(self, ids):
+        rows = np.asarray(self.vectors[ids], dtype=np.float32)
+        return rows * self.scale if self.scale is not None else rows
+
+    def search(self, text, k=20, nprobe=4):
+        """Return up to k (key, code, cosine similarity) tuples, best first."""
+        if not text:
+            return []
+        query = self.encoder.encode([text])[0]
+
+        n_lists = len(self.list_offsets) - 1
+        if n_lists > 1:
+            probe = np.argsort(-(self.centroids @ query))[:nprobe]
+            ids = np.concatenate([
+                self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probe
+            ])
+        else:
+            ids = np.asarray(self.list_ids)
+        if not len(ids):
+            return []
+
+        ids = np.sort(ids)  # sequential reads from the memory map
+        scores = self._rows(ids) @ query
+        top = np.argsort(-scores)[:k]
+        return [(self.keys[ids[i]], self.codes[ids[i]], float(scores[i])) for i in top]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _mapping_digest(kind):
+    with open(MAPPING_FILES[kind], 'rb') as f:
+        return source_digest(f.read()).hex()
+
+
+def get_embedding_index(kind):
+    """Cached index for 'cpt' or 'icd', or None when it has not been built or is stale.
+
+    An index whose manifest does not carry the sha256 of the current
+    mapping JSON was built from other keys and is not served.
+    """
+    path = os.path.join(INDEX_ROOT, kind)
+    manifest = os.path.join(path, 'index.json')
+    try:
+        st = os.stat(MAPPING_FILES[kind])
+        key = (os.stat(manifest).st_mtime_ns, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+    cached = _indexes.get(kind)
+    if cached and cached[0] == key:
+        return cached[1]
+    with _indexes_lock:
+        try:
+            index = EmbeddingIndex(path)
+            if index.manifest.get('source_sha256') != _mapping_digest(kind):
+                logger.warning(f"The {kind} embedding index was built from another mapping, "
+                               f"rebuild it with build_embedding_index")
+                index = None
+        except Exception as e:
+            logger.error(f"Failed to load {kind} embedding index: {e}")
+            index = None
+        _indexes[kind] = (key, index)
+    return index
@@ -0,0 +1,228 @@
+"""Scheduling lanes for report work.
+
+Two lanes keep slow OCR from starving cheap text coding:
+
+* the OCR lane is a process pool of OCR_MAX_WORKERS processes, started
+  at OCR_NICE so the CPU goes to request threads first, with room for
+  OCR_MAX_QUEUE waiting jobs;
+* the text lane is a thread pool of MATCH_MAX_WORKERS threads reserved
+  for field extraction and code matching, with room for TEXT_MAX_QUEUE
+  waiting jobs.
+
+Admission control caps each lane's running plus queued jobs. A job that
+finds its lane full is refused at once (the views answer 429) instead of
+holding a request thread. Each lane reports its in-flight and queued
+jobs as gauges, and how long jobs waited and ran as timings, through
+coding.metrics. A job runs under the deadline of the request that
+submitted it (coding.deadlines), and the stages it degraded are added
+back to that request's deadline.
+"""
+import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import deadlines, memtrack, metrics, profiling
+
+OCR_MAX_WORKERS = getattr(settings, 'OCR_MAX_WORKERS', None) or os.cpu_count() or 1
+OCR_MAX_QUEUE = getattr(settings, 'OCR_MAX_QUEUE', OCR_MAX_WORKERS * 4)
+OCR_NICE = getattr(settings, 'OCR_NICE', 10)
+MATCH_MAX_WORKERS = getattr(settings, 'MATCH_MAX_WORKERS', 8)
+TEXT_MAX_QUEUE = getattr(settings, 'TEXT_MAX_QUEUE', MATCH_MAX_WORKERS * 8)
+
+
+class LaneFull(Exception):
+    """Raised when a lane already holds its maximum number of jobs."""
+
+    def __init__(self, lane):
+        super().__init__(f"{lane} lane is full")
+        self.lane = lane
+
+
+class OCRQueueFull(LaneFull):
+    """Raised when the OCR lane already holds its maximum number of jobs."""
+
+
+class Admission:
+    """Counting gate: at most `limit` jobs in flight, never blocks."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+def _init_ocr_worker(settings_module, nice=OCR_NICE):
+    """Make Django settings available in spawned OCR processes."""
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _timed_call(func, args, profiled=False, measured=False, expires_at=None):
+    """Run in the worker: (start time, end time, result, cProfile stats, memory record, degraded stages).
+
+    The times let the lane tell wait from run time. The stats are only
+    collected for a profiled request, the memory record only for a
+    lane that tracks memory. With ``expires_at`` the job runs under
+    that deadline and reports the stages it degraded to meet it.
+    """
+    started = time.time()
+    call, call_args = func, args
+    if measured:
+        call, call_args = memtrack.measure, (func.__name__, func, *args)
+    deadline = deadlines.Deadline(expires_at) if expires_at is not None else None
+    with deadlines.scope(deadline):
+        if profiled:
+            result, stats = profiling.profile_call(call, *call_args)
+        else:
+            result, stats = call(*call_args), None
+    memory = None
+    if measured:
+        result, memory = result
+    return started, time.time(), result, stats, memory, deadline.degraded if deadline else []
+
+
+class Lane:
+    """A bounded executor with its own admission, queue-depth gauge and timings."""
+
+    def __init__(self, name, make_executor, workers, max_queue, full_error=LaneFull, track_memory=False):
+        self.name = name
+        self.workers = workers
+        self.track_memory = track_memory
+        self.admission = Admission(workers + max_queue)
+        self.full_error = full_error
+        self._make_executor = make_executor
+        self._executor = None
+        self._lock = threading.Lock()
+        self.gauges = (f"lane.{name}.in_flight", f"lane.{name}.queued")
+        metrics.register_gauge(self.gauges[0], lambda: self.admission.in_flight)
+        metrics.register_gauge(self.gauges[1], lambda: max(self.admission.in_flight - self.workers, 0))
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._make_executor()
+            return self._executor
+
+    @contextmanager
+    def slot(self):
+        """Reserve room for one job, raise ``full_error`` when there is none."""
+        if not self.admission.try_acquire():
+            metrics.incr(f"lane.{self.name}.rejected")
+            raise self.full_error(self.name)
+        try:
+            yield
+        finally:
+            self.admission.release()
+
+    def submit(self, func, *args):
+        """Submit `func(*args)` and return a future of its result, call inside slot()."""
+        submitted = time.time()
+        profile = profiling.current()
+        deadline = deadlines.current()
+        result = Future()
+
+        def settle(done):
+            try:
+                started, finished, value, stats, memory, degraded = done.result()
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            metrics.observe(f"lane.{self.name}.wait_ms", max(started - submitted, 0) * 1000)
+            metrics.observe(f"lane.{self.name}.run_ms", (finished - started) * 1000)
+            if profile is not None:
+                profile.add(stats)
+            if memory:
+                memtrack.remember(memory)
+            if degraded:
+                deadline.degrade(*degraded)
+            result.set_result(value)
+
+        measured = self.track_memory and memtrack.ENABLED
+        expires_at = deadline.expires_at if deadline is not None else None
+        self.executor.submit(_timed_call, func, args, profile is not None, measured,
+                             expires_at).add_done_callback(settle)
+        return result
+
+    def run(self, func, *args):
+        """Run `func(*args)` in this lane and wait for it, raising ``full_error`` when the lane is full."""
+        with self.slot():
+            return self.submit(func, *args).result()
+
+    def shutdown(self):
+        """Stop the executor if it was started, the next job starts a new one."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def close(self):
+        """Shut the lane down for good and drop its gauges, for lanes made at run time."""
+        self.shutdown()
+        for name in self.gauges:
+            metrics.unregister_gauge(name)
+
+    async def arun(self, func, *args):
+        """Await `func(*args)` in this lane, call inside slot() when admission applies."""
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+
+def _ocr_executor():
+    return ProcessPoolExecutor(
+        max_workers=OCR_MAX_WORKERS,
+        initializer=_init_ocr_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'medical_coding_ai.settings'),),
+    )
+
+
+def _text_executor():
+    return ThreadPoolExecutor(max_workers=MATCH_MAX_WORKERS, thread_name_prefix='coding-text')
+
+
+ocr_lane = Lane('ocr', _ocr_executor, OCR_MAX_WORKERS, OCR_MAX_QUEUE, OCRQueueFull, track_memory=True)
+text_lane = Lane('text', _text_executor, MATCH_MAX_WORKERS, TEXT_MAX_QUEUE)
+
+# Older names, kept for callers of the single-pool API
+ocr_admission = ocr_lane.admission
+
+
+def get_ocr_pool():
+    return ocr_lane.executor
+
+
+def get_match_pool():
+    return text_lane.executor
+
+
+def ocr_slot():
+    """Reserve an OCR lane slot, raise OCRQueueFull when the lane is full."""
+    return ocr_lane.slot()
+
+
+async def run_ocr(func, *args):
+    """Await `func(*args)` in the OCR lane, call inside ocr_slot()."""
+    return await ocr_lane.arun(func, *args)
+
+
+async def run_matching(func, *args):
+    """Await `func(*args)` in the text lane."""
+    return await text_lane.arun(func, *args)
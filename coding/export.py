@@ -0,0 +1,224 @@
+"""Columnar export of coded reports for analytics.
+
+Reports are read with ``values(...).iterator(chunk_size=...)`` so only one
+chunk of rows is alive at a time. Each chunk becomes one Arrow record
+batch, which is written to Parquet (optionally Hive-partitioned by date of
+service) or streamed as an Arrow IPC stream. Memory stays flat whatever
+the table size.
+"""
+import os
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.db.models import F
+
+from .models import MedicalReport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# Export column -> (ORM lookup, Arrow type)
+EXPORT_COLUMNS = {
+    'id': ('id', pa.int64()),
+    'created_at': ('created_at', pa.timestamp('us', tz='UTC')),
+    'patient_name': ('patient_name', pa.string()),
+    'age': ('age', pa.string()),
+    'gender': ('gender', pa.string()),
+    'dob': ('dob', pa.date32()),
+    'mrn': ('mrn', pa.string()),
+    'date_of_service': ('date_of_service', pa.date32()),
+    'exam': ('exam', pa.string()),
+    'clinical_indication': ('clinical_indication', pa.string()),
+    'findings': ('findings', pa.string()),
+    'impression': ('impression', pa.string()),
+    'uploaded_file': ('uploaded_file', pa.string()),
+    'cpt_code': ('cpt_code_id', pa.string()),
+    'cpt_description': ('cpt_code__description', pa.string()),
+    'icd10_code': ('icd10_code_id', pa.string()),
+    'icd10_description': ('icd10_code__description', pa.string()),
+    'processing_log': ('processing_log', pa.string()),
+}
+
+PARTITION_FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}
+
+
+def resolve_columns(columns=None):
+    """Validate a column projection, default to every export column."""
+    if not columns:
+        return list(EXPORT_COLUMNS)
+    unknown = [c for c in columns if c not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(EXPORT_COLUMNS)}")
+    return list(dict.fromkeys(columns))
+
+
+def export_schema(columns):
+    return pa.schema([(c, EXPORT_COLUMNS[c][1]) for c in columns])
+
+
+def report_queryset(since=None, until=None):
+    """Reports ordered by date of service (undated first), then id."""
+    queryset = MedicalReport.objects.all()
+    if since:
+        queryset = queryset.filter(date_of_service__gte=since)
+    if until:
+        queryset = queryset.filter(date_of_service__lte=until)
+    return queryset.order_by(F('date_of_service').asc(nulls_first=True), 'id')
+
+
+def iter_record_batches(columns, chunk_size=DEFAULT_CHUNK_SIZE, queryset=None, extra=()):
+    """Yield (record batch, extra values per row) for the projected columns.
+
+    ``extra`` lists additional export columns fetched alongside the
+    projection, e.g. the partition column when it is not projected.
+    """
+    queryset = report_queryset() if queryset is None else queryset
+    schema = export_schema(columns)
+    fetch = list(dict.fromkeys([*columns, *extra]))
+    lookups = [EXPORT_COLUMNS[c][0] for c in fetch]
+    index = {c: i for i, c in enumerate(fetch)}
+
+    rows = queryset.values_list(*lookups).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield _to_batch(chunk, columns, schema, index), [[r[index[c]] for c in extra] for r in chunk]
+            chunk = []
+    if chunk:
+        yield _to_batch(chunk, columns, schema, index), [[r[index[c]] for c in extra] for r in chunk]
+
+
+def _to_batch(rows, columns, schema, index):
+    arrays = []
+    for column, field in zip(columns, schema):
+        values = [r[index[column]] for r in rows]
+        if column == 'created_at':
+            values = [v.astimezone(dt_timezone.utc) if v and v.tzinfo else v for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def partition_value(value, granularity):
+    if value is None:
+        return NULL_PARTITION
+    return value.strftime(PARTITION_FORMATS[granularity])
+
+
+def write_parquet(path, columns=None, partition=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                  since=None, until=None, compression='zstd'):
+    """Export reports to Parquet and return a stats dict.
+
+    Without ``partition`` ``path`` is a single .parquet file. With
+    ``partition`` set to day, month or year, ``path`` is a directory laid
+    out as ``date_of_service=<value>/part-0.parquet``. Rows arrive sorted
+    by date, so only one partition file is open at a time.
+    """
+    columns = resolve_columns(columns)
+    schema = export_schema(columns)
+    queryset = report_queryset(since, until)
+    stats = {'rows': 0, 'batches': 0, 'files': 0}
+
+    if not partition:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with pq.ParquetWriter(path, schema, compression=compression) as writer:
+            for batch, _ in iter_record_batches(columns, chunk_size, queryset):
+                writer.write_batch(batch)
+                stats['rows'] += batch.num_rows
+                stats['batches'] += 1
+        stats['files'] = 1
+        return stats
+
+    if partition not in PARTITION_FORMATS:
+        raise ValueError(f"Unsupported partition: {partition}")
+    current, writer = None, None
+    try:
+        for batch, extra in iter_record_batches(columns, chunk_size, queryset, extra=('date_of_service',)):
+            keys = [partition_value(e[0], partition) for e in extra]
+            start = 0
+            # Split the batch into contiguous runs of the same partition key
+            for i in range(1, len(keys) + 1):
+                if i < len(keys) and keys[i] == keys[start]:
+                    continue
+                if keys[start] != current:
+                    if writer is not None:
+                        writer.close()
+                    current = keys[start]
+                    directory = os.path.join(path, f"date_of_service={current}")
+                    os.makedirs(directory, exist_ok=True)
+                    writer = pq.ParquetWriter(os.path.join(directory, 'part-0.parquet'), schema,
+                                              compression=compression)
+                    stats['files'] += 1
+                writer.write_batch(batch.slice(start, i - start))
+                start = i
+            stats['rows'] += batch.num_rows
+            stats['batches'] += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    return stats
+
+
+class _ChunkSink:
+    """File-like sink that hands written bytes to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+STREAM_FORMATS = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def iter_export_stream(fmt='parquet', columns=None, chunk_size=DEFAULT_CHUNK_SIZE, since=None, until=None):
+    """Yield the export as Parquet or an Arrow IPC stream, one record batch at a time.
+
+    Both writers only append, so the bytes can go out as soon as each
+    batch is encoded (Parquet writes its footer on close).
+    """
+    columns = resolve_columns(columns)
+    schema = export_schema(columns)
+    sink = _ChunkSink()
+    stream = pa.PythonFile(sink, mode='w')
+    if fmt == 'arrow':
+        writer = pa.ipc.new_stream(stream, schema)
+    elif fmt == 'parquet':
+        writer = pq.ParquetWriter(stream, schema, compression='zstd')
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+    try:
+        for batch, _ in iter_record_batches(columns, chunk_size, report_queryset(since, until)):
+            writer.write_batch(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def parse_export_date(value):
+    """YYYY-MM-DD string to a date, None for empty values."""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
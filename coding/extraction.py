@@ -0,0 +1,364 @@
+"""Report text and field extraction.
+
+Text comes out of .txt files directly. Images and PDFs go through
+coding.ocr and other documents through textract, both imported on first
+use, so importing this module (and the views) does not load the imaging
+stack.
+"""
+import os
+import re
+import itertools
+
+from .diagnosis_spotter import get_diagnosis_spotter, tokenize
+from .matching import MAPPING_PREPROCESSORS, clean_diagnosis_text, get_code_mapping
+from .negation import NEGATED, assertion, find_scopes, get_negation_engine
+
+# ---------- TEXT CLEANING ----------
+def clean_ocr_text(text):
+    """Enhanced text cleaning with common OCR fixes"""
+    if not text:
+        return ""
+        
+    # Common OCR fixes for medical reports
+    fixes = {
+        r'PtType\s*[:=]': "PtType:",
+        r'PtClass\s*[:=]': "PtClass:",
+        r'RefPhy\s*[:=]': "RefPhy:",
+        r'SignPhy\s*[:=]': "SignPhy:",
+        r'OrdEx\s*[:=]': "OrdEx:",
+        r'Accsn\s*[:=]': "Accsn:",
+        r'OrdHx\s*[:=]': "OrdHx:",
+        r'FinClass\s*[:=]': "FinClass:",
+        r'Note File Name\s*[:=]': "Note File Name:",
+        r'Last Coded On\s*[:=]': "Last Coded On:",
+        r'Last Coded by\s*[:=]': "Last Coded by:",
+        r'MRN\s*[:=]': "MRN:",
+        r'DOB\s*[:=]': "DOB:",
+        r'DOS\s*[:=]': "DOS:",
+        "Or dEx": "OrdEx", "Ord Ex": "OrdEx", "Ordex": "OrdEx", "Ordx": "OrdEx",
+        "ORD EX": "OrdEx", "ORDEx": "OrdEx", "ordex": "OrdEx",
+        "ORD HX": "OrdHx", "ord hx": "OrdHx", "ORDHX": "OrdHx",
+        "MR N": "MRN", "MRn": "MRN",
+        "DOB :": "DOB:", "Sex :": "Sex:", "Age :": "Age:",
+        "Clinical :": "Clinical:", "Findings :": "Findings:",
+        "Impression :": "Impression:", "Procedure :": "Procedure:",
+        "Date of Service :": "Date of Service:",
+        "Accessio n": "Accession"
+    }
+    
+    # Modality-specific fixes
+    modality_fixes = {
+        "x-r": "XR", "x r": "XR", "xray": "XR", "x ray": "XR",
+        "m ri": "MRI", "mri": "MRI",
+        "c t": "CT", "ct": "CT",
+        "u s": "US", "us": "US",
+        "n m": "NM", "nm": "NM"
+    }
+    
+    # Apply all fixes
+    for wrong, correct in fixes.items():
+        if isinstance(wrong, str):
+            text = text.replace(wrong, correct)
+        else:  # regex pattern
+            text = re.sub(wrong, correct, text, flags=re.IGNORECASE)
+            
+    for wrong, correct in modality_fixes.items():
+        text = re.sub(rf'\b{wrong}\b', correct, text, flags=re.IGNORECASE)
+    
+    # Improved cleanup
+    text = re.sub(r'\n{2,}', '\n', text)  # Reduce multiple newlines
+    text = re.sub(r'[ \t]{2,}', ' ', text)  # Reduce multiple spaces
+    text = re.sub(r'([A-Za-z])\s+([A-Za-z])', r'\1\2', text)  # Fix broken words
+    text = re.sub(r'[^\x00-\x7F]+', ' ', text)  # Remove non-ASCII characters
+    
+    return text.strip()
+
+# ---------- TEXT EXTRACTION ----------
+def extract_text(file_path):
+    """Main text extraction function that handles multiple file types"""
+    try:
+        ext = os.path.splitext(file_path)[-1].lower()
+        
+        if ext in ['.png', '.jpg', '.jpeg']:
+            from .ocr import ocr_image_file
+            return ocr_image_file(file_path)
+            
+        elif ext == '.pdf':
+            from .ocr import iter_pdf_page_texts
+            return join_page_texts(file_path, [text for _, _, text in iter_pdf_page_texts(file_path)])
+            
+        elif ext == '.txt':
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                return clean_ocr_text(f.read())
+                
+        else:  # Try textract for other formats (doc, docx, etc.)
+            try:
+                import textract
+                return clean_ocr_text(textract.process(file_path).decode('utf-8'))
+            except Exception as e:
+                print(f"[ERROR] Textract failed on {file_path}: {e}")
+                return ""
+    except Exception as e:
+        print(f"[ERROR] Text extraction failed: {e}")
+        return ""
+
+def iter_extract_text(file_path):
+    """Yield (page_number, page_count, text) as each page of a document is extracted.
+
+    join_page_texts() over the yielded texts gives what extract_text() returns.
+    """
+    if os.path.splitext(file_path)[-1].lower() == '.pdf':
+        try:
+            from .ocr import iter_pdf_page_texts
+            yield from iter_pdf_page_texts(file_path)
+        except Exception as e:
+            print(f"[ERROR] Text extraction failed: {e}")
+        return
+    yield 1, 1, extract_text(file_path)
+
+
+def page_count(file_path):
+    """Number of pages iter_extract_text() yields for a document"""
+    if os.path.splitext(file_path)[-1].lower() == '.pdf':
+        from .ocr import pdf_page_count
+        return pdf_page_count(file_path)
+    return 1
+
+
+def extract_page_text(file_path, number):
+    """Text of page ``number`` (from 1) of a document, one page of iter_extract_text()"""
+    if os.path.splitext(file_path)[-1].lower() == '.pdf':
+        from .ocr import pdf_page_text
+        return pdf_page_text(file_path, number)
+    return extract_text(file_path)
+
+
+def join_page_texts(file_path, page_texts):
+    """Combine per-page texts the same way extract_text does"""
+    if os.path.splitext(file_path)[-1].lower() == '.pdf':
+        return clean_ocr_text("".join(text + "\n" for text in page_texts))
+    return page_texts[0] if page_texts else ""
+
+# ---------- FIELD EXTRACTION ----------
+def clean_patient_name(raw_name):
+    """Clean and normalize patient names"""
+    if not raw_name:
+        return "-"
+        
+    name = raw_name.split("Age")[0].strip()
+    name = re.sub(r"\s{2,}", " ", name)
+    name = re.sub(r"[^\w\s,]", "", name)
+    name = re.sub(r"\bwan\b", "", name, flags=re.IGNORECASE)
+    return name.strip()
+
+
+def extract_fields(text):
+    """Enhanced field extraction with proper ICD-10 diagnosis description capture and interpretation."""
+    if not text:
+        return {key: '-' for key in DEFAULT_KEYS}
+
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    data = {key: '-' for key in DEFAULT_KEYS}
+
+    current_section = None
+    section_content = []
+
+    # Priority order for most reliable diagnosis sections
+    diagnosis_priority = [
+        ('impression', 'Impression:'),
+        ('clinical_indication', 'Clinical Indication:'),
+        ('findings', 'Findings:')
+    ]
+
+    for line in lines:
+        # Normalize keys before sections
+        for key, pattern in BASIC_PATTERNS.items():
+            if re.match(pattern, line, re.I):
+                if current_section and section_content:
+                    data[current_section] = ' '.join(section_content).strip()
+                    section_content = []
+                data[key] = extract_value_from_line(line, key)
+                break
+
+        # Section-based extraction
+        section_found = False
+        for section, trigger in diagnosis_priority:
+            if trigger.lower() in line.lower():
+                if current_section and section_content:
+                    data[current_section] = ' '.join(section_content).strip()
+                current_section = section
+                data['diagnosis_section'] = section
+                section_content = [line.split(trigger, 1)[-1].strip()]
+                section_found = True
+                break
+
+        if section_found:
+            continue
+
+        # Special cases: Exam, Procedure, Clinical inside Findings
+        if 'Exam:' in line:
+            store_section(data, current_section, section_content)
+            current_section = 'exam'
+            section_content = [line.split("Exam:", 1)[-1].strip()]
+
+        elif 'Procedure:' in line:
+            store_section(data, current_section, section_content)
+            current_section = 'procedure'
+            section_content = [line.split("Procedure:", 1)[-1].strip()]
+
+        elif 'Clinical:' in line and current_section == 'findings':
+            clinical_part = line.split("Clinical:", 1)[-1].strip()
+            findings_part = line.split("Clinical:", 1)[0].strip()
+            if clinical_part:
+                data['clinical_indication'] = clinical_part
+            if findings_part:
+                section_content.append(findings_part)
+        elif current_section:
+            section_content.append(line)
+
+    if current_section and section_content:
+        data[current_section] = ' '.join(section_content).strip()
+
+    # Negated/uncertain scopes of each section, scanned once on first use:
+    # by the diagnosis description and by the span assertions below
+    negation = get_negation_engine()
+    scanned = {}
+
+    def scan(section):
+        if section not in scanned:
+            tokens = tokenize(data[section])
+            scanned[section] = tokens, negation.scopes(data[section], tokens)
+        return scanned[section]
+
+    # Step: ICD Diagnosis Description Inference
+    icd_sections = [k for k in ['impression', 'clinical_indication', 'ordhx', 'findings'] if data[k] != '-']
+    data['icd_diagnosis_description'] = extract_relevant_diagnosis(
+        [data[k] for k in icd_sections], (scan(k)[1] for k in icd_sections)
+    ) or '-'
+
+    # Diagnosis phrases and negated/uncertain scopes of the narrative sections,
+    # offsets into each section's text. Both automata share one tokenization.
+    spotter = get_diagnosis_spotter(get_code_mapping('icd'), MAPPING_PREPROCESSORS['icd'])
+    data['diagnosis_spans'] = []
+    data['assertion_scopes'] = []
+    for section in ('impression', 'findings'):
+        if data[section] == '-':
+            continue
+        tokens, scopes = scan(section)
+        data['assertion_scopes'].extend({"section": section, **scope.as_dict()} for scope in scopes)
+        data['diagnosis_spans'].extend(
+            {"section": section, **span.as_dict(), "assertion": assertion(span.start, span.end, scopes)}
+            for span in spotter.spot(data[section], tokens)
+        )
+
+    return data
+
+
+def extract_value_from_line(line, key):
+    """Extracts field value using key-specific patterns."""
+    if key == 'name':
+        return clean_patient_name(re.split(r'Name\s*[:=]', line, flags=re.I)[-1])
+    elif key == 'age':
+        age = re.findall(r"Age\s*[:=]?\s*(\d+)", line, re.I)
+        return age[0] if age else '-'
+    elif key == 'sex':
+        sex = re.findall(r"Sex\s*[:=]?\s*([MF])", line, re.I)
+        return sex[0].upper() if sex else '-'
+    elif key == 'dob':
+        dob = re.findall(r"DOB\s*[:=]?\s*([\d\-/]+)", line)
+        return dob[0] if dob else '-'
+    elif key == 'mrn':
+        return re.split(r'MRN\s*[:=]', line, flags=re.I)[-1].strip()
+    elif key == 'date_of_service':
+        return re.split(r'(Date of Service|DOS)\s*[:=]', line, flags=re.I)[-1].strip(" :")
+    elif key == 'ordex':
+        return re.split(r'OrdEx\s*[:=]', line, flags=re.I)[-1].strip()
+    elif key == 'ordhx':
+        return re.split(r'OrdHx\s*[:=]', line, flags=re.I)[-1].strip()
+    elif key == 'accession':
+        accession = re.findall(r"\d{6,10}", line)
+        return accession[0] if accession else '-'
+    return '-'
+
+
+def store_section(data, current_section, section_content):
+    """Stores previous section before switching."""
+    if current_section and section_content:
+        data[current_section] = ' '.join(section_content).strip()
+        section_content.clear()
+
+
+def clean_patient_name(name):
+    """Simple cleanup for patient name."""
+    return re.sub(r"[^A-Z\s,]", "", name.upper()).strip()
+
+
+def extract_relevant_diagnosis(text_list, scopes_list=None):
+    """Extract final structured ICD-compatible diagnosis string.
+
+    ``scopes_list`` holds the negated and uncertain scopes of each text,
+    as found by the caller. It is read in step with the texts, a generator
+    leaves the texts after the one that gives the diagnosis unscanned.
+    """
+    side_keywords = {
+        "right": "right",
+        "left": "left",
+        "bilateral": "bilateral"
+    }
+
+    if scopes_list is None:
+        scopes_list = itertools.repeat(None)
+    for text, scopes in zip(text_list, scopes_list):
+        cleaned = clean_diagnosis_text(text, scopes=scopes)
+        if not cleaned:
+            continue
+
+        # The scoped words are gone, only normal findings are left to drop
+        terms = re.split(r"[.,;/]", cleaned)
+        terms = [term.strip() for term in terms if term.strip() and not NORMAL_FINDING.search(term)]
+
+        final_terms = []
+        for term in terms:
+            side = None
+            for keyword in side_keywords:
+                if keyword in term:
+                    side = side_keywords[keyword]
+                    break
+            if side and "hand" in term:
+                final_terms.append(f"{side} hand pain")
+            else:
+                final_terms.append(term)
+
+        if final_terms:
+            return ", ".join(final_terms)
+
+    return "-"
+
+
+NORMAL_FINDING = re.compile(r"\b(normal|unremarkable|negative)\b", re.IGNORECASE)
+
+
+def is_negation(term):
+    """Detect phrases that indicate absence of disease."""
+    return bool(NORMAL_FINDING.search(term)) or any(s.kind == NEGATED for s in find_scopes(term.lower()))
+
+
+# Default dictionary keys
+DEFAULT_KEYS = {
+    'name', 'age', 'sex', 'dob', 'ordex', 'accession', 'ordhx', 'exam',
+    'clinical_indication', 'findings', 'impression', 'procedure',
+    'mrn', 'date_of_service', 'icd_diagnosis_description', 'diagnosis_section'
+}
+
+# Regex patterns for basic field lines
+BASIC_PATTERNS = {
+    'name': r'^(Name|Patient\s*Name)\s*[:=]',
+    'age': r'^(Age|Patient\s*Age)\s*[:=]',
+    'sex': r'^(Sex|Gender)\s*[:=]',
+    'dob': r'^DOB\s*[:=]',
+    'mrn': r'^MRN\s*[:=]',
+    'date_of_service': r'^(Date of Service|DOS)\s*[:=]',
+    'ordex': r'^OrdEx\s*[:=]',
+    'ordhx': r'^OrdHx\s*[:=]',
+    'accession': r'(Accsn|Accession)'
+}
@@ -0,0 +1,58 @@
+"""Import-time measurement of the text path.
+
+``python -X importtime`` prints one line per imported module with its
+self and cumulative import time in microseconds. measure_imports() runs
+a fresh interpreter that sets up Django and imports the given modules,
+then parses those lines. Text-only workers import TEXT_PATH_MODULES and
+must never end up loading any of IMAGING_MODULES.
+"""
+import os
+import re
+import sys
+import subprocess
+
+from django.conf import settings
+
+TEXT_PATH_MODULES = ('coding.views', 'coding.extraction', 'coding.matching')
+IMAGING_MODULES = ('cv2', 'PIL', 'pytesseract', 'pdf2image', 'textract', 'pandas', 'pyarrow')
+
+# Generous ceiling for importing coding.views in a fresh process, in microseconds
+STARTUP_BUDGET_US = getattr(settings, 'STARTUP_IMPORT_BUDGET_US', 2_000_000)
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def measure_imports(modules=TEXT_PATH_MODULES):
+    """Return {'timings': {module: (self_us, cumulative_us)}, 'loaded': [...], 'total_us': int}.
+
+    ``loaded`` lists the IMAGING_MODULES present in the child process
+    after the imports.
+    """
+    code = "; ".join([
+        "import sys, django",
+        "django.setup()",
+        *(f"import {module}" for module in modules),
+        f"print(' '.join(m for m in {IMAGING_MODULES!r} if m in sys.modules))",
+    ])
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'medical_coding_ai.settings')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True,
+                            text=True, env=env, cwd=settings.BASE_DIR)
+    if result.returncode:
+        raise RuntimeError(f"Import failed: {result.stderr.strip().splitlines()[-1:]}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return {
+        'timings': timings,
+        'loaded': result.stdout.split(),
+        'total_us': sum(own for own, _ in timings.values()),
+    }
+
+
+def slowest_imports(timings, top=15):
+    """The ``top`` modules by cumulative import time."""
+    return sorted(timings.items(), key=lambda item: -item[1][1])[:top]
@@ -0,0 +1,314 @@
+"""Bulk coding of report files for backfills.
+
+iter_sources() walks directories, zip archives and glob patterns lazily
+and yields one Source per supported file. code_source() runs the same
+pipeline as the upload views (extract_text -> extract_fields -> CPT/ICD
+matchers) on one file and returns a plain, picklable result dict, so it
+can run in a process pool. The parent process owns the database, the
+output file and the progress ledger, see the code_reports command.
+"""
+import os
+import csv
+import glob
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.db import transaction
+
+from .models import CPTCode, ICD10Code, MedicalReport
+from .extraction import extract_text
+from .reports import ALLOWED_EXTENSIONS, process_report_text, report_fields
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SEPARATOR = "::"
+MIN_TEXT_LENGTH = 30
+
+# Flat output row, one per source file
+OUTPUT_COLUMNS = (
+    'source', 'sha256', 'status', 'error', 'report_id', 'seconds',
+    'patient_name', 'age', 'gender', 'dob', 'mrn', 'date_of_service',
+    'exam', 'clinical_indication', 'findings', 'impression',
+    'cpt_code', 'cpt_description', 'cpt_score',
+    'icd_code', 'icd_description', 'icd_score',
+)
+
+
+@dataclass(frozen=True)
+class Source:
+    """One report file, either on disk or a member of a zip archive."""
+    path: str
+    member: str = None
+
+    @property
+    def id(self):
+        return f"{self.path}{ARCHIVE_SEPARATOR}{self.member}" if self.member else self.path
+
+    @property
+    def name(self):
+        return self.member or self.path
+
+
+def is_supported(name):
+    return os.path.splitext(name)[1].lower().lstrip('.') in ALLOWED_EXTENSIONS
+
+
+def _iter_zip(path):
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and is_supported(info.filename):
+                yield Source(path, info.filename)
+
+
+def _iter_directory(path):
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            yield from _iter_path(os.path.join(root, name), top_level=False)
+
+
+def _iter_path(path, top_level=True):
+    if os.path.isdir(path):
+        yield from _iter_directory(path)
+    elif path.lower().endswith('.zip') and zipfile.is_zipfile(path):
+        yield from _iter_zip(path)
+    elif is_supported(path):
+        yield Source(path)
+    elif top_level:
+        logger.warning(f"Skipping unsupported file {path}")
+
+
+def iter_sources(inputs):
+    """Yield a Source for every supported file under the given paths, zips or globs."""
+    for pattern in inputs:
+        if glob.has_magic(pattern):
+            for path in sorted(glob.iglob(pattern, recursive=True)):
+                yield from _iter_path(path)
+        elif os.path.exists(pattern):
+            yield from _iter_path(pattern)
+        else:
+            logger.warning(f"Input not found: {pattern}")
+
+
+# The archive this process read a member from last, by path. Members of an
+# archive come in a row, so each process opens (and parses the central
+# directory of) every archive once rather than once per member.
+_archives = {}
+
+
+def _open_archive(path):
+    archive = _archives.get(path)
+    if archive is None:
+        close_archives()
+        archive = _archives[path] = zipfile.ZipFile(path)
+    return archive
+
+
+def close_archives():
+    for archive in _archives.values():
+        archive.close()
+    _archives.clear()
+
+
+def _read_source(source, out):
+    """Copy the source bytes to ``out`` and return their sha256."""
+    hasher = hashlib.sha256()
+    if source.member:
+        f = _open_archive(source.path).open(source.member)
+    else:
+        f = open(source.path, 'rb')
+    with f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+            if out is not None:
+                out.write(chunk)
+    return hasher.hexdigest()
+
+
+def code_source(source):
+    """Extract, parse and code one source file. Never raises."""
+    start = time.perf_counter()
+    result = {'source': source.id, 'name': source.name, 'sha256': None, 'status': 'ok', 'error': ''}
+    temp_path = None
+    try:
+        if source.member:
+            # OCR needs a real file, archive members go to a temp copy
+            fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(source.member)[1])
+            with os.fdopen(fd, 'wb') as out:
+                result['sha256'] = _read_source(source, out)
+            path = temp_path
+        else:
+            result['sha256'] = _read_source(source, None)
+            path = source.path
+
+        raw_text = extract_text(path)
+        if len(raw_text.strip()) < MIN_TEXT_LENGTH:
+            result.update(status='empty', error='Insufficient text extracted')
+        else:
+            patient_data, cpt_matches, icd_matches = process_report_text(raw_text, skip_empty_exam=True)
+            result.update(patient_data=patient_data, cpt_matches=cpt_matches, icd_matches=icd_matches)
+    except Exception as e:
+        logger.error(f"Failed to code {source.id}: {e}")
+        result.update(status='error', error=str(e))
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _codable(match):
+    return bool(match) and match.get('code') not in ('N/A', '-')
+
+
+def save_results(results):
+    """Create MedicalReport rows for the coded results in one transaction.
+
+    Sets ``report_id`` on each saved result. CPT/ICD rows missing from the
+    catalogue tables are created in bulk first.
+    """
+    coded = [r for r in results if r['status'] == 'ok']
+    if not coded:
+        return 0
+
+    best = [(r['cpt_matches'][0] if r['cpt_matches'] else None,
+             r['icd_matches'][0] if r['icd_matches'] else None) for r in coded]
+    with transaction.atomic():
+        CPTCode.objects.bulk_create(
+            [CPTCode(code=cpt['code'], description=cpt['description']) for cpt, _ in best if _codable(cpt)],
+            ignore_conflicts=True,
+        )
+        ICD10Code.objects.bulk_create(
+            [ICD10Code(code=icd['code'], description=icd['description']) for _, icd in best if _codable(icd)],
+            ignore_conflicts=True,
+        )
+        reports = MedicalReport.objects.bulk_create([
+            MedicalReport(
+                **report_fields(r['patient_data'], r['name']),
+                cpt_code_id=cpt['code'] if _codable(cpt) else None,
+                icd10_code_id=icd['code'] if _codable(icd) else None,
+            )
+            for r, (cpt, icd) in zip(coded, best)
+        ])
+    for result, report in zip(coded, reports):
+        result['report_id'] = report.pk
+    return len(reports)
+
+
+def output_row(result):
+    """Flatten a coding result into OUTPUT_COLUMNS."""
+    patient = result.get('patient_data') or {}
+    fields = report_fields(patient) if patient else {}
+    cpt = (result.get('cpt_matches') or [{}])[0]
+    icd = (result.get('icd_matches') or [{}])[0]
+    row = {
+        'source': result['source'],
+        'sha256': result['sha256'],
+        'status': result['status'],
+        'error': result['error'],
+        'report_id': result.get('report_id'),
+        'seconds': result['seconds'],
+        'cpt_code': cpt.get('code'),
+        'cpt_description': cpt.get('description'),
+        'cpt_score': cpt.get('score'),
+        'icd_code': icd.get('code'),
+        'icd_description': icd.get('description'),
+        'icd_score': icd.get('score'),
+    }
+    for column in OUTPUT_COLUMNS:
+        if column not in row:
+            value = fields.get(column)
+            row[column] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return row
+
+
+class CSVOutput:
+    """Appends rows to a CSV file, writing the header only for a new file."""
+
+    def __init__(self, path):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_COLUMNS)
+        if new:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetOutput:
+    """Writes each run to its own part file inside a Parquet dataset directory."""
+
+    def __init__(self, path):
+        import pyarrow as pa
+
+        os.makedirs(path, exist_ok=True)
+        self.path = os.path.join(path, f"part-{datetime.now():%Y%m%d%H%M%S}-{os.getpid()}.parquet")
+        self.schema = pa.schema([
+            (column, pa.int64() if column == 'report_id' else
+             pa.float64() if column in ('seconds', 'cpt_score', 'icd_score') else pa.string())
+            for column in OUTPUT_COLUMNS
+        ])
+        self._writer = None
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not rows:
+            return
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, self.schema)
+        self._writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_output(path):
+    if path.lower().endswith('.parquet'):
+        return ParquetOutput(path)
+    return CSVOutput(path)
+
+
+class ProgressLedger:
+    """Append-only JSONL record of finished sources, used to resume a run."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)['source'])
+                    except (ValueError, KeyError):
+                        continue  # torn last line from a killed run
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __contains__(self, source_id):
+        return source_id in self.done
+
+    def record(self, results):
+        for r in results:
+            self._file.write(json.dumps({
+                'source': r['source'], 'sha256': r['sha256'], 'status': r['status'],
+                'report_id': r.get('report_id'),
+            }) + "\n")
+            self.done.add(r['source'])
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
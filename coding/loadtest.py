@@ -0,0 +1,332 @@
+"""Load generator and capacity search for the coding API.
+
+A Workload draws requests from a mix of synthetic text reports and
+sample image/PDF files. A target sends them either in process (Django
+test client) or over HTTP to a running server. Two drivers apply load:
+
+* closed loop: ``concurrency`` clients, each sends its next request as
+  soon as the previous one answered;
+* open loop: requests start at a fixed arrival ``rate`` whatever the
+  server does, latency is measured from the scheduled start so a slow
+  server cannot hide its queueing (no coordinated omission).
+
+find_capacity() steps the concurrency (or rate) up until the error rate,
+the p99 latency or the throughput gain says the service is saturated,
+and reports the last level that still met the targets.
+
+In-process runs go through the whole view stack and save reports to the
+configured database, point them at a scratch database.
+"""
+import io
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import percentile
+
+ENDPOINTS = {
+    'text': '/api/predict/text/',
+    'image': '/api/predict/image/',
+}
+DEFAULT_MIX = {'text': 9, 'image': 1}
+SAMPLE_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg')
+
+# Saturation rules of the capacity search
+MAX_ERROR_RATE = 0.01       # share of failed (5xx, 429, transport) requests
+SLO_P99_MS = 2000           # p99 latency target
+MIN_THROUGHPUT_GAIN = 0.05  # a step must add this much throughput to be worth its latency
+
+EXAMS = (
+    "XR CHEST 2 VIEWS", "XR CHEST 1 VIEW", "CT HEAD WITHOUT CONTRAST", "CT ABDOMEN PELVIS WITH CONTRAST",
+    "MRI BRAIN WITHOUT CONTRAST", "US ABDOMEN COMPLETE", "XR KNEE 3 VIEWS", "XR ANKLE 3 VIEWS",
+    "CT CHEST WITH CONTRAST", "MRI LUMBAR SPINE WITHOUT CONTRAST",
+)
+INDICATIONS = ("cough", "shortness of breath", "abdominal pain", "headache", "fall", "knee pain",
+               "low back pain", "chest pain", "fever")
+IMPRESSIONS = ("Pneumonia", "No acute cardiopulmonary process", "Possible small pleural effusion",
+               "Headache", "Appendicitis", "No fracture", "Degenerative disc disease", "Cholelithiasis",
+               "Osteoarthritis of the knee")
+
+
+def synthetic_report(rng):
+    """A short radiology report in the layout the extraction patterns expect."""
+    return (
+        f"Patient Name: Test Patient {rng.randint(1, 9999)}\n"
+        f"Exam: {rng.choice(EXAMS)}\n"
+        f"Clinical Indication: {rng.choice(INDICATIONS)}\n"
+        f"Findings: {rng.choice(IMPRESSIONS)}.\n"
+        f"Impression: {rng.choice(IMPRESSIONS)}\n"
+    )
+
+
+def parse_mix(value):
+    """'text=9,image=1' -> {'text': 9, 'image': 1}."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in value.split(','))):
+        kind, _, weight = part.partition('=')
+        if kind not in ENDPOINTS:
+            raise ValueError(f"Unknown request kind {kind!r}, expected one of {', '.join(ENDPOINTS)}")
+        mix[kind] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one positive weight")
+    return mix
+
+
+def find_samples(paths):
+    """Sample documents under the given files or directories."""
+    samples = []
+    for path in paths:
+        if os.path.isdir(path):
+            samples.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                  if name.lower().endswith(SAMPLE_EXTENSIONS)))
+        elif os.path.isfile(path):
+            samples.append(path)
+    return samples
+
+
+class Workload:
+    """Draws (kind, payload) requests: text payloads are report strings, image payloads (name, bytes).
+
+    With ``fresh_uploads`` a random trailer makes each upload's bytes
+    unique, so the single-flight cache cannot answer repeats for free.
+    """
+
+    def __init__(self, mix=None, samples=(), seed=None, fresh_uploads=False):
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.samples = []
+        for path in samples:
+            with open(path, 'rb') as f:
+                self.samples.append((os.path.basename(path), f.read()))
+        if not self.samples:
+            self.mix.pop('image', None)
+        if not any(self.mix.values()):
+            raise ValueError("Image requests need sample files")
+        self.fresh_uploads = fresh_uploads
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_request(self):
+        with self._lock:
+            kind = self._rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            if kind == 'text':
+                return kind, synthetic_report(self._rng)
+            name, data = self._rng.choice(self.samples)
+        if self.fresh_uploads:
+            data += b"\n%" + uuid.uuid4().hex.encode()
+        return kind, (name, data)
+
+
+# ---------- TARGETS ----------
+class InProcessTarget:
+    """Sends requests through the Django test client, one client per thread."""
+
+    def __init__(self, endpoints=None, host='localhost'):
+        self.endpoints = endpoints or ENDPOINTS
+        self.host = host
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            from django.test import Client
+
+            # Errors become 500 responses, as a real server would answer
+            client = self._local.client = Client(raise_request_exception=False, SERVER_NAME=self.host)
+        return client
+
+    def send(self, kind, payload):
+        """Return the response's HTTP status."""
+        client = self._client()
+        if kind == 'text':
+            response = client.post(self.endpoints[kind], json.dumps({'text': payload}),
+                                   content_type='application/json')
+        else:
+            name, data = payload
+            upload = io.BytesIO(data)
+            upload.name = name
+            response = client.post(self.endpoints[kind], {'file': upload})
+        return response.status_code
+
+
+class HttpTarget:
+    """Sends requests to a running server at ``base_url``."""
+
+    def __init__(self, base_url, endpoints=None, timeout=120):
+        self.base_url = base_url.rstrip('/')
+        self.endpoints = endpoints or ENDPOINTS
+        self.timeout = timeout
+
+    def send(self, kind, payload):
+        if kind == 'text':
+            body = json.dumps({'text': payload}).encode()
+            content_type = 'application/json'
+        else:
+            boundary = uuid.uuid4().hex
+            name, data = payload
+            body = (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'
+                f"Content-Type: application/octet-stream\r\n\r\n"
+            ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+            content_type = f"multipart/form-data; boundary={boundary}"
+        request = urllib.request.Request(self.base_url + self.endpoints[kind], data=body,
+                                         headers={'Content-Type': content_type})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+# ---------- DRIVERS ----------
+def _send(target, kind, payload, scheduled):
+    """(kind, latency ms from ``scheduled``, status or None, error) of one request."""
+    try:
+        status, error = target.send(kind, payload), None
+    except Exception as e:
+        status, error = None, f"{type(e).__name__}: {e}"
+    return kind, (time.perf_counter() - scheduled) * 1000, status, error
+
+
+def run_closed(target, workload, concurrency, duration):
+    """``concurrency`` clients send back to back for ``duration`` seconds."""
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            kind, payload = workload.next_request()
+            sample = _send(target, kind, payload, time.perf_counter())
+            with lock:
+                samples.append(sample)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(samples, time.perf_counter() - started, mode='closed', level=concurrency)
+
+
+def run_open(target, workload, rate, duration, max_in_flight=256, poisson=True, seed=None):
+    """Start requests at ``rate`` per second (Poisson arrivals by default) for ``duration`` seconds.
+
+    At most ``max_in_flight`` requests run at once; when the server falls
+    behind, later requests wait and their latency grows from the time
+    they were due.
+    """
+    rng = random.Random(seed)
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='loadtest') as pool:
+        started = time.perf_counter()
+        due = started
+        while due < started + duration:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            kind, payload = workload.next_request()
+            futures.append(pool.submit(_send, target, kind, payload, due))
+            due += rng.expovariate(rate) if poisson else 1 / rate
+    samples = [future.result() for future in futures]
+    return summarize(samples, time.perf_counter() - started, mode='open', level=rate)
+
+
+def _stats(samples, elapsed):
+    latencies = sorted(latency for _, latency, _, _ in samples)
+    failed = sum(1 for _, _, status, _ in samples if status is None or status >= 500 or status == 429)
+    ok = sum(1 for _, _, status, _ in samples if status is not None and status < 400)
+    stats = {
+        'requests': len(samples),
+        'ok': ok,
+        'failed': failed,
+        'error_rate': round(failed / len(samples), 4) if samples else 0.0,
+        'throughput': round(ok / elapsed, 2) if elapsed else 0.0,
+    }
+    for pct in (50, 90, 99):
+        stats[f'p{pct}_ms'] = round(percentile(latencies, pct), 1) if latencies else None
+    stats['max_ms'] = round(latencies[-1], 1) if latencies else None
+    return stats
+
+
+def summarize(samples, elapsed, mode, level):
+    """Overall and per-kind latency percentiles, error rate and throughput of one run."""
+    statuses = {}
+    errors = {}
+    for _, _, status, error in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if error:
+            errors[error] = errors.get(error, 0) + 1
+    return {
+        'mode': mode,
+        'level': level,
+        'elapsed_s': round(elapsed, 2),
+        **_stats(samples, elapsed),
+        'statuses': dict(sorted(statuses.items())),
+        'errors': dict(sorted(errors.items(), key=lambda item: -item[1])[:5]),
+        'by_kind': {kind: _stats([s for s in samples if s[0] == kind], elapsed)
+                    for kind in sorted({s[0] for s in samples})},
+    }
+
+
+# ---------- CAPACITY ----------
+def saturation_reason(step, best, max_error_rate=MAX_ERROR_RATE, slo_p99_ms=SLO_P99_MS,
+                      min_gain=MIN_THROUGHPUT_GAIN):
+    """Why ``step`` counts as saturated compared to the best step so far, or None."""
+    if step['error_rate'] > max_error_rate:
+        return f"error rate {step['error_rate']:.1%} above {max_error_rate:.1%}"
+    if step['p99_ms'] is not None and step['p99_ms'] > slo_p99_ms:
+        return f"p99 {step['p99_ms']:.0f} ms above {slo_p99_ms} ms"
+    if best is not None and step['throughput'] < best['throughput'] * (1 + min_gain):
+        return f"throughput {step['throughput']}/s gained less than {min_gain:.0%} over {best['throughput']}/s"
+    return None
+
+
+def find_capacity(target, workload, mode='closed', start=1, factor=2, max_level=64, step_duration=10,
+                  max_error_rate=MAX_ERROR_RATE, slo_p99_ms=SLO_P99_MS, min_gain=MIN_THROUGHPUT_GAIN,
+                  on_step=None):
+    """Raise the load geometrically until saturation and report the sustainable level.
+
+    Levels are client counts in closed mode and requests per second in
+    open mode. The sustainable level is the best step that met every
+    target, the saturation level is the first one that did not.
+    """
+    steps = []
+    best = None
+    saturation = None
+    level = start
+    while level <= max_level:
+        if mode == 'closed':
+            step = run_closed(target, workload, int(level), step_duration)
+        else:
+            step = run_open(target, workload, level, step_duration)
+        reason = saturation_reason(step, best, max_error_rate, slo_p99_ms, min_gain)
+        step['saturated'] = reason
+        steps.append(step)
+        if on_step:
+            on_step(step)
+        if reason:
+            saturation = {'level': level, 'reason': reason}
+            break
+        best = step
+        level *= factor
+    return {
+        'mode': mode,
+        'targets': {'max_error_rate': max_error_rate, 'slo_p99_ms': slo_p99_ms, 'min_gain': min_gain},
+        'steps': steps,
+        'saturation': saturation,
+        'sustainable': None if best is None else {
+            'level': best['level'],
+            'throughput': best['throughput'],
+            'p99_ms': best['p99_ms'],
+            'error_rate': best['error_rate'],
+        },
+    }
@@ -0,0 +1,53 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.embedding_index import INDEX_ROOT, build_embedding_index
+from coding.mapping_store import MAPPING_FILES, source_digest
+from coding.matching import MAPPING_PREPROCESSORS
+
+
+class Command(BaseCommand):
+    help = "Embed the CPT/ICD mapping keys and build the memory-mapped IVF search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['cpt', 'icd', 'all'], default='all')
+        parser.add_argument('--encoder', default='tfidf',
+                            help="'tfidf' or a sentence-transformers model name")
+        parser.add_argument('--dims', type=int, default=128, help='SVD dimensions for the tfidf encoder')
+        parser.add_argument('--dtype', choices=['float16', 'int8'], default='float16')
+        parser.add_argument('--lists', type=int, default=None, help='IVF list count (default: sqrt(keys))')
+
+    def handle(self, *args, **options):
+        kinds = ['cpt', 'icd'] if options['kind'] == 'all' else [options['kind']]
+        for kind in kinds:
+            mapping_path = MAPPING_FILES[kind]
+            if not os.path.exists(mapping_path):
+                message = f"Mapping not found: {mapping_path}"
+                if options['kind'] != 'all':
+                    raise CommandError(message)
+                self.stderr.write(f"Skipping {kind}: {message}")
+                continue
+
+            with open(mapping_path, 'rb') as f:
+                raw = f.read()
+            mapping = json.loads(raw)
+
+            start = time.perf_counter()
+            out_dir = os.path.join(INDEX_ROOT, kind)
+            manifest = build_embedding_index(
+                mapping,
+                out_dir,
+                preprocess=MAPPING_PREPROCESSORS[kind],
+                encoder=options['encoder'],
+                dims=options['dims'],
+                dtype=options['dtype'],
+                n_lists=options['lists'],
+                source_sha256=source_digest(raw).hex(),
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"{kind}: {manifest['count']} keys, {manifest['dims']} dims {manifest['dtype']}, "
+                f"{manifest['n_lists']} lists -> {out_dir} ({time.perf_counter() - start:.2f}s)"
+            ))
@@ -0,0 +1,49 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.mapping_store import MAPPING_FILES
+from coding.reference_builder import benchmark, build_reference
+
+DEFAULT_SOURCES = {
+    'cpt': os.path.join(settings.BASE_DIR, 'scripts', '2024_CPT_Code_Reference_Guide.pdf'),
+    'icd': os.path.join(settings.BASE_DIR, 'dataset', 'icd-10-medical-diagnosis-codes.pdf'),
+}
+
+
+class Command(BaseCommand):
+    help = "Extract the CPT or ICD-10 mapping from a reference PDF (parallel PyMuPDF extraction)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['cpt', 'icd'])
+        parser.add_argument('--pdf', default=None, help='Source PDF, defaults to the bundled reference')
+        parser.add_argument('--output', default=None, help='Mapping JSON, defaults to the file the matchers load')
+        parser.add_argument('--workers', type=int, default=None, help='Extraction processes (default: CPU count)')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Time sequential vs parallel extraction instead of writing the mapping')
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        pdf_path = options['pdf'] or DEFAULT_SOURCES[kind]
+        if not os.path.exists(pdf_path):
+            raise CommandError(f"PDF not found: {pdf_path}")
+
+        if options['benchmark']:
+            for label, stats in benchmark(pdf_path, kind, options['workers']).items():
+                self.stdout.write(
+                    f"{label:>10}: {stats['workers']} workers, {stats['pages']} pages, {stats['entries']} entries "
+                    f"in {stats['seconds']:.3f}s ({stats['pages_per_second']} pages/s)"
+                )
+            return
+
+        out_path = options['output'] or MAPPING_FILES[kind]
+        try:
+            stats = build_reference(pdf_path, out_path, kind, options['workers'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['entries']} {kind} codes from {stats['pages']} pages ({stats['duplicates']} duplicates) "
+            f"in {stats['seconds']:.2f}s -> {out_path}"
+        ))
+        self.stdout.write("Run compile_mappings to refresh the compiled .bin files.")
@@ -0,0 +1,131 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.executors import OCR_MAX_WORKERS, _init_ocr_worker
+from coding.ingest import (
+    ProgressLedger, close_archives, code_source, iter_sources, open_output, output_row, save_results,
+)
+
+
+class Command(BaseCommand):
+    help = "Code every report under the given directories, zip archives or glob patterns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('inputs', nargs='+', help='Directories, .zip archives, files or glob patterns')
+        parser.add_argument('--workers', type=int, default=OCR_MAX_WORKERS,
+                            help='OCR worker processes, 0 runs everything in this process')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Results per database transaction / output write')
+        parser.add_argument('--output', default=None,
+                            help='Also write results to a .csv file or a .parquet dataset directory')
+        parser.add_argument('--no-db', action='store_true', help='Do not create MedicalReport rows')
+        parser.add_argument('--ledger', default='code_reports.ledger.jsonl',
+                            help='Progress ledger, sources recorded there are skipped on the next run')
+        parser.add_argument('--restart', action='store_true', help='Ignore and truncate the existing ledger')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many files')
+
+    def handle(self, *args, **options):
+        if options['no_db'] and not options['output']:
+            raise CommandError("--no-db needs --output, results would be discarded")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        if options['restart'] and os.path.exists(options['ledger']):
+            os.remove(options['ledger'])
+
+        self.ledger = ProgressLedger(options['ledger'])
+        self.output = open_output(options['output']) if options['output'] else None
+        self.save_db = not options['no_db']
+        self.batch_size = options['batch_size']
+        self.pending = []
+        self.stats = {'ok': 0, 'empty': 0, 'error': 0, 'skipped': 0, 'saved': 0}
+        self.start = time.perf_counter()
+
+        sources = self.iter_todo(options['inputs'], options['limit'])
+        try:
+            if options['workers'] > 0:
+                self.run_pool(sources, options['workers'])
+            else:
+                for source in sources:
+                    self.collect(code_source(source))
+            self.flush()
+        finally:
+            close_archives()
+            self.ledger.close()
+            if self.output:
+                self.output.close()
+
+        done = sum(self.stats[s] for s in ('ok', 'empty', 'error'))
+        elapsed = time.perf_counter() - self.start
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {done} files in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.2f} files/s): "
+            f"{self.stats['ok']} coded, {self.stats['empty']} empty, {self.stats['error']} failed, "
+            f"{self.stats['saved']} reports saved, {self.stats['skipped']} skipped from ledger"
+        ))
+
+    def iter_todo(self, inputs, limit):
+        count = 0
+        for source in iter_sources(inputs):
+            if source.id in self.ledger:
+                self.stats['skipped'] += 1
+                continue
+            if limit is not None and count >= limit:
+                return
+            count += 1
+            yield source
+
+    def run_pool(self, sources, workers):
+        """Keep at most 2 jobs per worker in flight while walking the inputs lazily."""
+        max_in_flight = workers * 2
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_ocr_worker,
+            # Batch runs alone, so it keeps normal priority
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'medical_coding_ai.settings'), 0),
+        ) as pool:
+            in_flight = set()
+            try:
+                for source in sources:
+                    in_flight.add(pool.submit(code_source, source))
+                    if len(in_flight) >= max_in_flight:
+                        self.collect_finished(wait(in_flight, return_when=FIRST_COMPLETED).done, in_flight)
+                self.collect_finished(wait(in_flight).done, in_flight)
+            except BrokenProcessPool:
+                # A worker died (killed, out of memory, crashed in OCR): keep every
+                # result that came back, the ledger lets the next run resume after them
+                self.collect_finished([f for f in in_flight if f.done() and not f.cancelled()
+                                       and f.exception() is None], in_flight)
+                self.flush()
+                raise CommandError("A worker process died, finished results were saved. "
+                                   "Run the command again to resume.")
+
+    def collect_finished(self, futures, in_flight):
+        for future in futures:
+            in_flight.discard(future)
+            self.collect(future.result())
+
+    def collect(self, result):
+        self.stats[result['status']] += 1
+        if result['status'] == 'error':
+            self.stderr.write(f"{result['source']}: {result['error']}")
+        self.pending.append(result)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Commit a batch: database first, then output, then the ledger."""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        if self.save_db:
+            self.stats['saved'] += save_results(batch)
+        if self.output:
+            self.output.write([output_row(r) for r in batch])
+        self.ledger.record(batch)
+
+        done = sum(self.stats[s] for s in ('ok', 'empty', 'error'))
+        elapsed = time.perf_counter() - self.start
+        self.stdout.write(f"{done} files, {done / elapsed if elapsed else 0:.2f} files/s")
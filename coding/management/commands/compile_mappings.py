@@ -0,0 +1,34 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.mapping_store import COMPILED_MAPPING_FILES, MAPPING_FILES, MappingStore, write_mapping_store
+from coding.matching import MAPPING_PREPROCESSORS, MAPPING_RULES_VERSIONS
+
+
+class Command(BaseCommand):
+    help = "Compile the CPT/ICD JSON mappings into the binary format workers mmap at startup."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['cpt', 'icd', 'all'], default='all')
+
+    def handle(self, *args, **options):
+        kinds = ['cpt', 'icd'] if options['kind'] == 'all' else [options['kind']]
+        for kind in kinds:
+            json_path, bin_path = MAPPING_FILES[kind], COMPILED_MAPPING_FILES[kind]
+            if not os.path.exists(json_path):
+                message = f"Mapping not found: {json_path}"
+                if options['kind'] != 'all':
+                    raise CommandError(message)
+                self.stderr.write(f"Skipping {kind}: {message}")
+                continue
+
+            start = time.perf_counter()
+            size = write_mapping_store(json_path, bin_path, MAPPING_PREPROCESSORS[kind], kind,
+                                       MAPPING_RULES_VERSIONS[kind])
+            store = MappingStore.open(bin_path)
+            self.stdout.write(self.style.SUCCESS(
+                f"{kind}: {len(store)} keys, {store.n_tokens} tokens, {size / 1024:.1f} KB "
+                f"-> {bin_path} ({time.perf_counter() - start:.2f}s)"
+            ))
@@ -0,0 +1,44 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.synthetic import FORMATS, RENDER_FORMATS, iter_reports, load_vocabularies, write_corpus
+
+
+class Command(BaseCommand):
+    help = ("Generate synthetic radiology reports with ground-truth CPT/ICD codes as chunked "
+            "JSONL or CSV, optionally rendering some of them to PNG/PDF for the OCR path.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help="Reports to generate.")
+        parser.add_argument('--seed', type=int, default=0, help="Same seed and count, same corpus.")
+        parser.add_argument('--output', default=os.path.join(settings.BASE_DIR, 'dataset', 'synthetic'),
+                            help="Directory for the part files (and documents/).")
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--rows-per-file', type=int, default=100000)
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Reports per generation task.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Generator processes.")
+        parser.add_argument('--render', choices=RENDER_FORMATS, help="Also render reports as PNG or PDF.")
+        parser.add_argument('--render-every', type=int, default=100, help="Render one report in N.")
+
+    def handle(self, *args, **options):
+        try:
+            vocab = load_vocabularies()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Drawing from {len(vocab['cpt'])} CPT exams and {len(vocab['icd'])} ICD diagnoses")
+
+        start = time.perf_counter()
+        rows = iter_reports(
+            options['count'], seed=options['seed'], chunk_size=options['chunk_size'], workers=options['workers'],
+            vocab=vocab, render=options['render'], render_every=options['render_every'],
+            document_dir=os.path.join(options['output'], 'documents'),
+        )
+        paths = write_corpus(rows, options['output'], options['format'], options['rows_per_file'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['count']} reports to {len(paths)} {options['format']} files in {options['output']} "
+            f"in {elapsed:.1f} s ({options['count'] / elapsed:,.0f} reports/s)"
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.importtime import STARTUP_BUDGET_US, TEXT_PATH_MODULES, measure_imports, slowest_imports
+
+
+class Command(BaseCommand):
+    help = "Measure the import time of the text path with `python -X importtime` in a fresh process."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', action='append', dest='modules',
+                            help=f"Module to import, repeatable (default: {', '.join(TEXT_PATH_MODULES)}).")
+        parser.add_argument('--top', type=int, default=15, help="How many of the slowest imports to list.")
+        parser.add_argument('--check', action='store_true',
+                            help="Fail when an imaging module is loaded or coding.views exceeds the budget.")
+
+    def handle(self, *args, **options):
+        try:
+            result = measure_imports(options['modules'] or TEXT_PATH_MODULES)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        timings = result['timings']
+        for module, (own, cumulative) in slowest_imports(timings, options['top']):
+            self.stdout.write(f"{cumulative / 1000:10.1f} ms  {own / 1000:8.1f} ms  {module}")
+        self.stdout.write(f"Total {result['total_us'] / 1000:.1f} ms across {len(timings)} modules")
+
+        views_us = timings.get('coding.views', (0, 0))[1]
+        if result['loaded']:
+            message = f"Imaging modules loaded on the text path: {', '.join(result['loaded'])}"
+        elif views_us > STARTUP_BUDGET_US:
+            message = f"coding.views took {views_us / 1000:.1f} ms, budget is {STARTUP_BUDGET_US / 1000:.0f} ms"
+        else:
+            self.stdout.write(self.style.SUCCESS("No imaging modules loaded"))
+            return
+        if options['check']:
+            raise CommandError(message)
+        self.stdout.write(self.style.WARNING(message))
@@ -0,0 +1,37 @@
+import os
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.catalogue import load_catalogue
+from coding.mapping_store import MAPPING_FILES
+from coding.matching import MAPPING_PREPROCESSORS
+
+
+class Command(BaseCommand):
+    help = "Bulk-load the CPT/ICD JSON mappings into the database catalogue and its search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['cpt', 'icd', 'all'], default='all')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        kinds = ['cpt', 'icd'] if options['kind'] == 'all' else [options['kind']]
+        for kind in kinds:
+            json_path = MAPPING_FILES[kind]
+            if not os.path.exists(json_path):
+                message = f"Mapping not found: {json_path}"
+                if options['kind'] != 'all':
+                    raise CommandError(message)
+                self.stderr.write(f"Skipping {kind}: {message}")
+                continue
+
+            start = time.perf_counter()
+            with open(json_path, 'r', encoding='utf-8') as f:
+                mapping = json.load(f)
+            descriptions, codes = load_catalogue(kind, mapping, MAPPING_PREPROCESSORS[kind], options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{kind}: {descriptions} descriptions loaded, {codes} new codes "
+                f"({time.perf_counter() - start:.2f}s)"
+            ))
@@ -0,0 +1,117 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from coding.executors import ocr_lane, text_lane
+from coding.loadtest import (
+    MAX_ERROR_RATE, MIN_THROUGHPUT_GAIN, SLO_P99_MS, HttpTarget, InProcessTarget, Workload,
+    find_capacity, find_samples, parse_mix, run_closed, run_open,
+)
+
+
+class Command(BaseCommand):
+    help = ("Drive the predict endpoints with a mix of synthetic text reports and sample documents, "
+            "report latency, errors and throughput, or search for the saturation point with --capacity.")
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--url', help="Base URL of a running server.")
+        target.add_argument('--in-process', action='store_true',
+                            help="Send the requests through the test client instead. The predict views save "
+                                 "every report, so this needs --settings with a scratch database.")
+        parser.add_argument('--mode', choices=['closed', 'open'], default='closed',
+                            help="closed: fixed concurrency, open: fixed arrival rate.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Clients in closed mode.")
+        parser.add_argument('--rate', type=float, default=10.0, help="Requests per second in open mode.")
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds per run or capacity step.")
+        parser.add_argument('--mix', default='text=9,image=1', help="Request mix, e.g. text=9,image=1.")
+        parser.add_argument('--samples', action='append',
+                            help="Image/PDF file or directory for image requests, repeatable (default: media/).")
+        parser.add_argument('--fresh-uploads', action='store_true',
+                            help="Make every upload unique so cached OCR results are not reused.")
+        parser.add_argument('--seed', type=int, help="Seed for a reproducible request sequence.")
+        parser.add_argument('--capacity', action='store_true',
+                            help="Double the concurrency (or rate) from --start until saturation.")
+        parser.add_argument('--start', type=float, default=1, help="First capacity step level.")
+        parser.add_argument('--max-level', type=float, default=64, help="Last capacity step level.")
+        parser.add_argument('--slo-p99-ms', type=float, default=SLO_P99_MS, help="p99 latency target.")
+        parser.add_argument('--max-error-rate', type=float, default=MAX_ERROR_RATE, help="Error rate target.")
+        parser.add_argument('--min-gain', type=float, default=MIN_THROUGHPUT_GAIN,
+                            help="Throughput gain a step needs over the best one so far.")
+        parser.add_argument('--json', dest='json_path', help="Also write the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        if options['in_process']:
+            self.check_scratch_database()
+        try:
+            mix = parse_mix(options['mix'])
+            samples = find_samples(options['samples'] or [os.path.join(settings.BASE_DIR, 'media')])
+            workload = Workload(mix, samples, seed=options['seed'], fresh_uploads=options['fresh_uploads'])
+        except (ValueError, OSError) as e:
+            raise CommandError(str(e))
+        target = HttpTarget(options['url']) if options['url'] else InProcessTarget()
+        self.stdout.write(f"Mix {workload.mix} against {options['url'] or 'the in-process client'}, "
+                          f"{len(workload.samples)} sample documents")
+
+        try:
+            report = self.run(target, workload, options)
+        finally:
+            # In-process runs started the lanes' pools, stop them before exit
+            ocr_lane.shutdown()
+            text_lane.shutdown()
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        if options['capacity']:
+            self.write_capacity(report)
+
+    def run(self, target, workload, options):
+        if options['capacity']:
+            return find_capacity(
+                target, workload, mode=options['mode'], start=options['start'], max_level=options['max_level'],
+                step_duration=options['duration'], max_error_rate=options['max_error_rate'],
+                slo_p99_ms=options['slo_p99_ms'], min_gain=options['min_gain'], on_step=self.write_step,
+            )
+        if options['mode'] == 'closed':
+            report = run_closed(target, workload, options['concurrency'], options['duration'])
+        else:
+            report = run_open(target, workload, options['rate'], options['duration'], seed=options['seed'])
+        self.write_step(report)
+        return report
+
+    def check_scratch_database(self):
+        name = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+        if os.path.realpath(str(name)) == os.path.realpath(os.path.join(settings.BASE_DIR, 'db.sqlite3')):
+            raise CommandError("--in-process would write reports to the project database, "
+                               "run it with --settings pointing DATABASES at a scratch database")
+
+    def write_step(self, step):
+        unit = 'clients' if step['mode'] == 'closed' else 'req/s'
+        self.stdout.write(
+            f"{step['level']:>7g} {unit:7}  {step['throughput']:8.2f} ok/s  "
+            f"p50 {step['p50_ms']} ms  p90 {step['p90_ms']} ms  p99 {step['p99_ms']} ms  "
+            f"errors {step['error_rate']:.1%} of {step['requests']}"
+        )
+        for kind, stats in step['by_kind'].items():
+            self.stdout.write(f"{'':17}{kind:6} {stats['throughput']:8.2f} ok/s  p99 {stats['p99_ms']} ms  "
+                              f"errors {stats['error_rate']:.1%}")
+        for error, count in step['errors'].items():
+            self.stdout.write(self.style.WARNING(f"{'':17}{count} x {error}"))
+
+    def write_capacity(self, report):
+        saturation = report['saturation']
+        if saturation:
+            self.stdout.write(f"Saturated at {saturation['level']:g}: {saturation['reason']}")
+        else:
+            self.stdout.write(self.style.WARNING("No saturation up to --max-level, raise it to find the limit"))
+        sustainable = report['sustainable']
+        if sustainable is None:
+            raise CommandError("Even the first step missed the targets")
+        self.stdout.write(self.style.SUCCESS(
+            f"Sustainable: {sustainable['level']:g} {'clients' if report['mode'] == 'closed' else 'req/s'}, "
+            f"{sustainable['throughput']} ok/s at p99 {sustainable['p99_ms']} ms"
+        ))
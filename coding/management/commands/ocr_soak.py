@@ -0,0 +1,62 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.executors import OCR_MAX_WORKERS, ocr_lane
+from coding.loadtest import find_samples
+from coding.memtrack import ocr_with_rss, rss_growth
+
+
+class Command(BaseCommand):
+    help = ("OCR the sample documents thousands of times through the OCR lane and fail "
+            "when a worker's RSS keeps growing after the warm-up.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000, help="OCR jobs to run.")
+        parser.add_argument('--samples', action='append',
+                            help="Image/PDF file or directory, repeatable (default: media/).")
+        parser.add_argument('--warmup', type=int, default=100,
+                            help="Jobs before the RSS baseline is taken (caches, allocator arenas).")
+        parser.add_argument('--max-growth-mb', type=float, default=64.0,
+                            help="RSS a worker may gain after the warm-up.")
+        parser.add_argument('--in-process', action='store_true',
+                            help="OCR in this process instead of the OCR lane.")
+
+    def handle(self, *args, **options):
+        samples = find_samples(options['samples'] or [os.path.join(settings.BASE_DIR, 'media')])
+        if not samples:
+            raise CommandError("No sample documents found")
+        count = options['count']
+        jobs = [samples[i % len(samples)] for i in range(count)]
+
+        started = time.perf_counter()
+        if options['in_process']:
+            results = [ocr_with_rss(path) for path in jobs]
+        else:
+            # One caller per OCR process, so the lane never rejects
+            with ThreadPoolExecutor(OCR_MAX_WORKERS) as callers:
+                results = list(callers.map(lambda path: ocr_lane.run(ocr_with_rss, path), jobs))
+            ocr_lane.shutdown()
+        elapsed = time.perf_counter() - started
+        empty = sum(1 for _, _, chars in results if not chars)
+        self.stdout.write(f"{count} OCR jobs over {len(samples)} samples in {elapsed:.1f} s "
+                          f"({count / elapsed:.1f} jobs/s), {empty} returned no text")
+
+        growth = rss_growth([(pid, rss) for pid, rss, _ in results], options['warmup'])
+        if not growth:
+            raise CommandError("No jobs after the warm-up, raise --count or lower --warmup")
+        limit = options['max_growth_mb'] * 2**20
+        leaking = []
+        for pid, g in sorted(growth.items()):
+            self.stdout.write(f"pid {pid}: {g['jobs']} jobs, RSS {g['baseline'] / 2**20:.1f} -> "
+                              f"{g['last'] / 2**20:.1f} MiB (max {g['max'] / 2**20:.1f}), "
+                              f"{g['per_job'] / 1024:+.1f} KiB/job")
+            if g['max'] - g['baseline'] > limit:
+                leaking.append(pid)
+        if leaking:
+            raise CommandError(f"RSS of {len(leaking)} worker(s) grew more than {options['max_growth_mb']} MiB "
+                               f"after the warm-up: {leaking}")
+        self.stdout.write(self.style.SUCCESS(f"RSS stayed within {options['max_growth_mb']} MiB"))
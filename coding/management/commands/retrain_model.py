@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_model.linear_model import LINEAR_MODEL_PATH, LinearCPTModel, train_streaming
+from coding.models import MedicalReport
+
+# Report fields that describe the exam, in the order they are concatenated
+TEXT_FIELDS = ('exam', 'clinical_indication')
+
+
+def report_training_text(row):
+    """Join the exam text fields of a report row, skipping '-' placeholders."""
+    parts = [row[field] for field in TEXT_FIELDS if row[field] and row[field] != '-']
+    return " ".join(parts).strip()
+
+
+def iter_report_batches(last_id, batch_size, stats):
+    """Keyset-paginate coded reports with id > last_id, one batch per query."""
+    while True:
+        rows = list(
+            MedicalReport.objects
+            .filter(id__gt=last_id, cpt_code__isnull=False)
+            .order_by('id')
+            .values('id', 'cpt_code_id', *TEXT_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        stats['last_id'] = last_id
+
+        texts, labels = [], []
+        for row in rows:
+            text = report_training_text(row)
+            if text:
+                texts.append(text)
+                labels.append(row['cpt_code_id'])
+        if texts:
+            yield texts, labels
+
+
+class Command(BaseCommand):
+    help = "Incrementally train the linear CPT model on MedicalReport rows coded since the last checkpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=LINEAR_MODEL_PATH, help='Served model artifact to update')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--since-id', type=int, default=None,
+                            help='Override the checkpoint stored in the artifact')
+        parser.add_argument('--dry-run', action='store_true', help='Train but do not swap the artifact')
+
+    def handle(self, *args, **options):
+        path = options['model']
+        try:
+            model = LinearCPTModel.load(path)
+        except FileNotFoundError:
+            model = None
+            self.stdout.write(f"No model at {path}, training a new one.")
+
+        last_id = options['since_id']
+        if last_id is None:
+            last_id = int(model.metadata.get('last_report_id', 0)) if model else 0
+
+        pending = MedicalReport.objects.filter(id__gt=last_id, cpt_code__isnull=False)
+        classes = sorted(set(pending.values_list('cpt_code_id', flat=True).distinct()))
+        if not classes:
+            self.stdout.write(f"No coded reports after id {last_id}, model unchanged.")
+            return
+
+        start = time.perf_counter()
+        stats = {'last_id': last_id}
+        try:
+            model, train_stats = train_streaming(
+                iter_report_batches(last_id, options['batch_size'], stats),
+                classes,
+                model=model,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        model.metadata['last_report_id'] = stats['last_id']
+        elapsed = time.perf_counter() - start
+        accuracy = train_stats['progressive_accuracy']
+        self.stdout.write(
+            f"Trained on {train_stats['samples']} reports (ids {last_id + 1}..{stats['last_id']}) "
+            f"in {elapsed:.2f}s" + (f", progressive accuracy {accuracy:.2f}" if accuracy is not None else "")
+        )
+
+        if options['dry_run']:
+            self.stdout.write("Dry run, artifact not replaced.")
+            return
+        model.save(path)
+        self.stdout.write(self.style.SUCCESS(f"Model swapped in at {path}"))
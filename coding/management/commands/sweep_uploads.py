@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.uploads import UPLOAD_TEMP_MAX_AGE, sweep_upload_temp_dir, upload_temp_dir
+
+
+class Command(BaseCommand):
+    help = "Remove upload temp files left behind by crashed or killed workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=UPLOAD_TEMP_MAX_AGE,
+                            help="Only remove files older than this many seconds.")
+
+    def handle(self, *args, **options):
+        if options['max_age'] < 0:
+            raise CommandError("--max-age must not be negative")
+        removed = sweep_upload_temp_dir(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} files from {upload_temp_dir()}"))
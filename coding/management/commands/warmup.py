@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from coding.warmup import STEPS, WARMUP_STEPS, process_memory, run_warmup
+
+
+class Command(BaseCommand):
+    help = "Run the pre-fork warm-up and report per-step time, request latency and memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--step', action='append', dest='steps', choices=sorted(STEPS),
+                            help=f"Step to run, repeatable (default: {', '.join(WARMUP_STEPS)}).")
+
+    def handle(self, *args, **options):
+        before = process_memory()
+        state = run_warmup(options['steps'])
+        after = process_memory()
+
+        for name, ms in state['steps'].items():
+            failed = state['failed'].get(name)
+            self.stdout.write(f"{name:12} {ms:10.1f} ms" + (f"  FAILED: {failed}" if failed else ""))
+        self.stdout.write(f"First request {state['first_request_ms']} ms, warm request {state['warm_request_ms']} ms")
+        rss_before, rss_after = before.get('rss', before.get('max_rss', 0)), after.get('rss', after.get('max_rss', 0))
+        self.stdout.write(f"RSS {rss_before / 2**20:.1f} MiB -> {rss_after / 2**20:.1f} MiB, "
+                          f"{state['frozen_objects']} objects frozen")
+        if state['failed']:
+            raise CommandError(f"{len(state['failed'])} warm-up steps failed")
+        self.stdout.write(self.style.SUCCESS("Warm-up complete"))
@@ -0,0 +1,294 @@
+"""Compiled binary form of the CPT/ICD code mappings.
+
+``build_mapping_store`` turns a ``{description: code}`` JSON mapping into a
+single versioned file holding the normalized keys (deduplicated the way the
+matchers' ``{normalize(k): (k, v)}`` dicts were), per-key token id
+arrays, the code strings, one shared string table and a token -> entry
+inverted index. ``MappingStore`` opens it with ``mmap`` read-only and
+reads the arrays in place through ``numpy.frombuffer``, so every worker
+process shares the same page-cache copy instead of building its own
+Python dicts.
+
+The header records the version of the preprocessor rules that
+normalized the keys. A file compiled under other rules is stale even
+when the source JSON has not changed.
+
+File layout (little endian, every section 8-byte aligned)::
+
+    header      magic, version, kind, rules version, counts, sha256 of the source JSON
+    sections    (offset, length) table, see SECTIONS
+    str_offsets uint32[n_strings + 1]   string table offsets
+    str_data    bytes                   UTF-8 string table
+    entry_key   uint32[n]               original description string id
+    entry_norm  uint32[n]               normalized description string id
+    entry_code  uint32[n]               code string id
+    norm_order  uint32[n]               entries sorted by normalized key
+    tok_offsets uint32[n + 1]           entry -> range in tok_ids
+    tok_ids     uint32[...]             token ids of each normalized key
+    vocab       uint32[n_tokens]        token id -> string id, sorted
+    post_offsets uint32[n_tokens + 1]   token -> range in postings
+    postings    uint32[...]             entry ids containing the token
+"""
+import os
+import json
+import mmap
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAPPING_FILES = {
+    'cpt': os.path.join(settings.BASE_DIR, 'scripts', 'formatted_cpt_mapping.json'),
+    'icd': os.path.join(settings.BASE_DIR, 'scripts', 'formatted_icd10_mapping.json'),
+}
+COMPILED_MAPPING_FILES = {kind: os.path.splitext(path)[0] + '.bin' for kind, path in MAPPING_FILES.items()}
+
+MAGIC = b"MCMAP\0\0\0"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sI8sIIII32s")
+SECTIONS = (
+    "str_offsets", "str_data", "entry_key", "entry_norm", "entry_code", "norm_order",
+    "tok_offsets", "tok_ids", "vocab", "post_offsets", "postings",
+)
+SECTION_TABLE = struct.Struct("<" + "QQ" * len(SECTIONS))
+
+
+def source_digest(data):
+    return hashlib.sha256(data).digest()
+
+
+def _align(buffer):
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def build_mapping_store(mapping, preprocess, kind, source_sha256=b"", rules_version=0):
+    """Compile ``mapping`` into the binary format and return it as bytes."""
+    strings = {}
+
+    def intern(value):
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    # Keys that normalize to the same text collapse, the last one wins
+    normalized = {preprocess(key): (key, code) for key, code in mapping.items()}
+
+    entry_key, entry_norm, entry_code, entry_tokens = [], [], [], []
+    for norm, (key, code) in normalized.items():
+        entry_key.append(intern(key))
+        entry_norm.append(intern(norm))
+        entry_code.append(intern(str(code).strip()))
+        entry_tokens.append(list(dict.fromkeys(norm.split())))
+
+    vocab_tokens = sorted({t for tokens in entry_tokens for t in tokens}, key=lambda t: t.encode("utf-8"))
+    token_ids = {t: i for i, t in enumerate(vocab_tokens)}
+    vocab = [intern(t) for t in vocab_tokens]
+    encoded = [s.encode("utf-8") for s in strings]
+
+    n = len(entry_key)
+    tok_offsets = np.zeros(n + 1, dtype=np.uint32)
+    tok_ids = []
+    postings = [[] for _ in vocab_tokens]
+    for i, tokens in enumerate(entry_tokens):
+        for token in tokens:
+            tok_ids.append(token_ids[token])
+            postings[token_ids[token]].append(i)
+        tok_offsets[i + 1] = len(tok_ids)
+    post_offsets = np.zeros(len(vocab_tokens) + 1, dtype=np.uint32)
+    np.cumsum([len(p) for p in postings], out=post_offsets[1:])
+    norm_order = sorted(range(n), key=lambda i: encoded[entry_norm[i]])
+
+    str_offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(s) for s in encoded], out=str_offsets[1:])
+    sections = {
+        "str_offsets": str_offsets.tobytes(),
+        "str_data": b"".join(encoded),
+        "entry_key": np.asarray(entry_key, dtype=np.uint32).tobytes(),
+        "entry_norm": np.asarray(entry_norm, dtype=np.uint32).tobytes(),
+        "entry_code": np.asarray(entry_code, dtype=np.uint32).tobytes(),
+        "norm_order": np.asarray(norm_order, dtype=np.uint32).tobytes(),
+        "tok_offsets": tok_offsets.tobytes(),
+        "tok_ids": np.asarray(tok_ids, dtype=np.uint32).tobytes(),
+        "vocab": np.asarray(vocab, dtype=np.uint32).tobytes(),
+        "post_offsets": post_offsets.tobytes(),
+        "postings": np.asarray([i for p in postings for i in p], dtype=np.uint32).tobytes(),
+    }
+
+    out = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, kind.encode()[:8], rules_version, n, len(encoded),
+                                len(vocab_tokens), source_sha256.ljust(32, b"\0")))
+    table_at = len(out)
+    out.extend(b"\0" * SECTION_TABLE.size)
+    table = []
+    for name in SECTIONS:
+        _align(out)
+        table.extend((len(out), len(sections[name])))
+        out.extend(sections[name])
+    out[table_at:table_at + SECTION_TABLE.size] = SECTION_TABLE.pack(*table)
+    return bytes(out)
+
+
+def write_mapping_store(json_path, out_path, preprocess, kind, rules_version=0):
+    """Compile a JSON mapping file and atomically replace ``out_path``."""
+    with open(json_path, "rb") as f:
+        raw = f.read()
+    data = build_mapping_store(json.loads(raw), preprocess, kind, source_digest(raw), rules_version)
+    # A temp file of its own, concurrent builds never write to the same one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out_path)),
+                                    prefix=f".{os.path.basename(out_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return len(data)
+
+
+class MappingStore:
+    """Read-only accessor over a compiled mapping held in a buffer or mmap."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        magic, version, kind, rules_version, n, n_strings, n_tokens, sha = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a compiled code mapping or unsupported version")
+        self.kind = kind.rstrip(b"\0").decode()
+        self.rules_version = rules_version
+        self.source_sha256 = sha
+        self.n_tokens = n_tokens
+        table = SECTION_TABLE.unpack_from(buffer, HEADER.size)
+        views = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = table[2 * i], table[2 * i + 1]
+            if name == "str_data":
+                views[name] = memoryview(buffer)[offset:offset + length]
+            else:
+                views[name] = np.frombuffer(buffer, dtype=np.uint32, count=length // 4, offset=offset)
+        self.__dict__.update(views)
+        self._n = n
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self._n
+
+    def string(self, sid):
+        start, end = self.str_offsets[sid], self.str_offsets[sid + 1]
+        return bytes(self.str_data[start:end]).decode("utf-8")
+
+    def key(self, i):
+        return self.string(self.entry_key[i])
+
+    def norm_key(self, i):
+        return self.string(self.entry_norm[i])
+
+    def code(self, i):
+        return self.string(self.entry_code[i])
+
+    def tokens(self, i):
+        ids = self.tok_ids[self.tok_offsets[i]:self.tok_offsets[i + 1]]
+        return [self.string(self.vocab[t]) for t in ids]
+
+    def normalized_items(self):
+        """Yield (normalized key, (original key, code)) like the old dict view."""
+        for i in range(self._n):
+            yield self.norm_key(i), (self.key(i), self.code(i))
+
+    def find(self, norm_text):
+        """Entry index whose normalized key equals ``norm_text``, else -1."""
+        target = norm_text.encode("utf-8")
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            sid = self.entry_norm[self.norm_order[mid]]
+            probe = bytes(self.str_data[self.str_offsets[sid]:self.str_offsets[sid + 1]])
+            if probe < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._n and self.norm_key(self.norm_order[lo]) == norm_text:
+            return int(self.norm_order[lo])
+        return -1
+
+    def token_id(self, token):
+        target = token.encode("utf-8")
+        lo, hi = 0, self.n_tokens
+        while lo < hi:
+            mid = (lo + hi) // 2
+            sid = self.vocab[mid]
+            if bytes(self.str_data[self.str_offsets[sid]:self.str_offsets[sid + 1]]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_tokens and self.string(self.vocab[lo]) == token:
+            return lo
+        return -1
+
+    def postings_for(self, token):
+        tid = self.token_id(token)
+        if tid < 0:
+            return self.postings[:0]
+        return self.postings[self.post_offsets[tid]:self.post_offsets[tid + 1]]
+
+    def entries_with_any(self, tokens):
+        """Sorted entry ids whose normalized key contains at least one token."""
+        lists = [self.postings_for(t) for t in set(tokens)]
+        lists = [p for p in lists if len(p)]
+        if not lists:
+            return np.empty(0, dtype=np.uint32)
+        return np.unique(np.concatenate(lists))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def load_mapping_store(kind, json_path, bin_path, preprocess, rules_version=0):
+    """Shared store for a mapping, cached per process.
+
+    Uses the mmap'd compiled file when it was built from the current JSON
+    with ``rules_version`` of the preprocessor, otherwise compiles the
+    JSON in memory (same API, per-process copy).
+    Returns None when the JSON mapping does not exist.
+    """
+    try:
+        st = os.stat(json_path)
+    except FileNotFoundError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _stores.get(kind)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    with _stores_lock:
+        cached = _stores.get(kind)
+        if cached and cached[0] == key:
+            return cached[1]
+        with open(json_path, "rb") as f:
+            raw = f.read()
+        digest = source_digest(raw)
+        store = None
+        if os.path.exists(bin_path):
+            try:
+                store = MappingStore.open(bin_path)
+                if store.source_sha256 != digest or store.rules_version != rules_version:
+                    logger.warning(f"{bin_path} is stale, compiling {json_path} in memory")
+                    store = None
+            except (ValueError, OSError, struct.error) as e:
+                logger.error(f"Failed to open {bin_path}: {e}")
+                store = None
+        if store is None:
+            store = MappingStore(build_mapping_store(json.loads(raw), preprocess, kind, digest, rules_version))
+        _stores[kind] = (key, store)
+        return store
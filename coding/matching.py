@@ -0,0 +1,347 @@
+"""CPT / ICD-10 code matching.
+
+Text normalization, the shared code mappings and the CPT and ICD-10
+matchers. Nothing here reads report files or images.
+"""
+import re
+
+from fuzzywuzzy import fuzz
+
+from .catalogue import catalogue_candidates, catalogue_loaded
+from . import deadlines
+from .cpt_attributes import LATERALITY, feature_score, get_cpt_attribute_index, parse_cpt_attributes
+from .diagnosis_spotter import get_diagnosis_spotter
+from .negation import find_scopes, remove_scopes
+from .normalization import normalize
+from .embedding_index import get_embedding_index
+from .mapping_store import COMPILED_MAPPING_FILES, MAPPING_FILES, load_mapping_store
+
+MODALITY_PREFIXES = ("XR", "MRI", "NM", "US", "IVC", "CT", "PET", "MRA")
+
+# Nearest mapping keys scored by the fuzzy steps when an embedding index is built
+EMBEDDING_CANDIDATES = 50
+# Rows fetched from the database catalogue (FTS5, bm25 ranked) for fuzzy scoring
+CATALOGUE_CANDIDATES = 200
+# Fragments longer than this are scored through their spotted diagnoses only
+SPOTTING_FRAGMENT_WORDS = 6
+
+# ---------- TEXT NORMALIZATION ----------
+def clean_diagnosis_text(text, drop_scopes=True, scopes=None):
+    """Cleans and simplifies diagnostic text.
+
+    Report text loses its negated and uncertain scopes: ``scopes`` when
+    the caller has already found them (offsets into ``text``), otherwise
+    find_scopes(text). Catalogue descriptions ("... suspected tuberculosis
+    ruled out") are worded the same way but must keep every word, they go
+    through normalize_diagnosis_key() instead.
+    """
+    if not text:
+        return ""
+
+    # Drop negated and uncertain scopes ("no fracture", "rule out pneumonia")
+    if drop_scopes:
+        text = remove_scopes(text, find_scopes(text) if scopes is None else scopes)
+
+    text = re.sub(r"[^\x00-\x7F]+", " ", text)  # Remove non-ASCII
+    text = re.sub(r"[^\w\s.,;/-]", "", text)  # Remove unwanted characters
+    text = re.sub(r"\s+", " ", text).strip().lower()
+
+    # Remove vague phrases
+    text = re.sub(r"\b(bone alignment|joint spaces|soft tissues|clinical|see above|maintained|not associated with)\b", "", text, flags=re.IGNORECASE)
+
+    # Remove severity adjectives
+    text = re.sub(r"\b(mild|moderate|severe|acute|chronic)\b", "", text, flags=re.IGNORECASE)
+
+    # Normalize punctuation
+    text = re.sub(r"[;:]", ".", text)
+    text = re.sub(r"[^\w\s.,]", "", text)
+    text = re.sub(r"\s+", " ", text).strip()
+
+    return text
+
+
+def normalize_diagnosis_key(key):
+    """Normalized form of an ICD-10 catalogue description, with no negation scoping"""
+    return clean_diagnosis_text(key, drop_scopes=False).lower()
+
+# ---------- CODE MAPPINGS ----------
+# Mapping keys are stored in the normalized form each matcher queries with
+MAPPING_PREPROCESSORS = {
+    'cpt': normalize,
+    'icd': normalize_diagnosis_key,
+}
+# Bump a kind's version whenever its preprocessor gives other keys,
+# compiled stores of an older version are then recompiled
+MAPPING_RULES_VERSIONS = {
+    'cpt': 1,
+    'icd': 1,
+}
+
+
+def get_code_mapping(kind):
+    """Shared compiled CPT/ICD mapping, mmap'd when `compile_mappings` has run."""
+    return load_mapping_store(kind, MAPPING_FILES[kind], COMPILED_MAPPING_FILES[kind],
+                              MAPPING_PREPROCESSORS[kind], MAPPING_RULES_VERSIONS[kind])
+
+# ---------- EXAM DESCRIPTION DETECTION ----------
+def normalize_exam_description(patient_data):
+    """Extract and normalize exam description from patient data"""
+    if not patient_data:
+        return ""
+    
+    # Try multiple fields in priority order
+    for field in ['ordex', 'exam', 'procedure', 'clinical_indication']:
+        text = patient_data.get(field, '').strip()
+        if text and any(prefix in text.upper() for prefix in MODALITY_PREFIXES):
+            return text
+    
+    # Fallback: Search entire text for modality patterns
+    full_text = " ".join(str(v) for v in patient_data.values() if v != '-')
+    for prefix in MODALITY_PREFIXES:
+        if prefix in full_text.upper():
+            match = re.search(rf'({prefix}[^\n]+)', full_text, re.IGNORECASE)
+            if match:
+                return match.group(1).strip()
+    
+    # Final fallback - return procedure if exists
+    if patient_data.get('procedure', '-') != '-':
+        return patient_data['procedure']
+    
+    return ""
+
+# ---------- CPT MATCHING ----------
+def match_cpt_code(description, threshold=80, top_n=1):
+    """Enhanced CPT code matching with better fallback logic"""
+    if not description or not isinstance(description, str) or len(description.strip()) < 3:
+        print(f"[WARN] Invalid description provided: {description}")
+        return [{
+            "code": "N/A", 
+            "description": "Invalid or empty description", 
+            "score": 0
+        }]
+    
+    norm_description = normalize(description)
+    print("[DEBUG] Normalized input description:", norm_description)
+
+    try:
+        store = get_code_mapping('cpt')
+        if store is None:
+            raise FileNotFoundError(MAPPING_FILES['cpt'])
+    except Exception as e:
+        print(f"[ERROR] Failed to load CPT mapping: {e}")
+        return []
+
+    # 1. Strong exact match on the entire normalized description
+    entry = store.find(norm_description)
+    if entry >= 0:
+        print("[DEBUG] Exact match found!")
+        return [{"code": store.code(entry), "description": store.key(entry), "score": 100}]
+
+    # Parse modality, body part, side, views and contrast the way every key was parsed
+    query = parse_cpt_attributes(norm_description)
+    modality = query.modality
+    body_tokens = list(query.body_tokens)
+    body_part = query.body_part
+    side = next((t for t in norm_description.split() if t in LATERALITY), "")
+
+    # Get the number of views (if any)
+    views_match = re.search(r'(min\s*\d+\s*views|\d+\s*views)', norm_description)
+    views = views_match.group(0) if views_match else ""
+
+    # Build keyword combinations
+    keyword_combo = re.sub(r'\s{2,}', ' ', f"{modality} {body_part} {side} {views} {query.contrast_text}").strip()
+    print("[DEBUG] Matching using keyword combo:", keyword_combo)
+
+    # Build alternative candidates
+    candidates = [keyword_combo]
+    if side:
+        alt_combo = re.sub(r'\b' + re.escape(side) + r'\b', "", keyword_combo).strip()
+        alt_combo = re.sub(r'\s{2,}', ' ', alt_combo)
+        candidates.append(alt_combo)
+        print("[DEBUG] Alternative keyword combo without side:", alt_combo)
+
+    # 2. Check for exact matches on candidates
+    for candidate in candidates:
+        entry = store.find(candidate)
+        if entry >= 0:
+            print("[DEBUG] Exact candidate match found for:", candidate)
+            return [{"code": store.code(entry), "description": store.key(entry), "score": 100}]
+
+    # 3. Structured lookup: keys with the same modality and body part,
+    # laterality/views/contrast scored as exact features
+    attribute_index = get_cpt_attribute_index(store)
+    modality_matches = []
+    for entry in attribute_index.candidates(query):
+        norm_key = store.norm_key(entry)
+        score = fuzz.token_sort_ratio(keyword_combo, norm_key)
+        score = max(0, min(100, score + feature_score(query, attribute_index.attributes[entry])))
+        if score >= 70:
+            modality_matches.append({
+                "code": store.code(entry),
+                "description": store.key(entry),
+                "score": score
+            })
+
+    if modality_matches:
+        modality_matches.sort(key=lambda x: -x["score"])
+        print("[DEBUG] Best modality partial match:", modality_matches[0])
+        return [modality_matches[0]]
+
+    # Narrow the fuzzy steps to the nearest keys when an embedding index is built
+    search_map = None
+    index = get_embedding_index('cpt')
+    if index is not None:
+        neighbours = index.search(norm_description, k=EMBEDDING_CANDIDATES)
+        search_map = {normalize(key): (key, code) for key, code, _ in neighbours}
+    elif catalogue_loaded('cpt'):
+        # Otherwise the indexed catalogue query narrows them to the best bm25 rows
+        candidates = catalogue_candidates('cpt', norm_description, CATALOGUE_CANDIDATES)
+        search_map = {norm_key: (key, code) for key, code, norm_key in candidates}
+
+    if not search_map:
+        if deadlines.allows(deadlines.FUZZY_MS):
+            search_map = dict(store.normalized_items())
+        else:
+            # No budget for a scan of every key: only the attribute index's keys of this modality
+            deadlines.degrade('cpt_fuzzy')
+            search_map = {store.norm_key(entry): (store.key(entry), store.code(entry))
+                          for entry in attribute_index.by_modality.get(modality, [])}
+
+    # 4. Fallback fuzzy match on full description
+    matches = []
+    for norm_key, (original_key, code) in deadlines.bounded(search_map.items(), 'cpt_fuzzy'):
+        if modality and parse_cpt_attributes(norm_key).modality != modality:
+            continue
+        score = fuzz.token_sort_ratio(norm_description, norm_key)
+        if score >= threshold:
+            matches.append({
+                "code": code,
+                "description": original_key,
+                "score": score
+            })
+
+    if matches:
+        matches.sort(key=lambda x: -x["score"])
+        print("[DEBUG] Best fuzzy match fallback:", matches[0])
+        return matches[:top_n]
+
+    # 5. Additional fallback: Filter keys with modality and first body token
+    if modality and body_tokens:
+        primary_body = body_tokens[0]
+        fallback_matches = []
+        for norm_key, (original_key, code) in deadlines.bounded(search_map.items(), 'cpt_fuzzy'):
+            attributes = parse_cpt_attributes(norm_key)
+            if attributes.modality == modality and any(t.startswith(primary_body) for t in attributes.body_tokens):
+                score = fuzz.token_sort_ratio(norm_description, norm_key)
+                fallback_matches.append((score, code, original_key))
+        if fallback_matches:
+            best_fallback = max(fallback_matches, key=lambda x: x[0])
+            if best_fallback[0] >= 50:
+                print("[DEBUG] Fallback filtered match:", best_fallback)
+                return [{"code": best_fallback[1], "description": best_fallback[2], "score": best_fallback[0]}]
+
+    # 6. Fallback to modality-only match
+    if modality:
+        print("[DEBUG] Falling back to modality only match.")
+        return [{"code": "-", "description": modality.upper(), "score": 50}]
+
+    print("[DEBUG] No strong match found. Returning fallback.")
+    return [{"code": "N/A", "description": keyword_combo, "score": 0}]
+    
+def match_icd10_code(diagnosis_text, threshold=75, top_n=1, scopes=None):
+    """Improved ICD-10 matcher with multi-term (headache, syncope) support.
+
+    ``scopes`` are the negated and uncertain scopes of ``diagnosis_text``
+    when the caller already has them, see clean_diagnosis_text().
+    """
+    if not diagnosis_text or not isinstance(diagnosis_text, str):
+        return [{"code": "N/A", "description": "Invalid diagnosis", "score": 0}]
+
+    # Load ICD-10 mapping
+    try:
+        store = get_code_mapping('icd')
+        if store is None:
+            raise FileNotFoundError(f"ICD-10 mapping not found: {MAPPING_FILES['icd']}")
+    except Exception as e:
+        return [{"code": "N/A", "description": str(e), "score": 0}]
+
+    # Clean input diagnosis
+    cleaned = clean_diagnosis_text(diagnosis_text, scopes=scopes)
+    print("[DEBUG] Cleaned diagnosis:", cleaned)
+
+    # Split diagnosis by commas, semicolons, periods, then replace run-on
+    # fragments ("headache dizziness syncope") by the diagnoses spotted in them
+    spotter = get_diagnosis_spotter(store, MAPPING_PREPROCESSORS['icd'])
+    terms = []
+    for fragment in re.split(r"[,;/\n.]", cleaned):
+        fragment = fragment.strip().lower()
+        spans = spotter.spot(fragment)
+        if len(spans) > 1 or (spans and len(fragment.split()) > SPOTTING_FRAGMENT_WORDS):
+            terms.extend(span.term for span in spans)
+        elif len(fragment) >= 3:
+            terms.append(fragment)
+    terms = list(dict.fromkeys(terms))
+
+    all_matches = []
+    index = get_embedding_index('icd')
+
+    for term in terms:
+        best_match = {"code": "N/A", "description": term, "score": 0}
+
+        # Score only the nearest keys when an embedding index is built
+        semantic_scores = {}
+        if index is not None:
+            neighbours = index.search(term, k=EMBEDDING_CANDIDATES)
+            candidates = [(key, code, normalize_diagnosis_key(key)) for key, code, _ in neighbours]
+            if index.semantic:
+                semantic_scores = {key: similarity for key, _, similarity in neighbours}
+        elif threshold > 40 and catalogue_loaded('icd'):
+            candidates = catalogue_candidates('icd', term, CATALOGUE_CANDIDATES)
+        else:
+            # Keys sharing no word with the term score at most 40, skip them
+            # through the inverted index whenever the threshold is above that
+            # (or when the request has no budget left for a scan of every key)
+            if threshold > 40:
+                entries = store.entries_with_any(term.split())
+            elif deadlines.allows(deadlines.FUZZY_MS):
+                entries = range(len(store))
+            else:
+                deadlines.degrade('icd_fuzzy')
+                entries = store.entries_with_any(term.split())
+            candidates = ((store.key(i), store.code(i), store.norm_key(i)) for i in entries)
+
+        for key, code, cleaned_key in deadlines.bounded(candidates, 'icd_fuzzy'):
+            key_words = set(cleaned_key.split())
+            term_words = set(term.split())
+
+            word_overlap = len(term_words & key_words)
+            overlap_score = word_overlap / max(len(key_words), 1)
+            fuzzy_score = fuzz.token_sort_ratio(term, cleaned_key) / 100
+            final_score = round((0.6 * overlap_score + 0.4 * fuzzy_score) * 100)
+            # Synonyms share no words, trust a semantic encoder's similarity
+            final_score = max(final_score, round(semantic_scores.get(key, 0) * 100))
+
+            if final_score > best_match["score"]:
+                best_match = {
+                    "code": code,
+                    "description": key,
+                    "score": final_score
+                }
+
+        if best_match["score"] >= threshold:
+            all_matches.append(best_match)
+        else:
+            all_matches.append({
+                "code": "N/A",
+                "description": term,
+                "score": 0
+            })
+
+    if all_matches:
+        return all_matches
+
+    return [{
+        "code": "N/A",
+        "description": diagnosis_text,
+        "score": 0
+    }]
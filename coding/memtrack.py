@@ -0,0 +1,207 @@
+"""Per-request memory accounting for the OCR path.
+
+With MEMTRACK_ENABLED, every OCR lane job runs under measure(): the
+worker records its RSS before and after the job, and each stage()
+inside the OCR code records its duration, RSS delta and tracemalloc
+peak. Every MEMTRACK_SNAPSHOT_EVERY jobs a tracemalloc snapshot is
+compared with the worker's previous one, so the allocation sites that
+grew (and were not freed) travel back with the record. The web process
+keeps the last MEMTRACK_RECENT records and report() sums their growth
+per site, which is where a slow RSS creep shows up.
+
+RSS is per process, the deltas are exact in the OCR lane processes that
+run one job at a time and approximate in a threaded process.
+
+Disabled (the default), stage() returns a shared null context after one
+context variable lookup and tracemalloc is never started.
+"""
+import os
+import time
+import tracemalloc
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+
+ENABLED = getattr(settings, 'MEMTRACK_ENABLED', False)
+RECENT = getattr(settings, 'MEMTRACK_RECENT', 200)
+FRAMES = getattr(settings, 'MEMTRACK_FRAMES', 1)
+SNAPSHOT_EVERY = getattr(settings, 'MEMTRACK_SNAPSHOT_EVERY', 50)
+TOP_SITES = 10
+
+_NULL = nullcontext()
+_current = ContextVar('coding_memtrack_record', default=None)
+_recent = deque(maxlen=RECENT)
+_last_snapshot = None
+
+_jobs = 0
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+# Allocations of the accounting itself are not interesting sites
+_IGNORED_FILES = (tracemalloc.__file__, __file__)
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        import resource
+
+        # Peak, not current, where /proc is missing
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+class _Stage:
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.rss = rss_bytes()
+        self.traced = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc):
+        peak = tracemalloc.get_traced_memory()[1]
+        self.record['stages'].append({
+            'stage': self.name,
+            'ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'rss_delta': rss_bytes() - self.rss,
+            'peak_bytes': peak - self.traced,
+        })
+        self.record['peak_traced'] = max(self.record['peak_traced'], peak)
+        return False
+
+
+def stage(name):
+    """Account the enclosed block as stage ``name`` of the job being measured.
+
+    Stages must not nest: each one resets the tracemalloc peak.
+    """
+    record = _current.get()
+    if record is None:
+        return _NULL
+    return _Stage(record, name)
+
+
+def _growth_sites():
+    """Allocation sites that grew since this process's previous snapshot.
+
+    A snapshot of a warm worker takes seconds to compare, so only every
+    SNAPSHOT_EVERY-th job takes one and reports the growth of the jobs
+    since the last.
+    """
+    global _jobs, _last_snapshot
+    _jobs += 1
+    if _last_snapshot is not None and _jobs % SNAPSHOT_EVERY:
+        return []
+    snapshot = tracemalloc.take_snapshot()
+    previous, _last_snapshot = _last_snapshot, snapshot
+    if previous is None:
+        return []
+    sites = []
+    for stat in snapshot.compare_to(previous, 'lineno'):
+        if stat.size_diff <= 0 or len(sites) == TOP_SITES:
+            break
+        if stat.traceback[0].filename not in _IGNORED_FILES:
+            sites.append({'site': str(stat.traceback), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff})
+    return sites
+
+
+def measure(label, func, *args):
+    """(func(*args), memory record of the call) with per-stage accounting."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(FRAMES)
+    record = {
+        'label': label,
+        'pid': os.getpid(),
+        'started_at': time.time(),
+        'stages': [],
+        'peak_traced': tracemalloc.get_traced_memory()[0],
+    }
+    rss = rss_bytes()
+    token = _current.set(record)
+    try:
+        result = func(*args)
+    finally:
+        _current.reset(token)
+        record['rss_before'] = rss
+        record['rss_after'] = rss_bytes()
+        record['rss_delta'] = record['rss_after'] - rss
+        record['traced_after'] = tracemalloc.get_traced_memory()[0]
+        record['growth_sites'] = _growth_sites()
+    return result, record
+
+
+def remember(record):
+    """Keep a job's record for report()."""
+    _recent.append(record)
+
+
+def report(limit=20):
+    """Recent jobs and the allocation sites that grew the most across them."""
+    sites = {}
+    for record in _recent:
+        for site in record['growth_sites']:
+            entry = sites.setdefault(site['site'], {'site': site['site'], 'size_diff': 0, 'count_diff': 0, 'jobs': 0})
+            entry['size_diff'] += site['size_diff']
+            entry['count_diff'] += site['count_diff']
+            entry['jobs'] += 1
+    return {
+        'enabled': ENABLED,
+        'pid': os.getpid(),
+        'rss': rss_bytes(),
+        'jobs': len(_recent),
+        'top_sites': sorted(sites.values(), key=lambda entry: entry['size_diff'], reverse=True)[:limit],
+        'recent': [{key: value for key, value in record.items() if key != 'growth_sites'}
+                   for record in list(_recent)[-limit:]],
+    }
+
+
+def ocr_with_rss(path):
+    """Soak job: OCR ``path`` here and return (pid, RSS afterwards, characters extracted)."""
+    from .extraction import extract_text
+
+    text = extract_text(path)
+    return os.getpid(), rss_bytes(), len(text)
+
+
+def rss_growth(samples, warmup):
+    """Per-process RSS growth of soak samples [(pid, rss), ...] after the first ``warmup`` samples.
+
+    Returns {pid: {'jobs', 'baseline', 'last', 'max', 'growth', 'per_job'}},
+    ``growth`` is last minus baseline and ``per_job`` the least-squares
+    slope in bytes per job.
+    """
+    by_pid = {}
+    for index, (pid, rss) in enumerate(samples):
+        if index >= warmup:
+            by_pid.setdefault(pid, []).append(rss)
+    growth = {}
+    for pid, values in by_pid.items():
+        n = len(values)
+        mean_x, mean_y = (n - 1) / 2, sum(values) / n
+        spread = sum((x - mean_x) ** 2 for x in range(n))
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values)) / spread if spread else 0.0
+        growth[pid] = {
+            'jobs': n,
+            'baseline': values[0],
+            'last': values[-1],
+            'max': max(values),
+            'growth': values[-1] - values[0],
+            'per_job': round(slope, 1),
+        }
+    return growth
+
+
+def reset():
+    global _jobs, _last_snapshot
+    _recent.clear()
+    _jobs = 0
+    _last_snapshot = None
@@ -0,0 +1,103 @@
+"""Process-local counters, gauges and timings, served as JSON by the metrics view.
+
+Each worker keeps its own numbers, a scrape shows the worker that
+answered it (``pid`` tells which). Timings keep the last TIMING_WINDOW
+observations per name for the percentiles, plus running totals.
+"""
+import os
+import math
+import time
+import threading
+from collections import Counter, deque
+
+TIMING_WINDOW = 1024
+
+_counters = Counter()
+_gauges = {}
+_timings = {}
+_lock = threading.Lock()
+_started_at = time.time()
+
+
+class _Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=TIMING_WINDOW)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 2) if self.count else None,
+            'p50': round(percentile(recent, 50), 2) if recent else None,
+            'p99': round(percentile(recent, 99), 2) if recent else None,
+            'max': round(self.max, 2),
+        }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    # pct * n first: pct / 100 * n can land just above an integer rank
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct * len(sorted_values) / 100) - 1))
+    return sorted_values[index]
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def get(name):
+    return _counters.get(name, 0)
+
+
+def observe(name, value):
+    """Record one observation (milliseconds by convention) of timing ``name``."""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = _Timing()
+        timing.add(value)
+
+
+def timing(name):
+    with _lock:
+        timing = _timings.get(name)
+        return timing.summary() if timing else None
+
+
+def register_gauge(name, read):
+    """Report ``read()`` under ``name`` in every snapshot."""
+    _gauges[name] = read
+
+
+def unregister_gauge(name):
+    """Stop reporting gauge ``name``, reset() leaves gauges in place."""
+    _gauges.pop(name, None)
+
+
+def snapshot():
+    with _lock:
+        counters = dict(sorted(_counters.items()))
+        timings = {name: t.summary() for name, t in sorted(_timings.items())}
+    return {
+        'pid': os.getpid(),
+        'uptime_seconds': round(time.time() - _started_at, 1),
+        'counters': counters,
+        'gauges': {name: read() for name, read in sorted(_gauges.items())},
+        'timings': timings,
+    }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
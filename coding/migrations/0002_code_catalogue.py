@@ -0,0 +1,74 @@
+# Generated by Django 5.2 on 2026-10-19 03:54
+
+from django.db import migrations, models
+
+FTS_TABLE = 'coding_codedescription_fts'
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        normalized, description, kind UNINDEXED,
+        content='coding_codedescription', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON coding_codedescription BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, normalized, description, kind)
+        VALUES (new.id, new.normalized, new.description, new.kind);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON coding_codedescription BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, normalized, description, kind)
+        VALUES ('delete', old.id, old.normalized, old.description, old.kind);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON coding_codedescription BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, normalized, description, kind)
+        VALUES ('delete', old.id, old.normalized, old.description, old.kind);
+        INSERT INTO {FTS_TABLE}(rowid, normalized, description, kind)
+        VALUES (new.id, new.normalized, new.description, new.kind);
+    END""",
+]
+SQLITE_BACKWARD = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX coding_codedescription_trgm ON coding_codedescription USING gin (normalized gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = ["DROP INDEX IF EXISTS coding_codedescription_trgm"]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coding', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeDescription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('cpt', 'CPT'), ('icd', 'ICD-10')], max_length=3)),
+                ('code', models.CharField(max_length=10)),
+                ('description', models.TextField()),
+                ('normalized', models.TextField(help_text='Description in the form the matchers compare against')),
+            ],
+            options={
+                'verbose_name': 'Code Description',
+                'verbose_name_plural': 'Code Descriptions',
+                'indexes': [models.Index(fields=['kind', 'code'], name='coding_code_kind_61a204_idx')],
+            },
+        ),
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -26,6 +26,7 @@ class MedicalReport(models.Model):
     
     # Report Metadata
     date_of_service = models.DateField(null=True, blank=True)
+    # Name the report was uploaded under, the file itself is not kept (coding.reports.report_fields)
     uploaded_file = models.FileField(upload_to='medical_reports/', blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     
@@ -61,4 +62,26 @@ class MedicalReport(models.Model):
     class Meta:
         ordering = ['-date_of_service']
         verbose_name = 'Medical Report'
-        verbose_name_plural = 'Medical Reports'
\ No newline at end of file
+        verbose_name_plural = 'Medical Reports'
+
+class CodeDescription(models.Model):
+    """One catalogue entry: a CPT/ICD-10 code under one of its descriptions.
+
+    A code can appear under several descriptions, so this holds the full
+    JSON mapping while CPTCode/ICD10Code keep one row per code. Searched
+    through the coding_codedescription_fts FTS5 table on SQLite.
+    """
+    KIND_CHOICES = [('cpt', 'CPT'), ('icd', 'ICD-10')]
+
+    kind = models.CharField(max_length=3, choices=KIND_CHOICES)
+    code = models.CharField(max_length=10)
+    description = models.TextField()
+    normalized = models.TextField(help_text='Description in the form the matchers compare against')
+
+    def __str__(self):
+        return f"{self.kind.upper()} {self.code} - {self.description[:50]}"
+
+    class Meta:
+        indexes = [models.Index(fields=['kind', 'code'])]
+        verbose_name = 'Code Description'
+        verbose_name_plural = 'Code Descriptions'
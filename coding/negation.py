@@ -0,0 +1,158 @@
+"""NegEx-style negation and uncertainty scoping.
+
+Trigger phrases are compiled once into a DiagnosisSpotter automaton, so
+a text is tokenized and scanned for every trigger in a single pass.
+Each trigger opens a scope: pre-triggers ("no", "negative for",
+"possible") extend forward and post-triggers ("is unremarkable", "is
+suspected") extend backward, up to MAX_SCOPE_WORDS words, a clause
+boundary or the next trigger, whichever comes first. Pseudo-triggers
+("no change") are matched only so they shadow the shorter trigger inside
+them. A termination word ("but", "however") closes a scope early.
+
+The result is a list of Scope spans over the original text. Nothing is
+deleted here, callers decide whether to drop, flag or keep the scoped
+words (see remove_scopes and assertion).
+"""
+import re
+import bisect
+from functools import lru_cache
+from typing import NamedTuple
+
+from .diagnosis_spotter import DiagnosisSpotter, tokenize
+
+NEGATED = 'negated'
+UNCERTAIN = 'uncertain'
+AFFIRMED = 'affirmed'
+
+PRE_NEGATION = (
+    "no", "not", "without", "never", "negative for", "no evidence of", "no signs of",
+    "no sign of", "there is no", "there are no", "free of", "absence of", "absent", "denies",
+    "denied", "resolution of",
+)
+POST_NEGATION = (
+    "unremarkable", "is unremarkable", "are unremarkable", "is negative", "are negative",
+    "ruled out", "has been ruled out", "not seen", "not identified", "not demonstrated",
+    "is absent", "are absent", "has resolved", "have resolved",
+)
+PRE_UNCERTAIN = (
+    "rule out", "r o", "possible", "possibly", "probable", "questionable", "suspicious for",
+    "suspected", "may represent", "concern for", "concerning for", "cannot exclude",
+    "can not exclude", "differential includes", "evaluate for", "versus", "vs",
+)
+POST_UNCERTAIN = (
+    "is suspected", "are suspected", "not excluded", "cannot be excluded", "can not be excluded",
+    "is possible", "is questioned", "is not excluded",
+)
+PSEUDO = (
+    "no change", "no significant change", "no interval change", "not only", "no increase",
+    "not necessarily", "without difficulty", "gram negative", "not certain whether",
+    "not associated with",
+)
+TERMINATION = (
+    "but", "however", "although", "though", "except", "aside from", "apart from", "which",
+    "secondary to", "due to", "cause of", "etiology of",
+)
+
+# Role of each trigger: (scope kind, direction)
+RULES = (
+    *((phrase, (NEGATED, 1)) for phrase in PRE_NEGATION),
+    *((phrase, (NEGATED, -1)) for phrase in POST_NEGATION),
+    *((phrase, (UNCERTAIN, 1)) for phrase in PRE_UNCERTAIN),
+    *((phrase, (UNCERTAIN, -1)) for phrase in POST_UNCERTAIN),
+    *((phrase, (None, 0)) for phrase in PSEUDO + TERMINATION),
+)
+
+# A scope never crosses a clause boundary. Commas end it too, as the
+# regex clean-up this replaces did ("no fracture, mild headache").
+BOUNDARY = re.compile(r"[.,;:\n]")
+MAX_SCOPE_WORDS = 10
+
+
+class Scope(NamedTuple):
+    start: int
+    end: int
+    kind: str
+    trigger: str
+
+    def as_dict(self):
+        return self._asdict()
+
+
+class NegationEngine:
+    def __init__(self, rules=RULES, max_scope_words=MAX_SCOPE_WORDS):
+        self.triggers = DiagnosisSpotter(rules)
+        self.max_scope_words = max_scope_words
+
+    def scopes(self, text, tokens=None):
+        """Negated and uncertain Scopes of ``text``, in order of their trigger."""
+        if not text:
+            return []
+        tokens = tokenize(text) if tokens is None else tokens
+        triggers = self.triggers.spot(text, tokens)
+        if not triggers:
+            return []
+        starts = [t[0] for t in tokens]
+        boundaries = [m.start() for m in BOUNDARY.finditer(text)]
+
+        scopes = []
+        for n, trigger in enumerate(triggers):
+            kind, direction = trigger.term
+            if kind is None:
+                continue
+            if direction > 0:
+                limit = min(
+                    _next(boundaries, trigger.end, len(text)),
+                    triggers[n + 1].start if n + 1 < len(triggers) else len(text),
+                )
+                first = bisect.bisect_left(starts, trigger.end)
+                words = [t for t in tokens[first:first + self.max_scope_words] if t[1] <= limit]
+                scopes.append(Scope(trigger.start, words[-1][1] if words else trigger.end, kind, trigger.text))
+            else:
+                limit = max(
+                    _previous(boundaries, trigger.start, -1) + 1,
+                    triggers[n - 1].end if n else 0,
+                )
+                last = bisect.bisect_left(starts, trigger.start)
+                words = [t for t in tokens[max(last - self.max_scope_words, 0):last] if t[0] >= limit]
+                scopes.append(Scope(words[0][0] if words else trigger.start, trigger.end, kind, trigger.text))
+        return scopes
+
+
+def _next(positions, at, default):
+    i = bisect.bisect_left(positions, at)
+    return positions[i] if i < len(positions) else default
+
+
+def _previous(positions, at, default):
+    i = bisect.bisect_left(positions, at)
+    return positions[i - 1] if i else default
+
+
+@lru_cache(maxsize=1)
+def get_negation_engine():
+    return NegationEngine()
+
+
+@lru_cache(maxsize=4096)
+def find_scopes(text):
+    """Scopes of ``text`` with the default rules, cached so a report section is scanned once."""
+    return tuple(get_negation_engine().scopes(text))
+
+
+def remove_scopes(text, scopes):
+    """``text`` without the scoped words, the rest is kept as is."""
+    pieces, at = [], 0
+    for scope in scopes:
+        if scope.start > at:
+            pieces.append(text[at:scope.start])
+        at = max(at, scope.end)
+    pieces.append(text[at:])
+    return " ".join(pieces)
+
+
+def assertion(start, end, scopes):
+    """NEGATED, UNCERTAIN or AFFIRMED for the text between ``start`` and ``end``."""
+    for scope in scopes:
+        if scope.start < end and start < scope.end:
+            return scope.kind
+    return AFFIRMED
@@ -0,0 +1,137 @@
+"""Text normalization rules for CPT matching.
+
+The rules are data (PUNCTUATION, REPLACEMENTS, PATTERNS) shared by two
+implementations:
+
+* normalize() applies them to one string with str methods and ``re``,
+  it is what the matchers and the mapping store use;
+* normalize_array() applies them to a whole Arrow string array with
+  pyarrow.compute kernels, for preprocessing datasets of millions of
+  rows (ai_model/preprocess.py).
+
+Both give the same result for every value. The Arrow regex engine (RE2)
+only knows ASCII word and digit classes, so the few non-ASCII values of
+an array go through normalize() instead.
+
+This module does not import Django, scripts outside the project can use it.
+"""
+import re
+import string
+
+PUNCTUATION = string.punctuation.replace("(", "").replace(")", "")
+
+# Applied in order, after punctuation removal
+REPLACEMENTS = {
+    "x-ray": "xr", "xray": "xr",
+    "ultrasound": "us", "sonogram": "us",
+    "ct scan": "ct", "mri scan": "mri",
+    "pa and lateral": "2 views",
+    "with contrast": "w contrast",
+    "without contrast": "wo contrast",
+    "right": "rt", "left": "lt", "bilateral": "bilat",
+    "minimum": "min", "complete": "comp",
+}
+
+# (pattern, replacement), applied in order after REPLACEMENTS
+PATTERNS = (
+    # Number of views
+    (r"\bmin\s+(\d+)\s*views?\b", r"\1 views"),
+    (r"\bcomp\s+(\d+)\s*views?\b", r"\1 views"),
+    (r"\b(\d+)\s*views?\b", r"\1 views"),
+    # Contrast notations
+    (r"w[/\\-]?wo", "with and without"),
+    (r"w[/\\-]?o", "without"),
+    (r"w[/\\-]?c", "with contrast"),
+)
+
+_PUNCTUATION_TABLE = str.maketrans('', '', PUNCTUATION)
+_COMPILED_PATTERNS = tuple((re.compile(pattern), replacement) for pattern, replacement in PATTERNS)
+_SPACES = re.compile(r"\s{2,}")
+
+# What Python's \s and str.strip() treat as whitespace among ASCII characters,
+# RE2's \s leaves out \v and \x1c-\x1f
+_ASCII_SPACE = r"[\t\n\x0b\x0c\r\x1c-\x1f ]"
+_PUNCTUATION_RUN = "[" + "".join(re.escape(char) for char in PUNCTUATION) + "]+"
+_ARROW_PATTERNS = tuple((pattern.replace(r"\s", _ASCII_SPACE), replacement) for pattern, replacement in PATTERNS)
+# Rows that can match a group of rules, the group skips every other row
+_REPLACEMENTS_FILTER = "|".join(re.escape(term) for term in REPLACEMENTS)
+_VIEWS_FILTER = "view"
+_CONTRAST_FILTER = r"w[/\\-]?[oc]"
+_SPACES_FILTER = f"{_ASCII_SPACE}{{2}}|^{_ASCII_SPACE}|{_ASCII_SPACE}$"
+
+
+def normalize(text):
+    """Normalize text for CPT matching"""
+    if not text:
+        return ""
+
+    text = text.lower()
+    text = text.replace("-", " ")  # Treat dashes as spaces
+
+    # Remove most punctuation except for parentheses
+    text = text.translate(_PUNCTUATION_TABLE)
+
+    # Standardize common terms
+    for term, replacement in REPLACEMENTS.items():
+        text = text.replace(term, replacement)
+
+    for pattern, replacement in _COMPILED_PATTERNS:
+        text = pattern.sub(replacement, text)
+
+    return _SPACES.sub(" ", text).strip()
+
+
+def normalize_array(values):
+    """normalize() of every value of an Arrow string array (or chunked array), nulls become ""."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    values = pc.fill_null(values.cast(pa.string()), "")
+
+    text = pc.ascii_lower(values)
+    text = pc.replace_substring(text, "-", " ")
+    text = pc.replace_substring_regex(text, _PUNCTUATION_RUN, "")
+    text = _apply_where(text, pc.match_substring_regex(text, _REPLACEMENTS_FILTER), _replace_terms)
+    text = _apply_where(text, pc.match_substring(text, _VIEWS_FILTER), _replace_patterns, _ARROW_PATTERNS[:3])
+    text = _apply_where(text, pc.match_substring_regex(text, _CONTRAST_FILTER), _replace_patterns,
+                        _ARROW_PATTERNS[3:])
+    text = _apply_where(text, pc.match_substring_regex(text, _SPACES_FILTER), _replace_patterns, (
+        (_ASCII_SPACE + "{2,}", " "),
+        (f"^{_ASCII_SPACE}+|{_ASCII_SPACE}+$", ""),
+    ))
+
+    non_ascii = pc.invert(pc.string_is_ascii(values))
+    if pc.any(non_ascii).as_py():
+        fallback = pa.array([normalize(value) for value in pc.filter(values, non_ascii).to_pylist()], pa.string())
+        text = pc.replace_with_mask(text, non_ascii, fallback)
+    return text
+
+
+def _apply_where(text, mask, func, *args):
+    """``text`` with func(rows, *args) applied to the rows selected by ``mask`` only."""
+    import pyarrow.compute as pc
+
+    selected = pc.sum(mask).as_py() or 0
+    if not selected:
+        return text
+    if selected == len(text):
+        return func(text, *args)
+    return pc.replace_with_mask(text, mask, func(pc.filter(text, mask), *args))
+
+
+def _replace_terms(text):
+    import pyarrow.compute as pc
+
+    for term, replacement in REPLACEMENTS.items():
+        text = pc.replace_substring(text, term, replacement)
+    return text
+
+
+def _replace_patterns(text, patterns):
+    import pyarrow.compute as pc
+
+    for pattern, replacement in patterns:
+        text = pc.replace_substring_regex(text, pattern, replacement)
+    return text
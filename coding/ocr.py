@@ -0,0 +1,145 @@
+"""OCR of images and scanned PDFs.
+
+This is the only module that imports the imaging stack (OpenCV, Pillow,
+pytesseract, pdf2image). The extraction module imports it on first use,
+so text-only workers never load it.
+
+Every tesseract call is bounded by the request's remaining budget
+(coding.deadlines): the OCR retry is skipped when little time is left
+and a PDF stops at the page where the deadline passed.
+"""
+import os
+import tempfile
+import pytesseract
+import cv2
+import numpy as np
+
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+from django.conf import settings
+
+from . import deadlines
+from .extraction import clean_ocr_text
+from .memtrack import stage
+
+# ---------- IMAGE PREPROCESSING ----------
+def preprocess_image(image_path):
+    """Enhanced image preprocessing for better OCR results"""
+    try:
+        with stage('preprocess'):
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError("Could not read image file")
+
+            # Convert to grayscale
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+            # Apply CLAHE for contrast enhancement
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+            enhanced = clahe.apply(gray)
+
+            # Apply adaptive thresholding
+            thresh = cv2.adaptiveThreshold(enhanced, 255,
+                                        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                        cv2.THRESH_BINARY, 11, 2)
+
+            # Apply slight dilation to connect broken characters
+            kernel = np.ones((1, 1), np.uint8)
+            processed = cv2.dilate(thresh, kernel, iterations=1)
+
+            return processed
+    except Exception as e:
+        print(f"[ERROR] Image preprocessing failed: {e}")
+        return gray if 'gray' in locals() else image
+
+# ---------- TESSERACT ----------
+def run_tesseract(image, config):
+    """pytesseract.image_to_string, given at most the remaining budget of the request"""
+    left = deadlines.remaining()
+    if left is None:
+        return pytesseract.image_to_string(image, config=config)
+    if left <= 0:
+        deadlines.degrade('ocr')
+        return ""
+    try:
+        return pytesseract.image_to_string(image, config=config, timeout=left)
+    except RuntimeError as e:
+        if 'timeout' not in str(e).lower():
+            raise
+        deadlines.degrade('ocr')
+        return ""
+
+def retry_allowed():
+    """Whether the budget left covers a second OCR pass"""
+    if deadlines.allows(deadlines.OCR_RETRY_MS):
+        return True
+    deadlines.degrade('ocr_retry')
+    return False
+
+# ---------- TEXT EXTRACTION ----------
+def extract_text_from_image(image_path):
+    """Extract text from image with enhanced preprocessing"""
+    try:
+        processed_img = preprocess_image(image_path)
+        custom_config = r'--oem 3 --psm 6'
+        with stage('tesseract'):
+            raw = run_tesseract(processed_img, custom_config)
+        return clean_ocr_text(raw)
+    except Exception as e:
+        print(f"[ERROR] Image text extraction failed: {e}")
+        return ""
+
+def ocr_image_file(file_path):
+    """OCR an image upload, retrying without preprocessing when little text comes back"""
+    # Try multiple OCR strategies
+    text = extract_text_from_image(file_path)
+    if len(text.strip().split()) < 10 and retry_allowed():  # If first attempt got too little text
+        print("Trying alternative OCR approach")
+        with stage('tesseract_retry'), Image.open(file_path) as img:
+            text = run_tesseract(img, '--psm 6')
+        text = clean_ocr_text(text)
+    return text
+
+def ocr_pdf_page(page, page_index):
+    """OCR one rendered PDF page (PIL image)"""
+    # Unique per call, concurrent OCR workers must not share page files
+    fd, temp_path = tempfile.mkstemp(prefix=f'temp_page_{page_index}_', suffix='.png',
+                                     dir=settings.MEDIA_ROOT or None)
+    os.close(fd)
+    try:
+        with stage('save_page'):
+            page.save(temp_path, 'PNG')
+        page_text = extract_text_from_image(temp_path)
+        if len(page_text.strip().split()) < 5 and retry_allowed():  # If OCR got little text
+            with stage('tesseract_retry'):
+                page_text = run_tesseract(temp_path, '--psm 6')
+            page_text = clean_ocr_text(page_text)
+        return page_text
+    finally:
+        os.remove(temp_path)
+
+
+def pdf_page_count(file_path):
+    return pdfinfo_from_path(file_path)['Pages']
+
+
+def pdf_page_text(file_path, number, dpi=300):
+    """Render and OCR page ``number`` (from 1) of a PDF"""
+    with stage('render'):
+        page = convert_from_path(file_path, dpi=dpi, first_page=number, last_page=number)[0]
+    try:
+        return ocr_pdf_page(page, number - 1)
+    finally:
+        # Free the page bitmap now, not when the next page replaces it
+        page.close()
+
+
+def iter_pdf_page_texts(file_path, dpi=300):
+    """Render and OCR a PDF one page at a time, yielding (page_number, page_count, text)"""
+    page_count = pdf_page_count(file_path)
+    for number in range(1, page_count + 1):
+        if deadlines.expired():
+            # Out of time: the pages read so far are the partial result
+            deadlines.degrade('ocr_pages')
+            return
+        yield number, page_count, pdf_page_text(file_path, number, dpi)
@@ -0,0 +1,258 @@
+"""Opt-in cProfile profiling of single requests.
+
+A predict request is profiled when it carries ``X-Profile: <token>``
+matching PROFILE_HEADER_TOKEN, or when it falls in the PROFILE_SAMPLE_RATE
+share of traffic. The request thread runs under cProfile, and so does
+every lane job the request submits (coding.executors), in whichever
+thread or OCR process runs it. All stats are merged into one
+``<request id>.pstats`` file in PROFILE_DIR, with a ``.json`` sidecar
+describing the request. The request id is the X-Request-ID header when
+given, and is echoed back as ``X-Profile-Id``.
+
+With no token and a zero sample rate the middleware removes itself
+(MiddlewareNotUsed), and a lane job only pays one context variable
+lookup. Open a profile with ``python -m pstats`` or snakeviz, or read
+the hottest coding functions from the profiles view.
+"""
+import os
+import re
+import hmac
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILED_PATHS = ('/api/predict/',)
+REQUEST_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_current = ContextVar('coding_request_profile', default=None)
+
+
+def profile_dir():
+    return str(getattr(settings, 'PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+def current():
+    """The RequestProfile of the request being handled, or None."""
+    return _current.get()
+
+
+def profile_call(func, *args):
+    """(func(*args), raw cProfile stats of the call).
+
+    From Python 3.12 only one profiler can be active per process: a
+    second one (a text lane thread of a profiled request, or two sampled
+    requests at once) runs the call unprofiled and returns None stats.
+    The active profiler already records the other threads' calls there.
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # "Another profiling tool is already active"
+        return func(*args), None
+    try:
+        result = func(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+class _RawStats:
+    # pstats.Stats accepts any object with create_stats() and a stats dict
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class RequestProfile:
+    """Stats collected for one request from every thread and process that worked on it."""
+
+    def __init__(self, request_id, method, path, reason):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started = time.time()
+        self._stats = None
+        self._parts = 0
+        self._skipped = 0
+        self._lock = threading.Lock()
+
+    def add(self, raw_stats):
+        """Merge the stats of one part of the request, None for a part that could not be profiled."""
+        import pstats
+
+        if raw_stats is None:
+            with self._lock:
+                self._skipped += 1
+            return
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(_RawStats(raw_stats))
+            else:
+                self._stats.add(_RawStats(raw_stats))
+            self._parts += 1
+
+    def save(self, status):
+        """Write the .pstats file and its sidecar, return the sidecar data."""
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        meta = {
+            'id': self.request_id,
+            'method': self.method,
+            'path': self.path,
+            'reason': self.reason,
+            'status': status,
+            'started_at': self.started,
+            'duration_ms': round((time.time() - self.started) * 1000, 1),
+            'parts': self._parts,
+            'skipped_parts': self._skipped,
+        }
+        with self._lock:
+            if self._stats is not None:
+                self._stats.dump_stats(os.path.join(directory, f"{self.request_id}.pstats"))
+        with open(os.path.join(directory, f"{self.request_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        prune(directory, getattr(settings, 'PROFILE_KEEP', 200))
+        return meta
+
+
+# ---------- MIDDLEWARE ----------
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.token = getattr(settings, 'PROFILE_HEADER_TOKEN', '')
+        self.sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0)
+        if not self.token and self.sample_rate <= 0:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        """A RequestProfile when this request should be profiled, else None."""
+        if not request.path.startswith(PROFILED_PATHS):
+            return None
+        header = request.headers.get(PROFILE_HEADER)
+        if header and self.token and hmac.compare_digest(header, self.token):
+            reason = 'header'
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            reason = 'sampled'
+        else:
+            return None
+        request_id = request.headers.get('X-Request-ID', '')
+        if not REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        return RequestProfile(request_id, request.method, request.path, reason)
+
+    def finish(self, profile, response):
+        try:
+            profile.save(response.status_code)
+            response['X-Profile-Id'] = profile.request_id
+        except OSError as e:
+            logger.warning(f"Could not save profile {profile.request_id}: {e}")
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = self.start(request)
+        if profile is None:
+            return self.get_response(request)
+        token = _current.set(profile)
+        try:
+            response, stats = profile_call(self.get_response, request)
+            profile.add(stats)
+        finally:
+            _current.reset(token)
+        return self.finish(profile, response)
+
+    async def __acall__(self, request):
+        profile = self.start(request)
+        if profile is None:
+            return await self.get_response(request)
+        # The event loop interleaves requests, only the lane jobs are profiled
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(profile, response)
+
+
+# ---------- STORED PROFILES ----------
+def prune(directory, keep):
+    """Remove all but the ``keep`` newest profiles."""
+    sidecars = sorted((name for name in os.listdir(directory) if name.endswith('.json')),
+                      key=lambda name: os.path.getmtime(os.path.join(directory, name)), reverse=True)
+    for name in sidecars[keep:]:
+        stem = name[:-len('.json')]
+        for suffix in ('.json', '.pstats'):
+            try:
+                os.remove(os.path.join(directory, stem + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit=50):
+    """Sidecar data of the newest profiles."""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name), encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    profiles.sort(key=lambda meta: meta.get('started_at', 0), reverse=True)
+    return profiles[:limit]
+
+
+def profile_path(request_id, suffix='.pstats'):
+    """Path of a stored profile file, or None for an unknown or malformed id."""
+    if not REQUEST_ID.match(request_id):
+        return None
+    path = os.path.join(profile_dir(), request_id + suffix)
+    return path if os.path.exists(path) else None
+
+
+def hot_functions(path, top=20, package_only=True):
+    """The functions with the most own time, by default only those of the coding package."""
+    import pstats
+
+    stats = pstats.Stats(path)
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        if package_only and not os.path.abspath(filename).startswith(PACKAGE_DIR + os.sep):
+            continue
+        rows.append({
+            'function': f"{os.path.relpath(filename, os.path.dirname(PACKAGE_DIR))}:{line}({name})"
+            if filename.startswith(os.sep) else f"{filename}:{line}({name})",
+            'calls': calls,
+            'own_ms': round(own * 1000, 2),
+            'cumulative_ms': round(cumulative * 1000, 2),
+        })
+    rows.sort(key=lambda row: row['own_ms'], reverse=True)
+    return {'total_ms': round(stats.total_tt * 1000, 2), 'functions': rows[:top]}
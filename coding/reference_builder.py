@@ -0,0 +1,228 @@
+"""Build the CPT / ICD-10 code mappings from reference PDFs.
+
+Pages are extracted with PyMuPDF in a process pool, each worker opening
+the document once and handling a contiguous page range. The parent
+parses the page texts in page order as they arrive, one precompiled
+pattern per line, and writes entries straight into the output JSON. No
+whole-document string is ever built. The artifact is the plain
+``{description: code}`` mapping the matchers already load, plus a
+``<name>.meta.json`` sidecar recording the builder version, source hash
+and extraction stats.
+
+This module does not import Django, so the scripts under scripts/ can
+use it directly.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+BUILDER_VERSION = 1
+
+# Below this many pages process start-up costs more than it saves
+MIN_PAGES_FOR_POOL = 64
+
+# Lines on every page that are never part of an entry
+NOISE_LINE = re.compile(r"^(?:Page \d+ of \d+|\d{1,3}|Exam/Procedure|CPT Code)$")
+
+# CPT guide: modality line, one or more description lines, then a code line
+# such as "74177, 76376 or 76377" or "73725 x 2". The first code is kept.
+CPT_MODALITIES = frozenset({
+    "BX", "CT", "CTA", "DEXA", "FL", "IR", "MR", "MRA", "MRI", "MRV", "NM", "PET", "US", "XR", "XRM",
+})
+CPT_CODE_LINE = re.compile(r"^(\d{5})(?:\s*(?:,|or|x\s*\d+|\*|\([A-Z]+\)|[A-Z]\d{4}|\d{5})\s*)*$")
+
+# ICD-10: code then description on one line, continuation lines follow.
+# One pattern replaces the six alternatives of the old script.
+ICD_CODE_LINE = re.compile(r"^([A-TV-Z][0-9][0-9AB](?:\.?[0-9A-Z]{1,4})?)\s+(\S.*)$")
+
+SPLIT_LETTERS = re.compile(r"(?<=\b\w) (?=\w\b)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def clean_description(text):
+    return WHITESPACE.sub(" ", text).strip()
+
+
+def format_icd_code(code):
+    if len(code) >= 4 and '.' not in code:
+        return f"{code[:3]}.{code[3:]}"
+    return code
+
+
+def _page_texts(pdf_path, start, stop):
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def page_count(pdf_path):
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def iter_page_texts(pdf_path, workers=None, pages_per_task=8):
+    """Yield the text of every page, in order, extracting in parallel.
+
+    ``workers=None`` picks the CPU count, or 1 for short documents.
+    """
+    total = page_count(pdf_path)
+    ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+    if workers is None:
+        workers = (os.cpu_count() or 1) if total >= MIN_PAGES_FOR_POOL else 1
+    workers = min(workers, len(ranges) or 1)
+    if workers <= 1:
+        for start, stop in ranges:
+            yield from _page_texts(pdf_path, start, stop)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_page_texts, pdf_path, start, stop) for start, stop in ranges]
+        for future in futures:
+            yield from future.result()
+
+
+def iter_lines(page_texts, stats):
+    """Yield cleaned lines, None marks a page boundary."""
+    for text in page_texts:
+        stats['pages'] += 1
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or NOISE_LINE.match(line):
+                continue
+            stats['lines'] += 1
+            yield line
+        yield None
+
+
+def parse_cpt_lines(lines):
+    """Yield (description, code) from the CPT guide layout."""
+    modality, buffer = None, []
+    for line in lines:
+        if line is None:
+            modality, buffer = None, []
+            continue
+        match = CPT_CODE_LINE.match(line)
+        if match:
+            if buffer:
+                description = clean_description(" ".join(buffer))
+                if modality and description.split(" ", 1)[0] != modality:
+                    description = f"{modality} {description}"
+                yield description, match.group(1)
+            modality, buffer = None, []
+        elif line in CPT_MODALITIES:
+            modality, buffer = line, []
+        elif line.startswith("(") and line.endswith(")"):
+            continue  # usage notes such as "(USE ALL x 2 IF BILATERAL)"
+        elif any(c.islower() for c in line):
+            modality, buffer = None, []  # section titles are mixed case
+        elif buffer and line.split(" ", 1)[0] in CPT_MODALITIES:
+            modality, buffer = None, [line]  # what was buffered was a subsection title
+        else:
+            buffer.append(line)
+
+
+def parse_icd_lines(lines):
+    """Yield (description, code) from an ICD-10 listing with wrapped descriptions."""
+    code, buffer = None, []
+    for line in lines:
+        match = ICD_CODE_LINE.match(line) if line is not None else None
+        if line is None or match:
+            if code and buffer:
+                yield clean_description(SPLIT_LETTERS.sub("", " ".join(buffer))), format_icd_code(code)
+            code, buffer = (match.group(1), [match.group(2)]) if match else (None, [])
+        elif code:
+            buffer.append(line)
+
+
+PARSERS = {'cpt': parse_cpt_lines, 'icd': parse_icd_lines}
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def write_mapping(entries, out_path, stats):
+    """Stream (description, code) pairs into a JSON object, first description wins.
+
+    The object is written to a temporary file next to ``out_path`` that
+    replaces it only once complete. A failed run, or one that parsed no
+    entry, leaves the existing mapping in place and raises.
+    """
+    seen = set()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out_path)),
+                                    prefix=f".{os.path.basename(out_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write("{")
+            for description, code in entries:
+                if not description:
+                    stats['skipped'] += 1
+                    continue
+                if description in seen:
+                    stats['duplicates'] += 1
+                    continue
+                seen.add(description)
+                f.write(("\n" if not stats['entries'] else ",\n") + "    "
+                        + json.dumps(description, ensure_ascii=False) + ": " + json.dumps(code))
+                stats['entries'] += 1
+            f.write("\n}\n")
+        if not stats['entries']:
+            raise ValueError(f"No entries parsed, {out_path} left unchanged")
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def build_reference(pdf_path, out_path, kind='cpt', workers=None):
+    """Extract ``kind`` codes from ``pdf_path`` into ``out_path``, return the stats."""
+    if kind not in PARSERS:
+        raise ValueError(f"Unsupported kind: {kind}")
+    start = time.perf_counter()
+    stats = {'pages': 0, 'lines': 0, 'entries': 0, 'duplicates': 0, 'skipped': 0}
+    lines = iter_lines(iter_page_texts(pdf_path, workers), stats)
+    write_mapping(PARSERS[kind](lines), out_path, stats)
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    stats['pages_per_second'] = round(stats['pages'] / stats['seconds'], 1) if stats['seconds'] else None
+
+    meta = {
+        'builder_version': BUILDER_VERSION,
+        'kind': kind,
+        'source': os.path.basename(pdf_path),
+        'source_sha256': file_sha256(pdf_path),
+        'mapping_sha256': file_sha256(out_path),
+        'built_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'stats': stats,
+    }
+    with open(os.path.splitext(out_path)[0] + '.meta.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=4)
+    return stats
+
+
+def benchmark(pdf_path, kind='cpt', workers=None, repeat=3):
+    """Best-of-``repeat`` timings for sequential and parallel extraction + parsing."""
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, 'mapping.json')
+        for label, n in (('sequential', 1), ('parallel', workers or os.cpu_count() or 1)):
+            best = None
+            for _ in range(repeat):
+                stats = build_reference(pdf_path, out_path, kind, workers=n)
+                best = stats if best is None or stats['seconds'] < best['seconds'] else best
+            timings[label] = {'workers': n, **best}
+    return timings
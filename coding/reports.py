@@ -0,0 +1,69 @@
+"""Report coding shared by the upload views and bulk ingestion.
+
+process_report_text() runs field extraction and the CPT/ICD-10 matchers
+on report text, report_fields() turns the extracted data into
+MedicalReport column values. coding.views and coding.ingest both build
+on them.
+"""
+from datetime import datetime
+
+from .extraction import extract_fields
+from .matching import match_cpt_code, match_icd10_code, normalize_exam_description
+
+ALLOWED_EXTENSIONS = ['pdf', 'png', 'jpg', 'jpeg', 'txt', 'doc', 'docx']
+
+
+def process_report_text(raw_text, skip_empty_exam=False):
+    """Field extraction and CPT/ICD-10 matching shared by every entry point"""
+    patient_data = extract_fields(raw_text)
+    patient_data['exam_description'] = normalize_exam_description(patient_data)
+
+    if skip_empty_exam and not patient_data.get('exam_description'):
+        cpt_matches = []
+    else:
+        cpt_matches = match_cpt_code(
+            patient_data.get('exam_description', ''),
+            top_n=3
+        )
+
+    # extract_fields already dropped the scoped words of the description
+    icd_matches = match_icd10_code(
+        patient_data.get('icd_diagnosis_description', ''),
+        top_n=3,
+        scopes=()
+    )
+    return patient_data, cpt_matches, icd_matches
+
+
+def report_fields(patient_data, file_name=None):
+    """MedicalReport column values for extracted patient data.
+
+    ``file_name`` is the name the report was uploaded under. The upload
+    itself is deleted once coded, so uploaded_file records the name only
+    and has no file in storage behind it.
+    """
+    return dict(
+        patient_name=patient_data.get('name', '-'),
+        age=patient_data.get('age', '-'),
+        gender=patient_data.get('sex', '-'),
+        dob=parse_date(patient_data.get('dob')),
+        mrn=patient_data.get('mrn', '-'),
+        date_of_service=parse_date(patient_data.get('date_of_service')),
+        exam=patient_data.get('exam', '-'),
+        clinical_indication=patient_data.get('clinical_indication', '-'),
+        findings=patient_data.get('findings', '-'),
+        impression=patient_data.get('impression', '-'),
+        uploaded_file=file_name or ''
+    )
+
+
+def parse_date(date_str):
+    """Safe date parsing with multiple formats"""
+    if not date_str or date_str == '-':
+        return None
+    for fmt in ('%Y-%m-%d', '%m/%d/%Y', '%d-%b-%y'):
+        try:
+            return datetime.strptime(date_str, fmt).date()
+        except ValueError:
+            continue
+    return None
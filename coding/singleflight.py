@@ -0,0 +1,317 @@
+"""Single-flight coalescing of identical in-flight work.
+
+Scanner and integration retries often send the same document several
+times within milliseconds. Work is keyed on the content hash, and only
+the first caller (the leader) computes. Concurrent duplicates wait for
+it and share its result:
+
+* threads of one process wait on the leader's Event, async requests of
+  one event loop await the leader's Future;
+* other processes see the leader's ``flight-<key>.lock`` file locked
+  (``fcntl.flock``) and poll for its ``flight-<key>.json`` result.
+
+A published result is reused for RESULT_TTL seconds, which also covers
+a retry that arrives just after the first upload finished. Only
+results the caller's ``publishable`` accepts are published, by default
+any non-empty one: a failed or deadline-degraded OCR is recomputed by
+the next duplicate. A caller with a later deadline (``expires_at``)
+than the leader does not share its result in-process, it waits for a
+published one or computes its own.
+
+The flight files live in the upload temp dir. A result holds report
+text, so only its owner can read it, and it is removed as soon as its
+RESULT_TTL is over: by a reaper thread of the publishing process, by a
+reader that finds it expired, or by the upload sweeper after a crash.
+Where ``fcntl`` is missing (Windows) only the in-process coalescing and
+the result reuse apply.
+"""
+import os
+import json
+import time
+import heapq
+import asyncio
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+
+from . import metrics
+from .uploads import upload_temp_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RESULT_TTL = getattr(settings, 'SINGLEFLIGHT_RESULT_TTL', 60)
+WAIT_TIMEOUT = getattr(settings, 'SINGLEFLIGHT_WAIT_TIMEOUT', 300)
+POLL_INTERVAL = 0.05
+
+# How a caller got its result
+LEADER = 'leader'
+JOINED_LOCAL = 'local'
+JOINED_PROCESS = 'process'
+
+
+def content_key(uploaded_file, path, namespace='ocr'):
+    """Key for work on an upload: its SHA-256 (from the upload handler) and extension."""
+    digest = getattr(uploaded_file, 'sha256', None)
+    if not digest:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+    return f"{namespace}-{digest}{os.path.splitext(uploaded_file.name)[1].lower()}"
+
+
+# ---------- CROSS-PROCESS ----------
+def _flight_path(key, suffix):
+    return os.path.join(upload_temp_dir(), f"flight-{key}{suffix}")
+
+
+def _read_result(key):
+    """(True, value) for a result published less than RESULT_TTL seconds ago, else (False, None)."""
+    path = _flight_path(key, '.json')
+    try:
+        if time.time() - os.stat(path).st_mtime > RESULT_TTL:
+            _remove_result(path)
+            return False, None
+        with open(path, encoding='utf-8') as f:
+            return True, json.load(f)
+    except (OSError, ValueError):
+        return False, None
+
+
+def _publish(key, value):
+    path = _flight_path(key, '.json')
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+        _expire_later(path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not publish single-flight result {key}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _remove_result(path, published=None):
+    """Remove a result file, only the publication of mtime ``published`` when given."""
+    try:
+        if published is None or os.stat(path).st_mtime_ns == published:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+# Results this process published, a heap of (expiry in monotonic() time, path, mtime)
+_published = []
+_published_changed = threading.Condition()
+_reaper = None
+
+
+def _expire_later(path):
+    global _reaper
+    published = os.stat(path).st_mtime_ns
+    with _published_changed:
+        heapq.heappush(_published, (time.monotonic() + RESULT_TTL, path, published))
+        if _reaper is None or not _reaper.is_alive():  # also after a fork
+            _reaper = threading.Thread(target=_reap, name='singleflight-reaper', daemon=True)
+            _reaper.start()
+        _published_changed.notify()
+
+
+def _reap():
+    """Remove each published result once its RESULT_TTL is over, a republished one is left alone."""
+    while True:
+        with _published_changed:
+            while not _published:
+                _published_changed.wait()
+            expires, path, published = _published[0]
+            delay = expires - time.monotonic()
+            if delay > 0:
+                _published_changed.wait(delay)
+                continue
+            heapq.heappop(_published)
+        _remove_result(path, published)
+
+
+def _try_lock(key):
+    """Open file descriptor holding the key's lock, or None when another process holds it."""
+    fd = os.open(_flight_path(key, '.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except BlockingIOError:
+        os.close(fd)
+        return None
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def _joined_process(value):
+    metrics.incr('singleflight.coalesced.process')
+    return value, JOINED_PROCESS
+
+
+def _led(value, key, publishable=bool):
+    # An empty result usually means the work failed, waiting processes retry it themselves
+    if publishable(value):
+        _publish(key, value)
+    metrics.incr('singleflight.leader')
+    return value, LEADER
+
+
+def _wait_deadline(expires_at):
+    """monotonic() time to stop waiting for a leader: WAIT_TIMEOUT, or sooner for a caller's deadline"""
+    wait = WAIT_TIMEOUT if expires_at is None else min(WAIT_TIMEOUT, max(expires_at - time.time(), 0))
+    return time.monotonic() + wait
+
+
+def _joins(expires_at, leader_expires_at):
+    """Whether a caller due at ``expires_at`` may share the result of a leader due at ``leader_expires_at``"""
+    if leader_expires_at is None:
+        return True
+    return expires_at is not None and expires_at <= leader_expires_at
+
+
+def _timed_out(key):
+    logger.warning(f"Gave up waiting for single-flight {key} after {WAIT_TIMEOUT}s, computing")
+    metrics.incr('singleflight.wait_timeout')
+
+
+def _fly(key, compute, publishable=bool, expires_at=None):
+    deadline = _wait_deadline(expires_at)
+    while True:
+        found, value = _read_result(key)
+        if found:
+            return _joined_process(value)
+        fd = _try_lock(key)
+        if fd is not None:
+            try:
+                # The previous leader may have published between the two checks
+                found, value = _read_result(key)
+                if found:
+                    return _joined_process(value)
+                return _led(compute(), key, publishable)
+            finally:
+                _unlock(fd)
+        if time.monotonic() > deadline:
+            _timed_out(key)
+            return compute(), LEADER
+        time.sleep(POLL_INTERVAL)
+
+
+async def _afly(key, compute, publishable=bool, expires_at=None):
+    deadline = _wait_deadline(expires_at)
+    while True:
+        found, value = _read_result(key)
+        if found:
+            return _joined_process(value)
+        fd = _try_lock(key)
+        if fd is not None:
+            try:
+                found, value = _read_result(key)
+                if found:
+                    return _joined_process(value)
+                return _led(await compute(), key, publishable)
+            finally:
+                _unlock(fd)
+        if time.monotonic() > deadline:
+            _timed_out(key)
+            return await compute(), LEADER
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+# ---------- IN-PROCESS ----------
+class _Call:
+    def __init__(self, expires_at=None):
+        self.done = threading.Event()
+        self.expires_at = expires_at
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+_futures = {}
+
+
+def coalesce(key, compute, publishable=bool, expires_at=None):
+    """Return (compute() or a concurrent duplicate's result, how it was obtained).
+
+    ``compute`` must return something JSON serializable, it is published
+    for other processes when ``publishable`` accepts it. ``expires_at``
+    is the caller's deadline (time.time()), see the module docstring.
+    An exception raised by the leader is raised in the threads waiting
+    on it too.
+    """
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call(expires_at)
+    if not leader and not _joins(expires_at, call.expires_at):
+        # The leader may give up sooner than this caller has to
+        metrics.incr('singleflight.outlasted')
+        return _fly(key, compute, publishable, expires_at)
+    if not leader:
+        if not call.done.wait(WAIT_TIMEOUT):
+            _timed_out(key)
+            return compute(), LEADER
+        metrics.incr('singleflight.coalesced.local')
+        if call.error is not None:
+            raise call.error
+        return call.result, JOINED_LOCAL
+
+    try:
+        call.result, how = _fly(key, compute, publishable, expires_at)
+        return call.result, how
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+async def coalesce_async(key, compute, publishable=bool, expires_at=None):
+    """coalesce() for coroutines, ``compute`` is called to get an awaitable."""
+    flight = _futures.get(key)
+    if flight is not None:
+        future, leader_expires_at = flight
+        if not _joins(expires_at, leader_expires_at):
+            metrics.incr('singleflight.outlasted')
+            return await _afly(key, compute, publishable, expires_at)
+        result = await asyncio.shield(future)
+        metrics.incr('singleflight.coalesced.local')
+        return result, JOINED_LOCAL
+
+    future = asyncio.get_running_loop().create_future()
+    _futures[key] = (future, expires_at)
+    try:
+        result, how = await _afly(key, compute, publishable, expires_at)
+        future.set_result(result)
+        return result, how
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # retrieved, so an unawaited future does not log it
+        raise
+    finally:
+        _futures.pop(key, None)
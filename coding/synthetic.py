@@ -0,0 +1,243 @@
+"""Streaming generator of synthetic radiology reports with ground-truth codes.
+
+Reports have the layout extract_fields() parses: header fields, an
+OrdEx line, clinical indication, findings and a numbered impression.
+The exam is drawn from the CPT mapping (imaging entries) and the
+diagnoses from the ICD mapping, falling back to the CPTCode/ICD10Code
+tables when a mapping is missing. Each row carries the codes the report
+was generated from. Findings also mention negated diagnoses ("No
+evidence of ...") that are not part of the ground truth, to test the
+negation handling.
+
+Generation is chunked: chunk ``n`` of a corpus depends only on the seed
+and ``n``, so a corpus is identical whatever the number of worker
+processes. Rows stream to numbered CSV or JSONL part files and any
+number of reports fits in constant memory. Optionally every Nth report
+is also rendered to PNG or PDF to exercise the OCR path.
+"""
+import os
+import csv
+import json
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+FIELDS = ('id', 'text', 'cpt_code', 'exam', 'icd_codes', 'diagnoses', 'negated', 'document')
+FORMATS = ('jsonl', 'csv')
+RENDER_FORMATS = ('png', 'pdf')
+
+FIRST_NAMES = ("James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David",
+               "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah",
+               "Carlos", "Maria", "Wei", "Aisha", "Raj", "Priya", "Ahmed", "Fatima", "Kenji", "Olga")
+LAST_NAMES = ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Lee",
+              "Nguyen", "Patel", "Kim", "Chen", "Singh", "Okafor", "Ivanova", "Tanaka", "Haddad")
+INDICATIONS = ("{dx}", "Evaluate for {dx}", "History of {dx}", "{dx}, follow up", "Rule out {dx}",
+               "Pain, {dx}")
+FINDINGS = ("There is {dx}.", "Findings are consistent with {dx}.", "{dx} is again noted.",
+            "Appearance compatible with {dx}.")
+NEGATED = ("No evidence of {dx}.", "Negative for {dx}.", "No {dx} is seen.")
+NORMAL = ("Osseous structures are intact.", "No acute abnormality otherwise.",
+          "Soft tissues are unremarkable.", "No pleural effusion.")
+
+
+def _modality_entries(entries):
+    # Radiology reports order imaging exams, the other CPT entries are noise here
+    from .matching import MODALITY_PREFIXES
+
+    imaging = [(key, code) for key, code in entries if key.split(" ", 1)[0].upper() in MODALITY_PREFIXES]
+    return imaging or entries
+
+
+def load_vocabulary(kind):
+    """[(description, code)] to draw ``kind`` ('cpt' or 'icd') ground truth from."""
+    from .matching import get_code_mapping
+    from .models import CPTCode, ICD10Code
+
+    store = get_code_mapping(kind)
+    if store is not None:
+        entries = [(key.strip(), code.strip()) for _, (key, code) in store.normalized_items()]
+    else:
+        model = CPTCode if kind == 'cpt' else ICD10Code
+        entries = list(model.objects.values_list('description', 'code'))
+    entries = sorted({(key, code) for key, code in entries if key and code})
+    if kind == 'cpt':
+        entries = _modality_entries(entries)
+    if not entries:
+        raise ValueError(f"No {kind.upper()} mapping or table rows to draw ground truth from")
+    return entries
+
+
+def load_vocabularies():
+    return {'cpt': load_vocabulary('cpt'), 'icd': load_vocabulary('icd')}
+
+
+def chunk_rng(seed, chunk):
+    """Random generator of one chunk, independent of how chunks are spread over workers."""
+    return random.Random(f"{seed}:{chunk}")
+
+
+def _date(rng, first_year, last_year):
+    return f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(first_year, last_year)}"
+
+
+def _phrase(description):
+    # Mapping keys are upper case or title case, reports read in sentence case
+    return description.strip().rstrip('.').lower()
+
+
+def generate_report(rng, vocab, report_id):
+    """One report row: the text and the codes it was generated from."""
+    exam, cpt_code = rng.choice(vocab['cpt'])
+    diagnoses = rng.sample(vocab['icd'], k=min(len(vocab['icd']), rng.choices((1, 2, 3), (6, 3, 1))[0]))
+    negated = [rng.choice(vocab['icd'])] if rng.random() < 0.3 else []
+    negated = [dx for dx in negated if dx not in diagnoses]
+
+    findings = [rng.choice(FINDINGS).format(dx=_phrase(description)) for description, _ in diagnoses]
+    findings += [rng.choice(NEGATED).format(dx=_phrase(description)) for description, _ in negated]
+    findings += rng.sample(NORMAL, k=rng.randint(0, 2))
+    rng.shuffle(findings)
+    findings = [sentence[0].upper() + sentence[1:] for sentence in findings]
+    impression = [f"{number}. {description.strip().rstrip('.')}" for number, (description, _) in
+                  enumerate(diagnoses, 1)]
+
+    lines = [
+        f"Patient Name: {rng.choice(LAST_NAMES)}, {rng.choice(FIRST_NAMES)}",
+        f"Age: {rng.randint(1, 95)}",
+        f"Sex: {rng.choice(('M', 'F'))}",
+        f"DOB: {_date(rng, 1930, 2023)}",
+        f"MRN: {rng.randint(10**6, 10**8 - 1)}",
+        f"Date of Service: {_date(rng, 2022, 2025)}",
+        f"Accession: {rng.randint(10**7, 10**9 - 1)}",
+        f"OrdEx: {exam.upper()}",
+        f"Clinical Indication: {rng.choice(INDICATIONS).format(dx=_phrase(diagnoses[0][0])).capitalize()}",
+        f"Findings: {' '.join(findings)}",
+        f"Impression: {' '.join(impression)}",
+    ]
+    return {
+        'id': report_id,
+        'text': "\n".join(lines) + "\n",
+        'cpt_code': cpt_code,
+        'exam': exam,
+        'icd_codes': "|".join(code for _, code in diagnoses),
+        'diagnoses': "|".join(description for description, _ in diagnoses),
+        'negated': "|".join(description for description, _ in negated),
+        'document': '',
+    }
+
+
+# ---------- RENDERING ----------
+def render_report(text, path):
+    """Render a report as a scanned-looking page, PNG or PDF by ``path``'s extension."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, margin, line_height = 1275, 90, 34   # letter width at 150 dpi
+    try:
+        font = ImageFont.load_default(size=24)
+    except TypeError:  # Pillow < 10.1 has only the small bitmap font
+        font = ImageFont.load_default()
+    wrapped = []
+    for line in text.splitlines():
+        while len(line) > 90:
+            cut = line.rfind(' ', 0, 90)
+            cut = cut if cut > 0 else 90
+            wrapped.append(line[:cut])
+            line = line[cut:].lstrip()
+        wrapped.append(line)
+    page = Image.new('L', (width, max(1650, 2 * margin + line_height * len(wrapped))), 255)
+    draw = ImageDraw.Draw(page)
+    for number, line in enumerate(wrapped):
+        draw.text((margin, margin + number * line_height), line, fill=0, font=font)
+    if path.endswith('.pdf'):
+        page.save(path, 'PDF', resolution=150)
+    else:
+        page.save(path)
+    page.close()
+
+
+# ---------- CHUNKS ----------
+_vocab = None
+
+
+def _init_worker(vocab):
+    global _vocab
+    _vocab = vocab
+
+
+def generate_chunk(seed, chunk, chunk_size, count, vocab=None, render=None, render_every=0, document_dir=None):
+    """Rows of chunk ``chunk``: report ids chunk * chunk_size up to ``count``."""
+    vocab = vocab or _vocab
+    rng = chunk_rng(seed, chunk)
+    rows = []
+    for report_id in range(chunk * chunk_size, min((chunk + 1) * chunk_size, count)):
+        row = generate_report(rng, vocab, report_id)
+        if render and render_every and report_id % render_every == 0:
+            row['document'] = os.path.join(document_dir, f"report-{report_id:08d}.{render}")
+            render_report(row['text'], row['document'])
+        rows.append(row)
+    return rows
+
+
+def iter_reports(count, seed=0, chunk_size=10000, workers=1, vocab=None, render=None, render_every=0,
+                 document_dir=None):
+    """Yield ``count`` report rows in id order, generating chunks in ``workers`` processes."""
+    vocab = vocab or load_vocabularies()
+    if render:
+        os.makedirs(document_dir, exist_ok=True)
+    chunks = range((count + chunk_size - 1) // chunk_size)
+    options = dict(render=render, render_every=render_every, document_dir=document_dir)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from generate_chunk(seed, chunk, chunk_size, count, vocab, **options)
+        return
+
+    # The vocabulary goes to each worker once, at most 2 chunks per worker are in flight
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(vocab,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(generate_chunk, seed, chunk, chunk_size, count, **options))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# ---------- OUTPUT ----------
+def write_corpus(rows, output_dir, fmt='jsonl', rows_per_file=100000):
+    """Stream rows into part-00000.<fmt>, part-00001.<fmt>, ... and return the file paths."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    f = writer = None
+    try:
+        for index, row in enumerate(rows):
+            if index % rows_per_file == 0:
+                if f:
+                    f.close()
+                paths.append(os.path.join(output_dir, f"part-{len(paths):05d}.{fmt}"))
+                f = open(paths[-1], 'w', encoding='utf-8', newline='')
+                if fmt == 'csv':
+                    writer = csv.DictWriter(f, fieldnames=FIELDS)
+                    writer.writeheader()
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row) + "\n")
+    finally:
+        if f:
+            f.close()
+    return paths
+
+
+def read_corpus(paths):
+    """Yield the rows of part files written by write_corpus()."""
+    for path in paths:
+        with open(path, encoding='utf-8', newline='') as f:
+            if path.endswith('.csv'):
+                for row in csv.DictReader(f):
+                    row['id'] = int(row['id'])
+                    yield row
+            else:
+                for line in f:
+                    yield json.loads(line)
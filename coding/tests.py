@@ -1,4 +1,8 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 
@@ -11,3 +15,1404 @@ class PredictCPTTest(TestCase):
         response = self.client.post(self.url, {'description': 'MRI scan for head injury'}, format='json')
         self.assertEqual(response.status_code, 200)
         self.assertIn('predicted_cpt', response.data)
+
+
+class LinearModelTest(SimpleTestCase):
+    def test_streaming_training_round_trip(self):
+        from ai_model.linear_model import LinearCPTModel, train_streaming
+
+        batches = [
+            (["ct scan of the abdomen", "knee replacement surgery"], ["74176", "27447"]),
+        ] * 10
+        model, stats = train_streaming(batches, ["74176", "27447"])
+        self.assertEqual(stats["samples"], 20)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = model.save(os.path.join(tmp, "model.npz"))
+            loaded = LinearCPTModel.load(path)
+        self.assertEqual(list(loaded.predict(["ct scan of the abdomen"])), ["74176"])
+
+        # Unseen CPT codes are added without retraining from scratch
+        updated, _ = train_streaming([(["chest xray two views"], ["71046"])] * 10, ["71046"], model=loaded)
+        self.assertEqual(sorted(updated.classes), ["27447", "71046", "74176"])
+        self.assertEqual(list(updated.predict(["chest xray two views"])), ["71046"])
+
+
+    def test_exported_classifier_survives_npz_round_trip(self):
+        import numpy as np
+        from ai_model.linear_model import LinearCPTModel, train_linear
+
+        texts = ["ct scan of the abdomen", "knee replacement surgery", "chest xray two views"] * 4
+        labels = ["74176", "27447", "71046"] * 4
+        model = train_linear(texts, labels)
+        self.assertEqual(list(model.predict(texts[:3])), labels[:3])
+        self.assertEqual(len(model.predict([])), 0)
+
+        buffer = io.BytesIO()
+        model.write(buffer)
+        buffer.seek(0)
+        loaded = LinearCPTModel.load(buffer)
+        self.assertEqual(list(loaded.classes), list(model.classes))
+        self.assertEqual((loaded.n_features, loaded.ngram_range), (model.n_features, model.ngram_range))
+        self.assertEqual(loaded.metadata, model.metadata)
+        np.testing.assert_allclose(loaded.decision_function(texts), model.decision_function(texts))
+
+    def test_binary_classifier_exports_one_row_per_class(self):
+        from ai_model.linear_model import train_linear
+
+        model = train_linear(["ct scan of the abdomen", "knee replacement surgery"] * 5, ["74176", "27447"] * 5)
+        self.assertEqual(model.weights.shape, (2, model.n_features))
+        self.assertEqual(list(model.predict(["knee replacement surgery", "ct scan of the abdomen"])), ["27447", "74176"])
+
+
+    def test_failed_save_leaves_neither_temp_file_nor_partial_model(self):
+        from unittest import mock
+        from ai_model.linear_model import LinearCPTModel, train_linear
+
+        model = train_linear(["ct scan of the abdomen", "knee replacement surgery"], ["74176", "27447"])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.npz")
+            model.save(path)
+            model.save(path)
+            self.assertEqual(os.listdir(tmp), ["model.npz"])
+            with mock.patch.object(LinearCPTModel, 'write', side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    model.save(path)
+            self.assertEqual(os.listdir(tmp), ["model.npz"])
+            self.assertEqual(list(LinearCPTModel.load(path).classes), list(model.classes))
+
+
+class PredictModelSelectionTest(SimpleTestCase):
+    def setUp(self):
+        from unittest import mock
+
+        forest, vectorizer = mock.Mock(), mock.Mock()
+        forest.predict.return_value = ["99999"]
+        patcher = mock.patch('ai_model.predict.load_forest', return_value=(forest, vectorizer))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_random_forest_is_served_unless_linear_model_is_enabled(self):
+        from unittest import mock
+        from ai_model import predict
+
+        linear = mock.Mock()
+        linear.predict.return_value = ["71046"]
+        with mock.patch('ai_model.predict.load_current_model', return_value=linear):
+            self.assertEqual(predict.predict_cpt("chest xray"), "99999")
+            with self.settings(CPT_LINEAR_MODEL=True):
+                self.assertEqual(predict.predict_cpt("chest xray"), "71046")
+
+    def test_missing_or_broken_linear_artifact_falls_back_to_random_forest(self):
+        from unittest import mock
+        from ai_model import predict
+
+        with self.settings(CPT_LINEAR_MODEL=True):
+            with mock.patch('ai_model.predict.load_current_model', return_value=None):
+                self.assertEqual(predict.predict_cpt("chest xray"), "99999")
+            with mock.patch('ai_model.predict.load_current_model', side_effect=ValueError("bad npz")):
+                with self.assertLogs('ai_model.predict', 'ERROR'):
+                    self.assertEqual(predict.predict_cpt("chest xray"), "99999")
+
+
+class RetrainModelCommandTest(TestCase):
+    def test_checkpoint_advances_and_artifact_is_swapped(self):
+        from django.core.management import call_command
+        from ai_model.linear_model import LinearCPTModel
+        from .models import CPTCode, MedicalReport
+
+        ct = CPTCode.objects.create(code='74176', description='CT ABDOMEN')
+        knee = CPTCode.objects.create(code='27447', description='KNEE ARTHROPLASTY')
+        for _ in range(5):
+            MedicalReport.objects.create(exam='CT abdomen and pelvis', cpt_code=ct)
+            MedicalReport.objects.create(exam='Total knee replacement', cpt_code=knee)
+        last = MedicalReport.objects.create(exam='-', cpt_code=None)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.npz')
+            call_command('retrain_model', model=path, batch_size=3, stdout=io.StringIO())
+            model = LinearCPTModel.load(path)
+            self.assertEqual(sorted(model.classes), ['27447', '74176'])
+            self.assertEqual(model.metadata['last_report_id'], last.id - 1)
+
+            out = io.StringIO()
+            call_command('retrain_model', model=path, stdout=out)
+            self.assertIn('model unchanged', out.getvalue())
+
+
+class EmbeddingIndexTest(SimpleTestCase):
+    def test_ivf_search_returns_nearest_keys(self):
+        from .embedding_index import EmbeddingIndex, build_embedding_index
+
+        mapping = {f"XR {part} - {n} VIEWS": str(71000 + i * 10 + n)
+                   for i, part in enumerate(["CHEST", "KNEE", "HAND", "FOOT", "ANKLE", "WRIST"])
+                   for n in range(1, 5)}
+        with tempfile.TemporaryDirectory() as tmp:
+            for dtype in ("float16", "int8"):
+                build_embedding_index(mapping, tmp, dims=16, dtype=dtype, n_lists=3)
+                index = EmbeddingIndex(tmp)
+                key, code, score = index.search("xr knee 2 views", k=3, nprobe=3)[0]
+                self.assertEqual(key, "XR KNEE - 2 VIEWS")
+                self.assertGreater(score, 0.9)
+
+    def test_rebuild_swaps_directory_and_stale_index_is_not_served(self):
+        import json
+        from unittest import mock
+        from . import embedding_index
+        from .embedding_index import build_embedding_index, get_embedding_index
+        from .mapping_store import source_digest
+
+        mapping = {f"XR {part} - 2 VIEWS": str(71000 + i) for i, part in enumerate(["CHEST", "KNEE", "HAND"])}
+        with tempfile.TemporaryDirectory() as tmp:
+            mapping_path = os.path.join(tmp, 'cpt.json')
+            with open(mapping_path, 'w', encoding='utf-8') as f:
+                json.dump(mapping, f)
+            with open(mapping_path, 'rb') as f:
+                digest = source_digest(f.read()).hex()
+            self.addCleanup(embedding_index._indexes.clear)
+            with mock.patch.object(embedding_index, 'INDEX_ROOT', tmp), \
+                    mock.patch.dict(embedding_index.MAPPING_FILES, cpt=mapping_path):
+                build_embedding_index(mapping, os.path.join(tmp, 'cpt'), dims=4, source_sha256=digest)
+                served = get_embedding_index('cpt')
+                self.assertIsNotNone(served)
+
+                # The mapped files of the served index survive a rebuild untouched
+                build_embedding_index(mapping, os.path.join(tmp, 'cpt'), dims=4, source_sha256=digest)
+                self.assertEqual(served.search("xr knee 2 views", k=1)[0][0], "XR KNEE - 2 VIEWS")
+                self.assertEqual(sorted(os.listdir(tmp)), ['cpt', 'cpt.json'])
+
+                with open(mapping_path, 'w', encoding='utf-8') as f:
+                    json.dump(dict(mapping, **{"CT HEAD": "70450"}), f)
+                with self.assertLogs('coding.embedding_index', 'WARNING'):
+                    self.assertIsNone(get_embedding_index('cpt'))
+
+
+class MappingStoreTest(SimpleTestCase):
+    def test_compiled_store_matches_source_mapping(self):
+        from .mapping_store import MappingStore, build_mapping_store, source_digest
+
+        mapping = {"XR CHEST - 2 VIEWS": "71046 ", "XR KNEE - 3 VIEWS": "73562", "CT HEAD": "70450"}
+        data = build_mapping_store(mapping, str.lower, "cpt", source_digest(b"src"))
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            store = MappingStore.open(f.name)
+
+            self.assertEqual(len(store), 3)
+            self.assertEqual(store.source_sha256, source_digest(b"src"))
+            entry = store.find("xr knee - 3 views")
+            self.assertEqual((store.key(entry), store.code(entry)), ("XR KNEE - 3 VIEWS", "73562"))
+            self.assertEqual(store.find("xr knee"), -1)
+            self.assertEqual(sorted(store.code(i) for i in store.entries_with_any(["xr", "missing"])),
+                             ["71046", "73562"])
+            self.assertEqual(dict(store.normalized_items())["ct head"], ("CT HEAD", "70450"))
+
+    def test_store_compiled_under_other_rules_is_not_loaded(self):
+        import json
+        from unittest import mock
+        from . import mapping_store
+        from .mapping_store import load_mapping_store, write_mapping_store
+
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path, bin_path = os.path.join(tmp, "cpt.json"), os.path.join(tmp, "cpt.bin")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump({"CT HEAD": "70450"}, f)
+            write_mapping_store(json_path, bin_path, str.lower, "cpt", rules_version=1)
+            self.assertEqual(sorted(os.listdir(tmp)), ["cpt.bin", "cpt.json"])
+
+            with mock.patch.dict(mapping_store._stores, clear=True):
+                self.assertEqual(load_mapping_store("cpt", json_path, bin_path, str.lower, 1).rules_version, 1)
+            with mock.patch.dict(mapping_store._stores, clear=True), \
+                    self.assertLogs('coding.mapping_store', 'WARNING'):
+                store = load_mapping_store("cpt", json_path, bin_path, str.upper, 2)
+            self.assertEqual(store.find("CT HEAD"), 0)
+
+    def test_icd_keys_keep_negation_words_through_compile_mappings(self):
+        import json
+        from unittest import mock
+        from django.core.management import call_command
+        from .mapping_store import COMPILED_MAPPING_FILES, MAPPING_FILES, MappingStore
+
+        # Catalogue wording that the report-text negation scoping would truncate
+        mapping = {
+            "Acquired absence of right leg below knee": "Z89.511",
+            "Acquired absence of left leg above knee": "Z89.612",
+            "Contact with and (suspected) exposure to tuberculosis": "Z20.1",
+            "Contact with and (suspected) exposure to anthrax": "Z20.810",
+            "Dementia, not elsewhere classified": "F03",
+            "Encounter for observation for suspected tuberculosis ruled out": "Z03.89",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path, bin_path = os.path.join(tmp, "icd.json"), os.path.join(tmp, "icd.bin")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(mapping, f)
+            with mock.patch.dict(MAPPING_FILES, {"icd": json_path}), \
+                    mock.patch.dict(COMPILED_MAPPING_FILES, {"icd": bin_path}):
+                call_command("compile_mappings", kind="icd", stdout=io.StringIO())
+            store = MappingStore.open(bin_path)
+            self.assertEqual(len(store), len(mapping))
+            self.assertEqual(sorted(store.code(i) for i in range(len(store))), sorted(mapping.values()))
+            entry = store.find("dementia, not elsewhere classified")
+            self.assertEqual(store.code(entry), "F03")
+
+
+class AsyncViewsTest(TestCase):
+    def test_text_async_view_codes_and_saves_report(self):
+        from .models import MedicalReport
+
+        response = self.client.post(
+            reverse('predict_cpt_text_async'),
+            {'text': 'OrdEx: XR CHEST 2 VIEWS\nImpression: Headache'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['cpt_prediction']['code'], '71045')
+        self.assertTrue(MedicalReport.objects.filter(id=data['report_id']).exists())
+
+    def test_text_async_view_rejects_json_that_is_not_an_object(self):
+        for body in ('["OrdEx: XR CHEST 2 VIEWS"]', '"OrdEx: XR CHEST 2 VIEWS"', '42'):
+            response = self.client.post(reverse('predict_cpt_text_async'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_image_async_view_checks_pages_and_removes_upload_off_the_event_loop(self):
+        import asyncio
+        from unittest import mock
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .uploads import UploadRejected
+
+        in_event_loop = []
+
+        def check_page_limit(path):
+            try:
+                asyncio.get_running_loop()
+                in_event_loop.append(path)
+            except RuntimeError:
+                pass
+            raise UploadRejected("Too many pages, limit is 20", 413)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        upload = SimpleUploadedFile('scan.pdf', b'%PDF-1.4 not really a pdf')
+        with self.settings(UPLOAD_TEMP_DIR=tmp.name), \
+                mock.patch('coding.uploads.check_page_limit', side_effect=check_page_limit) as checked:
+            response = self.client.post(reverse('predict_cpt_image_async'), {'file': upload})
+        self.assertEqual(response.status_code, 413)
+        checked.assert_called_once()
+        self.assertEqual(in_event_loop, [])
+        self.assertEqual(os.listdir(tmp.name), [])
+
+    def test_image_async_view_rejects_when_ocr_queue_is_full(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from . import executors
+
+        upload = SimpleUploadedFile('scan.png', b'not really a png')
+        limit = executors.ocr_admission.limit
+        executors.ocr_admission.limit = 0
+        try:
+            response = self.client.post(reverse('predict_cpt_image_async'), {'file': upload})
+        finally:
+            executors.ocr_admission.limit = limit
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+class StreamingViewTest(TestCase):
+    def test_image_stream_emits_stage_events(self):
+        import json
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        upload = SimpleUploadedFile('report.txt', b'OrdEx: XR CHEST 2 VIEWS\nImpression: Headache reported today')
+        response = self.client.post(reverse('predict_cpt_image_stream'), {'file': upload})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([e['event'] for e in events], ['page', 'fields', 'cpt', 'icd', 'done'])
+        self.assertIn('report_id', events[-1])
+
+    def test_image_stream_goes_through_the_ocr_lane(self):
+        import json
+        from unittest import mock
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .executors import ocr_lane
+
+        def post():
+            upload = SimpleUploadedFile('report.txt', b'OrdEx: XR CHEST 2 VIEWS\nImpression: Headache reported today')
+            response = self.client.post(reverse('predict_cpt_image_stream'), {'file': upload})
+            return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        with mock.patch.object(ocr_lane.admission, 'limit', 0):
+            self.assertEqual(post(), [{'event': 'error', 'error': 'OCR queue is full, retry later', 'status': 429}])
+        with mock.patch.object(ocr_lane, 'submit', wraps=ocr_lane.submit) as submit:
+            self.assertEqual(post()[-1]['event'], 'done')
+        self.assertEqual(submit.call_count, 1)
+        self.assertEqual(ocr_lane.admission.in_flight, 0)
+
+
+class UploadHandlingTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_oversized_upload_is_rejected_and_leaves_no_temp_file(self):
+        from unittest import mock
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        upload = SimpleUploadedFile('scan.png', b'x' * 4096)
+        with self.settings(UPLOAD_TEMP_DIR=self.tmp.name), \
+                mock.patch('coding.uploads.MAX_UPLOAD_SIZE', 1024):
+            response = self.client.post(reverse('predict_cpt_image'), {'file': upload})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_handler_hashes_upload_and_staged_file_is_removed(self):
+        import hashlib
+        from django.test import RequestFactory
+        from .uploads import ReportUploadHandler, staged_upload
+
+        content = b'OrdEx: XR CHEST 2 VIEWS\n'
+        with self.settings(UPLOAD_TEMP_DIR=self.tmp.name):
+            handler = ReportUploadHandler(RequestFactory().post('/'))
+            handler.new_file('file', 'report.txt', 'text/plain', len(content))
+            handler.receive_data_chunk(content, 0)
+            uploaded = handler.file_complete(len(content))
+            self.assertEqual(uploaded.sha256, hashlib.sha256(content).hexdigest())
+
+            with staged_upload(uploaded) as path:
+                self.assertEqual(os.path.dirname(path), self.tmp.name)
+                with open(path, 'rb') as f:
+                    self.assertEqual(f.read(), content)
+            self.assertFalse(os.path.exists(path))
+
+    def test_report_handler_is_scoped_to_report_views(self):
+        from asgiref.sync import async_to_sync
+        from django.core.files.uploadhandler import MemoryFileUploadHandler
+        from django.test import RequestFactory
+        from .uploads import ReportUploadHandler, report_upload_handlers
+
+        def handlers(request):
+            return [type(handler) for handler in request.upload_handlers]
+
+        async def async_handlers(request):
+            return handlers(request)
+
+        self.assertIn(MemoryFileUploadHandler, handlers(RequestFactory().post('/')))
+        self.assertEqual(report_upload_handlers(handlers)(RequestFactory().post('/')), [ReportUploadHandler])
+        self.assertEqual(async_to_sync(report_upload_handlers(async_handlers))(RequestFactory().post('/')),
+                         [ReportUploadHandler])
+
+    def test_report_keeps_only_the_uploaded_file_name(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import MedicalReport
+
+        upload = SimpleUploadedFile('report.txt', b'OrdEx: XR CHEST 2 VIEWS\nImpression: Headache reported today')
+        with self.settings(UPLOAD_TEMP_DIR=self.tmp.name):
+            response = self.client.post(reverse('predict_cpt_image'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MedicalReport.objects.get(pk=response.json()['report_id']).uploaded_file.name, 'report.txt')
+        self.assertFalse([name for name in os.listdir(self.tmp.name) if '.upload' in name])
+
+
+class CodeReportsCommandTest(TestCase):
+    def test_codes_directory_and_zip_then_resumes_from_ledger(self):
+        import zipfile
+        from django.core.management import call_command
+        from .models import MedicalReport
+
+        text = b'OrdEx: XR CHEST 2 VIEWS\nClinical Indication: cough for two weeks\nImpression: Headache\n'
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, 'in'))
+            for name in ('a.txt', 'b.txt'):
+                with open(os.path.join(tmp, 'in', name), 'wb') as f:
+                    f.write(text)
+            with zipfile.ZipFile(os.path.join(tmp, 'more.zip'), 'w') as archive:
+                archive.writestr('c.txt', text)
+            args = [os.path.join(tmp, 'in'), os.path.join(tmp, 'more.zip'), '--workers', '0',
+                    '--ledger', os.path.join(tmp, 'ledger.jsonl'), '--output', os.path.join(tmp, 'out.csv')]
+
+            call_command('code_reports', *args, stdout=io.StringIO())
+            self.assertEqual(MedicalReport.objects.count(), 3)
+
+            out = io.StringIO()
+            call_command('code_reports', *args, stdout=out)
+            self.assertEqual(MedicalReport.objects.count(), 3)
+            self.assertIn('3 skipped from ledger', out.getvalue())
+            with open(os.path.join(tmp, 'out.csv')) as f:
+                self.assertEqual(len(f.readlines()), 4)
+
+    def test_archive_is_opened_once_for_all_its_members(self):
+        import zipfile
+        from unittest import mock
+        from django.core.management import call_command
+        from .models import MedicalReport
+
+        text = 'OrdEx: XR CHEST 2 VIEWS\nClinical Indication: cough for two weeks\nImpression: Headache\n'
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'reports.zip')
+            with zipfile.ZipFile(path, 'w') as archive:
+                for name in ('a.txt', 'b.txt', 'c.txt'):
+                    archive.writestr(name, text)
+            with mock.patch('coding.ingest.zipfile.ZipFile', wraps=zipfile.ZipFile) as opened:
+                call_command('code_reports', path, '--workers', '0', '--ledger', os.path.join(tmp, 'ledger.jsonl'),
+                             stdout=io.StringIO())
+        # Once to list the members, once to read them
+        self.assertEqual(opened.call_count, 2)
+        self.assertEqual(MedicalReport.objects.count(), 3)
+
+    def test_dead_worker_keeps_finished_results_for_resume(self):
+        from concurrent.futures import Future
+        from concurrent.futures.process import BrokenProcessPool
+        from unittest import mock
+        from django.core.management import CommandError, call_command
+        from .models import MedicalReport
+
+        class DyingPool:
+            """Runs the first job, then behaves as if a worker process was killed"""
+            def __init__(self, *args, **kwargs):
+                self.submitted = 0
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def submit(self, func, *args):
+                future = Future()
+                if self.submitted:
+                    future.set_exception(BrokenProcessPool("A process in the process pool was terminated"))
+                else:
+                    future.set_result(func(*args))
+                self.submitted += 1
+                return future
+
+        text = b'OrdEx: XR CHEST 2 VIEWS\nClinical Indication: cough for two weeks\nImpression: Headache\n'
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ('a.txt', 'b.txt', 'c.txt'):
+                with open(os.path.join(tmp, name), 'wb') as f:
+                    f.write(text)
+            args = [os.path.join(tmp, '*.txt'), '--ledger', os.path.join(tmp, 'ledger.jsonl')]
+
+            with mock.patch('coding.management.commands.code_reports.ProcessPoolExecutor', DyingPool):
+                with self.assertRaises(CommandError):
+                    call_command('code_reports', *args, '--workers', '2', stdout=io.StringIO())
+            self.assertEqual(MedicalReport.objects.count(), 1)
+
+            out = io.StringIO()
+            call_command('code_reports', *args, '--workers', '0', stdout=out)
+            self.assertEqual(MedicalReport.objects.count(), 3)
+            self.assertIn('1 skipped from ledger', out.getvalue())
+
+
+class ReportExportTest(TestCase):
+    def setUp(self):
+        from datetime import date
+        from .models import CPTCode, MedicalReport
+
+        cpt = CPTCode.objects.create(code='71045', description='XR CHEST 1 VIEW')
+        MedicalReport.objects.create(exam='XR CHEST', cpt_code=cpt, date_of_service=date(2024, 1, 5))
+        MedicalReport.objects.create(exam='XR CHEST', cpt_code=cpt, date_of_service=date(2024, 2, 9))
+        MedicalReport.objects.create(exam='CT HEAD')
+
+    def test_command_writes_date_partitioned_projection(self):
+        import pyarrow.dataset as ds
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'reports')
+            call_command('export_reports', path, '--partition', 'month', '--chunk-size', '2',
+                         '--columns', 'id,exam,cpt_code,cpt_description', stdout=io.StringIO())
+            self.assertEqual(sorted(os.listdir(path)), [
+                'date_of_service=2024-01', 'date_of_service=2024-02', 'date_of_service=__HIVE_DEFAULT_PARTITION__',
+            ])
+            table = ds.dataset(path, format='parquet').to_table()
+            self.assertEqual(table.num_rows, 3)
+            self.assertEqual(table.schema.names, ['id', 'exam', 'cpt_code', 'cpt_description'])
+            self.assertIn('XR CHEST 1 VIEW', table.column('cpt_description').to_pylist())
+
+    def test_api_streams_arrow_and_rejects_unknown_columns(self):
+        import pyarrow as pa
+        from django.contrib.auth.models import User
+
+        # Reports carry patient data, anonymous callers go to the admin login
+        response = self.client.get(reverse('export_reports'), {'format': 'arrow'})
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get(reverse('export_reports'), {'format': 'arrow', 'columns': 'id,cpt_code'})
+        self.assertEqual(response.status_code, 200)
+        table = pa.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.schema.names, ['id', 'cpt_code'])
+
+        response = self.client.get(reverse('export_reports'), {'columns': 'ssn'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReferenceBuilderTest(SimpleTestCase):
+    def test_cpt_parser_joins_wrapped_descriptions_and_prefixes_modality(self):
+        from .reference_builder import iter_lines, parse_cpt_lines
+
+        page = "CT / CTA\nExam/Procedure\nCPT Code\nCT\nHEART - CARDIAC STRUCTURE IN THE SETTING OF \n" \
+               "CONGENITAL HEART DISEASE\n75573\nCT\nENTEROGRAPHY\n74177, 76376 or 76377\nPage 4 of 25\n"
+        stats = {'pages': 0, 'lines': 0}
+        self.assertEqual(list(parse_cpt_lines(iter_lines([page], stats))), [
+            ('CT HEART - CARDIAC STRUCTURE IN THE SETTING OF CONGENITAL HEART DISEASE', '75573'),
+            ('CT ENTEROGRAPHY', '74177'),
+        ])
+
+    def test_icd_parser_formats_codes_and_streams_json(self):
+        import json
+        from .reference_builder import iter_lines, parse_icd_lines, write_mapping
+
+        page = "R51 Headache\nJ18.9 Pneumonia, unspecified\norganism\nS7200XA Fracture of femur\nR51 Headache\n"
+        stats = {'pages': 0, 'lines': 0, 'entries': 0, 'duplicates': 0, 'skipped': 0}
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'icd.json')
+            write_mapping(parse_icd_lines(iter_lines([page], stats)), out, stats)
+            with open(out, encoding='utf-8') as f:
+                mapping = json.load(f)
+        self.assertEqual(mapping, {
+            'Headache': 'R51',
+            'Pneumonia, unspecified organism': 'J18.9',
+            'Fracture of femur': 'S72.00XA',
+        })
+        self.assertEqual(stats['duplicates'], 1)
+
+    def test_failed_or_empty_build_keeps_the_existing_mapping(self):
+        from .reference_builder import write_mapping
+
+        def broken_pages():
+            yield 'Headache', 'R51'
+            raise RuntimeError("extraction worker died")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'icd.json')
+            with open(out, 'w', encoding='utf-8') as f:
+                f.write('{"Live": "R51"}')
+            for entries, error in ((broken_pages(), RuntimeError), (iter(()), ValueError)):
+                stats = {'pages': 0, 'lines': 0, 'entries': 0, 'duplicates': 0, 'skipped': 0}
+                with self.assertRaises(error):
+                    write_mapping(entries, out, stats)
+            self.assertEqual(os.listdir(tmp), ['icd.json'])
+            with open(out, encoding='utf-8') as f:
+                self.assertEqual(f.read(), '{"Live": "R51"}')
+
+
+class CodeCatalogueTest(TestCase):
+    def setUp(self):
+        from .catalogue import load_catalogue
+        from .matching import MAPPING_PREPROCESSORS
+
+        self.mapping = {
+            'CT HEAD WITHOUT CONTRAST': '70450',
+            'CT HEAD WITH CONTRAST': '70460',
+            'XR CHEST 2 VIEWS': '71046',
+            'XR CHEST 2 VIEWS PA AND LATERAL': '71046',
+        }
+        load_catalogue('cpt', self.mapping, MAPPING_PREPROCESSORS['cpt'])
+
+    def test_load_fills_code_table_and_search_endpoint_prefix_matches(self):
+        from .models import CodeDescription, CPTCode
+
+        self.assertEqual(CodeDescription.objects.filter(kind='cpt').count(), 4)
+        self.assertEqual(CPTCode.objects.filter(code__in=['70450', '70460', '71046']).count(), 3)
+
+        response = self.client.get(reverse('search_codes'), {'q': 'ct hea', 'kind': 'cpt'})
+        self.assertEqual(response.status_code, 200)
+        codes = sorted(r['code'] for r in response.json()['results'])
+        self.assertEqual(codes, ['70450', '70460'])
+
+    def test_matcher_uses_catalogue_candidates_only_for_the_fuzzy_step(self):
+        from unittest import mock
+        from . import matching
+
+        with mock.patch.object(matching, 'get_embedding_index', return_value=None), \
+                mock.patch.object(matching, 'catalogue_candidates', wraps=matching.catalogue_candidates) as candidates:
+            # Answered by the keyword combination, before the catalogue is needed
+            result = matching.match_cpt_code('CT HEAD W/O CONTRAST NONCONTRAST')
+            candidates.assert_not_called()
+            self.assertEqual(result[0]['code'], '70450')
+
+            # Misspelt: only the fuzzy step finds it, among the catalogue's candidates
+            result = matching.match_cpt_code('CT HEDA WITHOUT CONTRST')
+        candidates.assert_called_once()
+        self.assertEqual(result[0]['code'], '70450')
+
+    def test_matcher_resolves_exam_with_modality_last(self):
+        from unittest import mock
+        from . import matching
+
+        with mock.patch.object(matching, 'get_embedding_index', return_value=None):
+            result = matching.match_cpt_code('HEAD WITHOUT CONTRAST CT')
+        self.assertEqual(result[0]['code'], '70450')
+
+
+class CPTAttributeIndexTest(SimpleTestCase):
+    def test_parse_attributes(self):
+        from .cpt_attributes import parse_cpt_attributes
+        from .matching import normalize
+
+        attrs = parse_cpt_attributes(normalize('MRI KNEE LEFT W/O CONTRAST'))
+        self.assertEqual((attrs.modality, attrs.body_part, attrs.laterality, attrs.contrast),
+                         ('mri', 'knee', 'left', 'without'))
+        self.assertEqual(parse_cpt_attributes(normalize('XR HIPS BILATERAL 3 VIEWS')).views, 3)
+        self.assertEqual(parse_cpt_attributes('thus chest film').modality, '')
+
+    def test_modality_is_found_anywhere_outside_guidance_phrases(self):
+        from .cpt_attributes import parse_cpt_attributes
+        from .matching import normalize
+
+        for text in ('LEFT KNEE XR', 'XR LEFT KNEE 3 VIEWS', 'KNEE LT XR'):
+            attrs = parse_cpt_attributes(normalize(text))
+            self.assertEqual((attrs.modality, attrs.body_part, attrs.laterality), ('xr', 'knee', 'left'), text)
+        self.assertEqual(parse_cpt_attributes(normalize('SPINAL PUNCTURE THERAPEUTIC WITH FL OR CT GUIDANCE')).modality, '')
+        self.assertEqual(parse_cpt_attributes(normalize('FNA CT GUIDED')).modality, 'ct')
+
+    def test_index_narrows_by_modality_and_body_part(self):
+        from .cpt_attributes import CPTAttributeIndex, feature_score, parse_cpt_attributes
+        from .mapping_store import MappingStore, build_mapping_store
+        from .matching import normalize
+
+        mapping = {
+            'MRI KNEE WITHOUT CONTRAST': '73721',
+            'MRI KNEE WITH CONTRAST': '73722',
+            'MRI HIP WITHOUT CONTRAST': '73721',
+            'CT KNEE WITHOUT CONTRAST': '73700',
+        }
+        store = MappingStore(build_mapping_store(mapping, normalize, 'cpt'))
+        index = CPTAttributeIndex(store)
+        query = parse_cpt_attributes(normalize('MRI KNEE LT WO CONTRAST'))
+
+        keys = sorted(store.key(i) for i in index.candidates(query))
+        self.assertEqual(keys, ['MRI KNEE WITH CONTRAST', 'MRI KNEE WITHOUT CONTRAST'])
+        scores = {store.key(i): feature_score(query, index.attributes[i]) for i in index.candidates(query)}
+        self.assertGreater(scores['MRI KNEE WITHOUT CONTRAST'], scores['MRI KNEE WITH CONTRAST'])
+
+
+class DiagnosisSpotterTest(SimpleTestCase):
+    def test_spots_every_diagnosis_with_offsets(self):
+        from .diagnosis_spotter import build_diagnosis_spotter
+        from .mapping_store import MappingStore, build_mapping_store
+        from .matching import MAPPING_PREPROCESSORS
+
+        mapping = {
+            'Headache, unspecified': 'R51.9',
+            'Syncope and collapse': 'R55',
+            'Pain in right hand': 'M79.641',
+            'Other specified disorders': 'X00',
+        }
+        store = MappingStore(build_mapping_store(mapping, MAPPING_PREPROCESSORS['icd'], 'icd'))
+        spotter = build_diagnosis_spotter(store, {'cephalgia': 'Headache', 'passing out': 'syncope'})
+
+        text = "Patient with cephalgia and Syncope and collapse after passing out also pain in right hand"
+        spans = spotter.spot(text)
+        self.assertEqual([s.term for s in spans],
+                         ['headache', 'syncope and collapse', 'syncope', 'pain in right hand'])
+        for span in spans:
+            self.assertEqual(text[span.start:span.end], span.text)
+        self.assertEqual(spans[1].text, 'Syncope and collapse')
+        self.assertEqual(spotter.spot("other specified disorders"), [])
+
+
+class NegationScopeTest(SimpleTestCase):
+    def test_scopes_mark_negated_and_uncertain_spans(self):
+        from .negation import AFFIRMED, NEGATED, UNCERTAIN, assertion, get_negation_engine
+
+        text = "No acute fracture but small effusion, possible pneumonia. The brain is unremarkable. No change in nodule"
+        scopes = get_negation_engine().scopes(text)
+        self.assertEqual([(text[s.start:s.end], s.kind) for s in scopes], [
+            ("No acute fracture", NEGATED),
+            ("possible pneumonia", UNCERTAIN),
+            ("The brain is unremarkable", NEGATED),
+        ])
+
+        def state(phrase):
+            start = text.index(phrase)
+            return assertion(start, start + len(phrase), scopes)
+
+        self.assertEqual([state("fracture"), state("effusion"), state("pneumonia"), state("nodule")],
+                         [NEGATED, AFFIRMED, UNCERTAIN, AFFIRMED])
+
+    def test_extracted_fields_keep_text_and_flag_spans(self):
+        from .extraction import extract_fields
+        from .matching import clean_diagnosis_text
+
+        self.assertEqual(clean_diagnosis_text("Headache. There is no midline shift, r/o PE"), "headache. ,")
+        data = extract_fields("Exam: CT HEAD\nImpression: No syncope, cephalgia")
+        self.assertEqual(data['impression'], "No syncope, cephalgia")
+        self.assertEqual([(s['text'], s['assertion']) for s in data['diagnosis_spans']],
+                         [("syncope", "negated"), ("cephalgia", "affirmed")])
+        self.assertEqual(data['icd_diagnosis_description'], "cephalgia")
+
+    def test_report_sections_are_scanned_once(self):
+        from unittest import mock
+        from . import matching
+        from .negation import NegationEngine
+        from .reports import process_report_text
+
+        report = ("Exam: XR CHEST 2 VIEWS\nClinical Indication: rule out pneumonia\n"
+                  "Findings: No pleural effusion. Heart size is normal\nImpression: No fracture, headache")
+        with mock.patch.object(NegationEngine, 'scopes', autospec=True, side_effect=NegationEngine.scopes) as scans, \
+                mock.patch.object(matching, 'find_scopes') as find_scopes, \
+                mock.patch.object(matching, 'catalogue_loaded', return_value=False), \
+                mock.patch.object(matching, 'get_embedding_index', return_value=None):
+            patient_data, _, _ = process_report_text(report)
+        self.assertEqual(sorted(call.args[1] for call in scans.call_args_list),
+                         ["No fracture, headache", "No pleural effusion. Heart size is normal"])
+        find_scopes.assert_not_called()
+        self.assertEqual(patient_data['icd_diagnosis_description'], "headache")
+
+
+class StartupImportTest(SimpleTestCase):
+    def test_text_path_does_not_load_imaging_libraries(self):
+        from .importtime import STARTUP_BUDGET_US, measure_imports
+
+        result = measure_imports()
+        self.assertEqual(result['loaded'], [])
+        self.assertIn('coding.views', result['timings'])
+        self.assertLess(result['timings']['coding.views'][1], STARTUP_BUDGET_US)
+
+    def test_ocr_names_still_resolve_through_utils(self):
+        from . import ocr, utils
+
+        self.assertIs(utils.iter_pdf_page_texts, ocr.iter_pdf_page_texts)
+        with self.assertRaises(AttributeError):
+            utils.missing_name
+
+
+class WarmupReadinessTest(TestCase):
+    def setUp(self):
+        from . import warmup
+
+        self.saved = dict(warmup.state)
+        self.addCleanup(warmup.state.update, self.saved)
+        warmup.state.update(completed_at=None, pid=None, steps={}, failed={})
+
+    def test_readiness_waits_for_warmup(self):
+        from django.contrib.auth.models import User
+        from .warmup import run_warmup
+
+        with self.settings(WARMUP_REQUIRED=True):
+            response = self.client.get(reverse('readiness'))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json(), {'ready': False})
+
+            state = run_warmup(['mappings', 'cpt_index', 'missing'], freeze=False)
+            self.assertEqual(set(state['steps']), {'mappings', 'cpt_index'})
+            self.assertIn('missing', state['failed'])
+
+            self.assertEqual(self.client.get(reverse('readiness')).json(), {'ready': True})
+            self.client.force_login(User.objects.create_user('admin', is_staff=True))
+            body = self.client.get(reverse('readiness')).json()
+        self.assertTrue(body['ready'])
+        self.assertTrue(body['warm'])
+        self.assertFalse(body['inherited'])
+        self.assertIn('cpt_index', body['warmup_ms'])
+        self.assertGreater(body['memory'].get('rss', body['memory'].get('max_rss', 0)), 0)
+
+    def test_metrics_snapshot_is_staff_only(self):
+        from django.contrib.auth.models import User
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('pid', response.json())
+
+
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        from . import metrics
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = self.settings(UPLOAD_TEMP_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics.reset()
+
+    def test_concurrent_threads_share_one_computation(self):
+        import threading
+        import time
+        from . import metrics
+        from .singleflight import LEADER, coalesce
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "ocr text"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(coalesce('ocr-abc.png', compute)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({text for text, _ in results}, {"ocr text"})
+        self.assertEqual(sum(how == LEADER for _, how in results), 1)
+        self.assertEqual(metrics.get('singleflight.coalesced.local'), 4)
+        self.assertEqual(metrics.get('singleflight.leader'), 1)
+
+    def test_waits_for_leader_in_another_process(self):
+        import fcntl
+        import threading
+        from . import metrics, singleflight
+
+        key = 'ocr-def.pdf'
+        fd = os.open(singleflight._flight_path(key, '.lock'), os.O_RDWR | os.O_CREAT)
+        fcntl.flock(fd, fcntl.LOCK_EX)  # another worker is computing
+
+        results = []
+        follower = threading.Thread(target=lambda: results.append(
+            singleflight.coalesce(key, lambda: self.fail("duplicate computed"))))
+        follower.start()
+        follower.join(0.2)
+        self.assertTrue(follower.is_alive())
+
+        singleflight._publish(key, "shared text")
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+        follower.join(5)
+        self.assertEqual(results, [("shared text", singleflight.JOINED_PROCESS)])
+        self.assertEqual(metrics.get('singleflight.coalesced.process'), 1)
+
+    def test_failed_or_degraded_reads_are_not_published(self):
+        from . import singleflight
+        from .views import complete_read
+
+        key = 'ocr-ghi.png'
+        for cut_short in (['', ['ocr']], ['', []], ['partial text', ['ocr_pages']]):
+            self.assertEqual(singleflight.coalesce(key, lambda: cut_short, complete_read),
+                             (cut_short, singleflight.LEADER))
+            self.assertFalse(os.path.exists(singleflight._flight_path(key, '.json')))
+
+        singleflight.coalesce(key, lambda: ['full text', []], complete_read)
+        self.assertEqual(singleflight.coalesce(key, lambda: self.fail("published result recomputed"), complete_read),
+                         (['full text', []], singleflight.JOINED_PROCESS))
+
+    def test_published_results_are_private_and_removed_once_expired(self):
+        import stat
+        import time
+        from unittest import mock
+        from . import singleflight
+        from .uploads import sweep_upload_temp_dir
+
+        path = singleflight._flight_path('ocr-jkl.png', '.json')
+        with mock.patch.object(singleflight, 'RESULT_TTL', 0.2):
+            singleflight.coalesce('ocr-jkl.png', lambda: "patient report text")
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+            for _ in range(100):
+                if not os.path.exists(path):
+                    break
+                time.sleep(0.05)
+            self.assertFalse(os.path.exists(path))
+
+            # An expired result left behind is removed by the first reader
+            singleflight._publish('ocr-mno.png', "patient report text")
+            old = time.time() - 1
+            os.utime(singleflight._flight_path('ocr-mno.png', '.json'), (old, old))
+            self.assertEqual(singleflight._read_result('ocr-mno.png'), (False, None))
+            self.assertFalse(os.path.exists(singleflight._flight_path('ocr-mno.png', '.json')))
+
+        # ... or by the sweeper, long before orphaned uploads
+        singleflight._publish('ocr-pqr.png', "patient report text")
+        result = singleflight._flight_path('ocr-pqr.png', '.json')
+        upload = os.path.join(os.path.dirname(result), 'tmp123.upload.png')
+        open(upload, 'w').close()
+        old = time.time() - singleflight.RESULT_TTL - 1
+        for name in (result, upload):
+            os.utime(name, (old, old))
+        self.assertEqual(sweep_upload_temp_dir(), 1)
+        self.assertEqual(os.path.exists(result), False)
+        self.assertEqual(os.path.exists(upload), True)
+
+    def test_follower_with_a_later_deadline_does_not_join(self):
+        import threading
+        import time
+        from . import metrics, singleflight
+        from .views import complete_read
+
+        key = 'ocr-jkl.png'
+        started = threading.Event()
+
+        def hurried_read():
+            started.set()
+            time.sleep(0.3)
+            return ['', ['ocr']]
+
+        now = time.time()
+        results = {}
+        leader = threading.Thread(target=lambda: results.update(leader=singleflight.coalesce(
+            key, hurried_read, complete_read, now + 0.1)))
+        leader.start()
+        started.wait(5)
+        hurried = threading.Thread(target=lambda: results.update(hurried=singleflight.coalesce(
+            key, lambda: self.fail("joined leader computed"), complete_read, now + 0.05)))
+        hurried.start()
+        patient = singleflight.coalesce(key, lambda: ['full text', []], complete_read, now + 60)
+        leader.join(5)
+        hurried.join(5)
+
+        self.assertEqual(patient, (['full text', []], singleflight.LEADER))
+        self.assertEqual(results['hurried'], (['', ['ocr']], singleflight.JOINED_LOCAL))
+        self.assertEqual(metrics.get('singleflight.outlasted'), 1)
+
+
+class SchedulingLanesTest(SimpleTestCase):
+    def setUp(self):
+        from . import metrics
+
+        metrics.reset()
+
+    def test_text_lane_admits_while_ocr_lane_is_full(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from . import metrics
+        from .executors import Lane, OCRQueueFull
+        from .reports import process_report_text
+        from .warmup import PROBE_REPORT
+
+        workers, max_queue = 2, 3
+        ocr = Lane('flood_ocr', lambda: ThreadPoolExecutor(workers), workers, max_queue, OCRQueueFull)
+        text = Lane('flood_text', lambda: ThreadPoolExecutor(2), 2, 8)
+        self.addCleanup(ocr.close)
+        self.addCleanup(text.close)
+        release, running = threading.Event(), threading.Semaphore(0)
+        self.addCleanup(release.set)
+
+        def blocked_ocr():
+            # Stands in for OCR: holds its worker until released
+            running.release()
+            release.wait()
+            return "ocr text"
+
+        # Fill the OCR lane: every worker busy, every queue place taken
+        admitted = []
+        for _ in range(workers + max_queue):
+            self.assertTrue(ocr.admission.try_acquire())
+            admitted.append(ocr.submit(blocked_ocr))
+        for _ in range(workers):
+            self.assertTrue(running.acquire(timeout=10))
+        gauges = metrics.snapshot()['gauges']
+        self.assertEqual((gauges['lane.flood_ocr.in_flight'], gauges['lane.flood_ocr.queued']),
+                         (workers + max_queue, max_queue))
+
+        # More OCR is refused at once, text jobs still get in and finish
+        for _ in range(10):
+            with self.assertRaises(OCRQueueFull):
+                ocr.run(blocked_ocr)
+        for _ in range(5):
+            patient_data, cpt_matches, icd_matches = text.run(process_report_text, PROBE_REPORT)
+            self.assertTrue(cpt_matches)
+        self.assertEqual(metrics.get('lane.flood_ocr.rejected'), 10)
+        self.assertEqual(metrics.timing('lane.flood_text.run_ms')['count'], 5)
+        self.assertIsNone(metrics.timing('lane.flood_ocr.run_ms'))
+
+        release.set()
+        self.assertEqual([future.result(timeout=10) for future in admitted], ["ocr text"] * len(admitted))
+        for _ in admitted:
+            ocr.admission.release()
+        self.assertEqual(metrics.timing('lane.flood_ocr.run_ms')['count'], workers + max_queue)
+        self.assertEqual(metrics.snapshot()['gauges']['lane.flood_ocr.in_flight'], 0)
+
+    def test_closed_lane_drops_its_gauges(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from . import metrics
+        from .executors import Lane
+
+        lane = Lane('closing', lambda: ThreadPoolExecutor(1), 1, 1)
+        self.assertIn('lane.closing.queued', metrics.snapshot()['gauges'])
+        lane.close()
+        gauges = metrics.snapshot()['gauges']
+        self.assertNotIn('lane.closing.in_flight', gauges)
+        self.assertNotIn('lane.closing.queued', gauges)
+        self.assertIn('lane.text.in_flight', gauges)
+
+
+class LoadGeneratorTest(SimpleTestCase):
+    def test_percentiles_are_nearest_rank(self):
+        from .metrics import percentile
+
+        six = [10, 20, 30, 40, 50, 60]
+        self.assertEqual([percentile(six, pct) for pct in (0, 50, 90, 99, 100)], [10, 30, 60, 60, 60])
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        hundred = list(range(1, 101))
+        self.assertEqual([percentile(hundred, pct) for pct in (29, 50, 90, 99)], [29, 50, 90, 99])
+
+    def test_capacity_search_stops_when_throughput_flattens(self):
+        import threading
+        import time
+        from .loadtest import Workload, find_capacity
+
+        class TwoWorkerServer:
+            # Serves 2 requests at a time, 10 ms each: about 200 req/s at most
+            def __init__(self):
+                self.workers = threading.Semaphore(2)
+
+            def send(self, kind, payload):
+                with self.workers:
+                    time.sleep(0.01)
+                return 200
+
+        report = find_capacity(TwoWorkerServer(), Workload({'text': 1}, seed=1), start=1, max_level=16,
+                               step_duration=0.4)
+
+        self.assertEqual([step['level'] for step in report['steps']], [1, 2, 4])
+        self.assertEqual(report['sustainable']['level'], 2)
+        self.assertEqual(report['saturation']['level'], 4)
+        self.assertIn("throughput", report['saturation']['reason'])
+        self.assertEqual(report['steps'][-1]['error_rate'], 0.0)
+
+
+class InProcessLoadTest(TransactionTestCase):
+    def test_open_loop_run_in_process(self):
+        from .loadtest import InProcessTarget, Workload, run_open
+
+        result = run_open(InProcessTarget(host='testserver'), Workload({'text': 1}, seed=2), rate=20, duration=0.5,
+                          poisson=False)
+
+        self.assertEqual(result['requests'], 10)
+        self.assertEqual(result['statuses'], {'200': 10})
+        self.assertEqual(result['by_kind']['text']['ok'], 10)
+        self.assertIsNotNone(result['p99_ms'])
+
+    def test_command_needs_a_target_and_refuses_the_project_database(self):
+        from unittest import mock
+        from django.conf import settings
+        from django.core.management import CommandError, call_command
+        from django.db import connection
+
+        with self.assertRaises(CommandError):
+            call_command('loadtest', stdout=io.StringIO())
+        project_db = os.path.join(settings.BASE_DIR, 'db.sqlite3')
+        with mock.patch.dict(connection.settings_dict, NAME=project_db), \
+                mock.patch('coding.management.commands.loadtest.run_closed') as run_closed:
+            with self.assertRaisesMessage(CommandError, "project database"):
+                call_command('loadtest', '--in-process', stdout=io.StringIO())
+        run_closed.assert_not_called()
+
+
+class RequestProfilingTest(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = self.settings(PROFILE_HEADER_TOKEN='secret', PROFILE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.profile_dir = tmp.name
+
+    def post_text(self, **headers):
+        return self.client.post(reverse('predict_cpt_text'), {'text': 'Exam: XR CHEST 2 VIEWS\nImpression: Headache'},
+                                content_type='application/json', headers=headers)
+
+    def test_header_profiles_request_including_lane_jobs(self):
+        from django.contrib.auth.models import User
+
+        response = self.post_text(**{'X-Profile': 'secret', 'X-Request-ID': 'req-1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Profile-Id'], 'req-1')
+        self.assertEqual(sorted(os.listdir(self.profile_dir)), ['req-1.json', 'req-1.pstats'])
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual([p['id'] for p in self.client.get(reverse('profiles')).json()['profiles']], ['req-1'])
+        detail = self.client.get(reverse('profile_detail', args=['req-1']), {'top': 500}).json()
+        self.assertEqual((detail['reason'], detail['status'], detail['parts']), ('header', 200, 2))
+        functions = [row['function'] for row in detail['functions']]
+        self.assertTrue(any('extract_fields' in name for name in functions), functions)
+        self.assertTrue(all(name.startswith('coding') for name in functions))
+        self.assertEqual(self.client.get(reverse('profile_detail', args=['..etc'])).status_code, 404)
+
+        # Bad numbers are the client's error, out of range ones are clamped
+        for name, args, params in (('profiles', [], {'limit': 'all'}), ('memory', [], {'limit': '1e3'}),
+                                   ('profile_detail', ['req-1'], {'top': 'ten'})):
+            response = self.client.get(reverse(name, args=args), params)
+            self.assertEqual(response.status_code, 400, name)
+            self.assertIn('must be an integer', response.json()['error'])
+        self.assertEqual(len(self.client.get(reverse('profiles'), {'limit': -5}).json()['profiles']), 1)
+        self.assertEqual(self.client.get(reverse('memory'), {'limit': 10**9}).status_code, 200)
+
+    def test_parts_are_skipped_while_another_profiler_is_active(self):
+        import cProfile
+        import json
+        from unittest import mock
+        from .profiling import profile_call
+
+        # What Python 3.12+ raises for a second profiler, e.g. a lane thread of a profiled request
+        with mock.patch.object(cProfile.Profile, 'enable', side_effect=ValueError('Another profiling tool is already active')):
+            self.assertEqual(profile_call(sum, [1, 2]), (3, None))
+            response = self.post_text(**{'X-Profile': 'secret', 'X-Request-ID': 'req-2'})
+        self.assertEqual(response.status_code, 200)
+        with open(os.path.join(self.profile_dir, 'req-2.json')) as f:
+            meta = json.load(f)
+        self.assertEqual((meta['parts'], meta['skipped_parts']), (0, 2))
+
+    def test_unprofiled_requests_leave_no_trace(self):
+        from django.core.exceptions import MiddlewareNotUsed
+        from .profiling import ProfilingMiddleware
+
+        self.assertNotIn('X-Profile-Id', self.post_text(**{'X-Profile': 'wrong'}))
+        self.assertEqual(os.listdir(self.profile_dir), [])
+        with self.settings(PROFILE_HEADER_TOKEN='', PROFILE_SAMPLE_RATE=0.0):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+
+class MemoryAccountingTest(SimpleTestCase):
+    def setUp(self):
+        import tracemalloc
+        from . import memtrack
+
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        self.addCleanup(memtrack.reset)
+        memtrack.reset()
+
+    def test_stages_record_peak_memory(self):
+        import cv2
+        import numpy as np
+        from . import memtrack
+        from .ocr import preprocess_image
+
+        self.assertIs(memtrack.stage('preprocess'), memtrack._NULL)
+        with tempfile.NamedTemporaryFile(suffix='.png') as f:
+            cv2.imwrite(f.name, np.full((600, 800, 3), 255, np.uint8))
+            processed, record = memtrack.measure('preprocess_image', preprocess_image, f.name)
+
+        self.assertEqual(processed.shape, (600, 800))
+        self.assertEqual([s['stage'] for s in record['stages']], ['preprocess'])
+        self.assertGreater(record['stages'][0]['peak_bytes'], 600 * 800)
+        self.assertEqual(record['rss_delta'], record['rss_after'] - record['rss_before'])
+
+    def test_report_ranks_sites_that_keep_growing(self):
+        from unittest import mock
+        from . import memtrack
+
+        leaked = []
+        with mock.patch.object(memtrack, 'SNAPSHOT_EVERY', 1):
+            for _ in range(3):
+                memtrack.remember(memtrack.measure('leak', lambda: leaked.append(bytearray(2**20)))[1])
+
+        top = memtrack.report()['top_sites'][0]
+        self.assertIn('tests.py', top['site'])
+        self.assertEqual(top['jobs'], 2)
+        self.assertGreaterEqual(top['size_diff'], 2 * 2**20)
+
+    def test_rss_growth_after_warmup(self):
+        from .memtrack import rss_growth
+
+        samples = [(1, 500)] + [(1, 1000 + 10 * i) for i in range(5)] + [(2, 700), (2, 700)]
+        growth = rss_growth(samples, warmup=1)
+        self.assertEqual(growth[1], {'jobs': 5, 'baseline': 1000, 'last': 1040, 'max': 1040,
+                                     'growth': 40, 'per_job': 10.0})
+        self.assertEqual(growth[2]['growth'], 0)
+
+    def test_soak_command_in_process(self):
+        import cv2
+        import numpy as np
+        from django.core.management import call_command
+
+        out = io.StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.png') as f:
+            cv2.imwrite(f.name, np.full((100, 100, 3), 255, np.uint8))
+            call_command('ocr_soak', count=6, warmup=2, in_process=True, samples=[f.name], stdout=out)
+        self.assertIn("RSS stayed within", out.getvalue())
+
+
+class SyntheticCorpusTest(TestCase):
+    VOCAB = {
+        'cpt': [("XR CHEST 2 VIEWS", "71046"), ("CT HEAD WITHOUT CONTRAST", "70450")],
+        'icd': [("Pneumonia, unspecified organism", "J18.9"), ("Headache", "R51.9"), ("Cholelithiasis", "K80.20")],
+    }
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def test_corpus_is_independent_of_worker_count(self):
+        from .synthetic import iter_reports
+
+        serial = list(iter_reports(50, seed=7, chunk_size=8, workers=1, vocab=self.VOCAB))
+        parallel = list(iter_reports(50, seed=7, chunk_size=8, workers=2, vocab=self.VOCAB))
+
+        self.assertEqual(serial, parallel)
+        self.assertEqual([row['id'] for row in serial], list(range(50)))
+        self.assertNotEqual(serial, list(iter_reports(50, seed=8, chunk_size=8, vocab=self.VOCAB)))
+
+    def test_reports_parse_back_to_their_ground_truth(self):
+        from .extraction import extract_fields
+        from .synthetic import iter_reports
+
+        for row in iter_reports(30, seed=1, vocab=self.VOCAB):
+            fields = extract_fields(row['text'])
+            self.assertEqual(fields['ordex'], row['exam'].upper())
+            self.assertEqual(dict(self.VOCAB['cpt'])[row['exam']], row['cpt_code'])
+            for description in filter(None, row['negated'].split('|')):
+                self.assertNotIn(description, row['diagnoses'].split('|'))
+            self.assertTrue(row['icd_codes'])
+
+    def test_chunked_output_round_trips(self):
+        from .synthetic import iter_reports, read_corpus, write_corpus
+
+        rows = list(iter_reports(25, seed=2, chunk_size=10, vocab=self.VOCAB, render='png', render_every=10,
+                                 document_dir=os.path.join(self.tmp, 'documents')))
+        self.assertEqual(sum(bool(row['document']) for row in rows), 3)
+        self.assertTrue(all(os.path.exists(row['document']) for row in rows if row['document']))
+        for fmt in ('csv', 'jsonl'):
+            paths = write_corpus(iter(rows), os.path.join(self.tmp, fmt), fmt, rows_per_file=10)
+            self.assertEqual(len(paths), 3)
+            self.assertEqual(list(read_corpus(paths)), rows)
+
+    def test_vocabulary_falls_back_to_code_tables(self):
+        from unittest import mock
+        from .models import ICD10Code
+        from .synthetic import load_vocabulary
+
+        ICD10Code.objects.create(code="R51.9", description="Headache")
+        with mock.patch('coding.matching.get_code_mapping', return_value=None):
+            self.assertEqual(load_vocabulary('icd'), [("Headache", "R51.9")])
+            with self.assertRaises(ValueError):
+                load_vocabulary('cpt')
+
+
+class TextNormalizationTest(SimpleTestCase):
+    SAMPLES = [
+        "XR CHEST PA AND LATERAL", "MRI Brain w/wo contrast", "CT ABD-PELVIS W/O", "Ultrasound, right knee: min 3 view",
+        "Complete 4 Views (bilateral)", "  x-ray\t\tleft hand  ", "\x1cleft\x0b", "Café w/c 2view", None, "",
+    ]
+
+    def test_arrow_kernels_match_normalize(self):
+        import pyarrow as pa
+        from .normalization import normalize, normalize_array
+
+        samples = self.SAMPLES * 3
+        chunked = pa.chunked_array([pa.array(samples[:7], pa.string()), pa.array(samples[7:], pa.string())])
+        self.assertEqual(normalize_array(chunked).to_pylist(), [normalize(value) for value in samples])
+        self.assertEqual(normalize("XR CHEST PA AND LATERAL"), "xr chest 2 views")
+
+    def test_preprocess_streams_blocks_to_parquet(self):
+        import csv
+        import pyarrow.parquet as pq
+        from ai_model.preprocess import preprocess
+        from .normalization import normalize
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "labeled.csv")
+            with open(source, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["Report Description", "CPT Code"])
+                rows = [(text or "", f"{index:05d}") for index, text in enumerate(self.SAMPLES * 40)]
+                writer.writerows(rows)
+
+            for workers in (1, 2):
+                output = os.path.join(tmp, f"labeled-{workers}.parquet")
+                self.assertEqual(preprocess(source, output, workers=workers, block_size=1024), len(rows))
+                table = pq.read_table(output)
+                self.assertEqual(table.column("Report Description").to_pylist(), [normalize(text) for text, _ in rows])
+                # Other columns are kept as strings, leading zeros included
+                self.assertEqual(table.column("CPT Code").to_pylist(), [code for _, code in rows])
+
+
+class RequestDeadlineTest(TestCase):
+    def deadline(self, ms):
+        import time
+        from .deadlines import Deadline
+
+        return Deadline(time.time() + ms / 1000)
+
+    def test_budget_comes_from_the_request_or_the_default(self):
+        import time
+        from django.test import RequestFactory
+        from . import deadlines
+
+        factory = RequestFactory()
+        now = time.time()
+        cases = [
+            (factory.get('/api/predict/', {'deadline_ms': '250'}), None, 0.25),
+            (factory.post('/api/predict/'), {'deadline_ms': 1500}, 1.5),
+            (factory.post('/api/predict/'), {'deadline_ms': 'soon'}, deadlines.DEFAULT_MS / 1000),
+            (factory.post('/api/predict/'), {'deadline_ms': 'nan'}, deadlines.DEFAULT_MS / 1000),
+            (factory.get('/api/predict/', {'deadline_ms': '10000000'}), None, deadlines.MAX_MS / 1000),
+            (factory.get('/api/predict/', {'deadline_ms': '-5'}), None, 0),
+        ]
+        for request, data, budget in cases:
+            self.assertAlmostEqual(deadlines.from_request(request, data, now).expires_at, now + budget)
+
+    def test_matching_skips_full_scans_when_out_of_time(self):
+        from . import deadlines
+        from .matching import match_cpt_code
+
+        unhurried = self.deadline(60000)
+        with deadlines.scope(unhurried):
+            expected = match_cpt_code("XR QUUXBONE 3 VIEWS", top_n=3)
+        self.assertEqual(unhurried.degraded, [])
+
+        late = self.deadline(0)
+        with deadlines.scope(late):
+            result = match_cpt_code("XR QUUXBONE 3 VIEWS", top_n=3)
+        self.assertEqual(late.degraded, ['cpt_fuzzy'])
+        self.assertEqual(result, expected)  # the modality fallback either way
+
+    def test_ocr_retry_is_skipped_and_tesseract_bounded(self):
+        from unittest import mock
+        from PIL import Image
+        from . import deadlines, ocr
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'scan.png')
+            Image.new('L', (200, 100), 255).save(path)
+            with mock.patch.object(ocr.pytesseract, 'image_to_string', return_value="two words") as tesseract:
+                ocr.ocr_image_file(path)
+                self.assertEqual(tesseract.call_count, 2)
+                self.assertNotIn('timeout', tesseract.call_args.kwargs)
+
+                tesseract.reset_mock()
+                short = self.deadline(2000)
+                with deadlines.scope(short):
+                    ocr.ocr_image_file(path)
+                self.assertEqual(tesseract.call_count, 1)
+                self.assertLessEqual(tesseract.call_args.kwargs['timeout'], 2)
+                self.assertEqual(short.degraded, ['ocr_retry'])
+
+            with mock.patch.object(ocr.pytesseract, 'image_to_string',
+                                   side_effect=RuntimeError("Tesseract process timeout")):
+                timed_out = self.deadline(60000)
+                with deadlines.scope(timed_out):
+                    self.assertEqual(ocr.ocr_image_file(path), "")
+                self.assertIn('ocr', timed_out.degraded)
+
+    def test_lane_jobs_run_under_the_request_deadline(self):
+        from . import deadlines
+        from .executors import _timed_call, text_lane
+
+        def cut_corners():
+            deadlines.degrade('cheap_path')
+            return deadlines.remaining()
+
+        deadline = self.deadline(5000)
+        with deadlines.scope(deadline):
+            left = text_lane.run(cut_corners)
+        self.assertTrue(0 < left <= 5)
+        self.assertEqual(deadline.degraded, ['cheap_path'])
+        # What an OCR process gets: the expiry time, the degraded stages come back
+        self.assertEqual(_timed_call(cut_corners, (), expires_at=deadline.expires_at)[5], ['cheap_path'])
+        self.assertEqual(_timed_call(cut_corners, ())[2:], (None, None, None, []))
+
+    def test_out_of_time_request_gets_a_degraded_result(self):
+        url = reverse('predict_cpt_text')
+        text = 'OrdEx: XR QUUXBONE 3 VIEWS\nImpression: Headache'
+
+        response = self.client.post(f"{url}?deadline_ms=0", {'text': text}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['degraded'])
+        self.assertIn('cpt_fuzzy', response.json()['degraded_stages'])
+
+        response = self.client.post(url, {'text': text, 'deadline_ms': 60000}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['degraded'], response.json()['degraded_stages']), (False, []))
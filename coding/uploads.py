@@ -0,0 +1,230 @@
+"""Upload handling for report files.
+
+ReportUploadHandler streams each uploaded file chunk by chunk into a
+per-request temporary file under UPLOAD_TEMP_DIR. It only handles the
+report views, which opt in with @report_upload_handlers. While the chunks
+arrive it computes the SHA-256 of the content and enforces
+MAX_UPLOAD_SIZE and MAX_UPLOAD_PAGES. An oversized upload is rejected as
+soon as the limit is crossed, not after it has been written out.
+staged_upload() (astaged_upload() in async views) hands the OCR code a
+local path and always removes it.
+Files orphaned by crashed workers are removed by sweep_upload_temp_dir().
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import tempfile
+from contextlib import asynccontextmanager, contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload, TemporaryFileUploadHandler
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_SIZE = getattr(settings, 'MAX_UPLOAD_SIZE', 20 * 1024 * 1024)
+MAX_UPLOAD_PAGES = getattr(settings, 'MAX_UPLOAD_PAGES', 20)
+UPLOAD_TEMP_MAX_AGE = getattr(settings, 'UPLOAD_TEMP_MAX_AGE', 3600)
+UPLOAD_SWEEP_INTERVAL = getattr(settings, 'UPLOAD_SWEEP_INTERVAL', 300)
+# Shared OCR results (coding/singleflight.py) hold report text, they go once expired
+FLIGHT_RESULT_TTL = getattr(settings, 'SINGLEFLIGHT_RESULT_TTL', 60)
+
+# Uncompressed PDF page objects; object streams can hide some, so this is a lower bound
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+PDF_PAGE_OVERLAP = 32
+
+_last_sweep = 0.0
+
+
+class UploadRejected(Exception):
+    """The upload breaks a limit, carries the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def upload_temp_dir():
+    """UPLOAD_TEMP_DIR, created on first use. The sweeper empties it, it must not be shared."""
+    path = str(getattr(settings, 'UPLOAD_TEMP_DIR', None) or os.path.join(tempfile.gettempdir(), 'coding_uploads'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class ReportTemporaryFile(TemporaryUploadedFile):
+    """TemporaryUploadedFile in upload_temp_dir() rather than FILE_UPLOAD_TEMP_DIR."""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        file = tempfile.NamedTemporaryFile(suffix=".upload" + os.path.splitext(name)[1], dir=upload_temp_dir())
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+
+
+class ReportUploadHandler(TemporaryFileUploadHandler):
+    """Temp-file upload handler that hashes and size/page-limits on the fly."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        maybe_sweep_upload_temp_dir()
+        self.too_large = bool(content_length and content_length > MAX_UPLOAD_SIZE + 64 * 1024)
+        return super().handle_raw_input(input_data, META, content_length, boundary, encoding)
+
+    def new_file(self, *args, **kwargs):
+        FileUploadHandler.new_file(self, *args, **kwargs)
+        self.file = ReportTemporaryFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.pages = 0
+        self.is_pdf = self.file_name.lower().endswith('.pdf')
+        self.tail = b""
+        if getattr(self, 'too_large', False):
+            self.reject(f"File too large, limit is {MAX_UPLOAD_SIZE} bytes", 413)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > MAX_UPLOAD_SIZE:
+            self.reject(f"File too large, limit is {MAX_UPLOAD_SIZE} bytes", 413)
+        self.hasher.update(raw_data)
+        if self.is_pdf:
+            # Keep a small overlap so a marker split across chunks is still seen
+            window = self.tail + raw_data
+            self.pages += len(PDF_PAGE_PATTERN.findall(window, 0, len(window)))
+            self.pages -= len(PDF_PAGE_PATTERN.findall(self.tail))
+            self.tail = window[-PDF_PAGE_OVERLAP:]
+            if self.pages > MAX_UPLOAD_PAGES:
+                self.reject(f"Too many pages, limit is {MAX_UPLOAD_PAGES}", 413)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.hasher.hexdigest()
+        uploaded.page_count_hint = self.pages if self.is_pdf else 1
+        return uploaded
+
+    def reject(self, message, status):
+        self.request.upload_rejection = UploadRejected(message, status)
+        self.file.close()  # NamedTemporaryFile, closing deletes it
+        raise StopUpload(connection_reset=False)
+
+
+def report_upload_handlers(view):
+    """Parse the uploads of ``view`` with ReportUploadHandler alone.
+
+    Goes outside @api_view, so the handler is in place before DRF (or
+    its CSRF check) reads the body. Other views keep Django's handlers.
+    """
+    if iscoroutinefunction(view):
+        async def wrapped(request, *args, **kwargs):
+            request.upload_handlers = [ReportUploadHandler(request)]
+            return await view(request, *args, **kwargs)
+    else:
+        def wrapped(request, *args, **kwargs):
+            request.upload_handlers = [ReportUploadHandler(request)]
+            return view(request, *args, **kwargs)
+    return wraps(view)(wrapped)
+
+
+def get_report_upload(request, field="file"):
+    """Return the uploaded report file (or None), raising UploadRejected on a broken limit."""
+    uploaded_file = request.FILES.get(field)
+    rejection = getattr(request, 'upload_rejection', None)
+    if rejection is not None:
+        raise rejection
+    if uploaded_file is None:
+        return None
+
+    if uploaded_file.size > MAX_UPLOAD_SIZE:
+        uploaded_file.close()
+        raise UploadRejected(f"File too large, limit is {MAX_UPLOAD_SIZE} bytes", 413)
+    logger.info(f"Upload {uploaded_file.name}: {uploaded_file.size} bytes, "
+                f"sha256={getattr(uploaded_file, 'sha256', 'n/a')}")
+    return uploaded_file
+
+
+def check_page_limit(path):
+    """Exact PDF page count check once the file is on disk (needs poppler)."""
+    if not path.lower().endswith('.pdf'):
+        return
+    try:
+        from pdf2image import pdfinfo_from_path
+        pages = pdfinfo_from_path(path)['Pages']
+    except Exception as e:
+        logger.warning(f"Could not count PDF pages: {e}")
+        return
+    if pages > MAX_UPLOAD_PAGES:
+        raise UploadRejected(f"Too many pages, limit is {MAX_UPLOAD_PAGES}", 413)
+
+
+def _stage(uploaded_file):
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        return uploaded_file.temporary_file_path()
+    # In-memory upload (other handlers): spool it into the same temp dir
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(uploaded_file.name)[1], dir=upload_temp_dir())
+    with os.fdopen(fd, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+    return path
+
+
+def _discard(uploaded_file, path):
+    uploaded_file.close()
+    if os.path.exists(path):
+        os.remove(path)
+
+
+@contextmanager
+def staged_upload(uploaded_file):
+    """Yield a local path to the upload for OCR, removing it on exit whatever happens."""
+    path = _stage(uploaded_file)
+    try:
+        check_page_limit(path)
+        yield path
+    finally:
+        _discard(uploaded_file, path)
+
+
+@asynccontextmanager
+async def astaged_upload(uploaded_file):
+    """staged_upload() for async views: spooling, pdfinfo and removal run in a thread, off the event loop."""
+    path = await sync_to_async(_stage)(uploaded_file)
+    try:
+        await sync_to_async(check_page_limit)(path)
+        yield path
+    finally:
+        await sync_to_async(_discard)(uploaded_file, path)
+
+
+def sweep_upload_temp_dir(max_age=UPLOAD_TEMP_MAX_AGE):
+    """Delete temp upload files older than max_age seconds, and expired shared results, return how many went."""
+    removed = 0
+    now = time.time()
+    cutoff = now - max_age
+    results_cutoff = now - min(max_age, FLIGHT_RESULT_TTL)
+    with os.scandir(upload_temp_dir()) as entries:
+        for entry in entries:
+            is_result = entry.name.startswith('flight-') and entry.name.endswith('.json')
+            try:
+                if entry.is_file() and entry.stat().st_mtime < (results_cutoff if is_result else cutoff):
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    if removed:
+        logger.info(f"Swept {removed} orphaned upload files")
+    return removed
+
+
+def maybe_sweep_upload_temp_dir():
+    """Run the sweeper at most once per UPLOAD_SWEEP_INTERVAL per process."""
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < UPLOAD_SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    try:
+        sweep_upload_temp_dir()
+    except OSError as e:
+        logger.warning(f"Upload sweep failed: {e}")
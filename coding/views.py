@@ -1,85 +1,110 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from django.core.files.storage import default_storage
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from datetime import datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 import traceback
+import json
+import time
 import os
 import logging
 
+from .catalogue import search_codes
+from .executors import LaneFull, OCRQueueFull, ocr_lane, ocr_slot, run_matching, run_ocr, text_lane
+from . import deadlines, memtrack, metrics, profiling
 from .models import CPTCode, ICD10Code, MedicalReport
-from .utils import (
-    extract_text,
-    extract_fields,
-    match_cpt_code,
-    match_icd10_code,
-    normalize_exam_description,
-    clean_diagnosis_text
-)
+from .singleflight import coalesce, coalesce_async, content_key
+from .uploads import UploadRejected, astaged_upload, get_report_upload, report_upload_handlers, staged_upload
+from .warmup import readiness
+from .extraction import extract_page_text, extract_text, join_page_texts, extract_fields, page_count
+from .matching import match_cpt_code, match_icd10_code, normalize_exam_description, clean_diagnosis_text
+from .reports import ALLOWED_EXTENSIONS, process_report_text, report_fields
 
 logger = logging.getLogger(__name__)
 
-ALLOWED_EXTENSIONS = ['pdf', 'png', 'jpg', 'jpeg', 'txt', 'doc', 'docx']
 
+def read_document(path):
+    """OCR in the OCR lane: [text, stages degraded to meet the deadline], shared by coalesced duplicates"""
+    return [ocr_lane.run(extract_text, path), deadlines.degraded()]
+
+
+def complete_read(result):
+    """Whether a read_document() result may be reused by later duplicates: text, and no stage cut short"""
+    text, degraded = result
+    return bool(text) and not degraded
+
+
+def query_int(request, name, default, maximum):
+    """Integer query parameter ``name`` clamped to 1..maximum, ValueError when it is not an integer"""
+    return min(max(int(request.GET.get(name, default)), 1), maximum)
+
+
+def out_of_time_response(response_class=Response):
+    """503 for a document the deadline left without enough text to code"""
+    return response_class({"error": "Deadline reached before enough text was extracted", "degraded": True,
+                           "degraded_stages": deadlines.degraded()}, status=503, headers={"Retry-After": "5"})
+
+@report_upload_handlers
 @api_view(['POST'])
 def predict_cpt_from_image(request):
     """Handle image/pdf upload with integrated CPT and ICD-10 processing"""
+    started = time.time()
     try:
-        uploaded_file = request.FILES.get("file")
+        uploaded_file = get_report_upload(request)
         if not uploaded_file:
             return Response({"error": "No file provided"}, status=400)
 
         # Validate file extension
         file_ext = os.path.splitext(uploaded_file.name)[1].lower().lstrip('.')
         if file_ext not in ALLOWED_EXTENSIONS:
+            uploaded_file.close()
             return Response({"error": f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"}, status=400)
 
-        # Save temporary file
-        temp_file_path = default_storage.save(f"temp_reports/{uploaded_file.name}", uploaded_file)
-        full_temp_path = os.path.join(settings.MEDIA_ROOT, temp_file_path)
+        deadline = deadlines.from_request(request, request.data, started)
+        # The upload is already in a per-request temp file, removed on exit
+        with deadlines.scope(deadline), staged_upload(uploaded_file) as temp_path:
+            try:
+                # Text extraction in the OCR lane, shared with identical uploads in flight
+                (raw_text, degraded), _ = coalesce(content_key(uploaded_file, temp_path),
+                                                   lambda: read_document(temp_path),
+                                                   complete_read, deadline.expires_at)
+                deadline.degrade(*degraded)
+                if not raw_text.strip() or len(raw_text.strip()) < 30:
+                    if deadline.degraded:
+                        logger.warning("Deadline reached during OCR")
+                        return out_of_time_response()
+                    logger.warning("Insufficient OCR content")
+                    return Response({"error": "Insufficient text extracted"}, status=400)
 
-        try:
-            # Text extraction
-            raw_text = extract_text(full_temp_path)
-            if not raw_text.strip() or len(raw_text.strip()) < 30:
-                logger.warning("Insufficient OCR content")
-                return Response({"error": "Insufficient text extracted"}, status=400)
-
-            # Data extraction
-            patient_data = extract_fields(raw_text)
-            patient_data['exam_description'] = normalize_exam_description(patient_data)
-
-            # Code matching
-            cpt_matches = match_cpt_code(
-                patient_data['exam_description'], 
-                top_n=3
-            ) if patient_data.get('exam_description') else []
-            
-            icd_matches = match_icd10_code(
-                patient_data.get('icd_diagnosis_description', ''),
-                top_n=3
-            )
-
-            # Build response
-            response_data = save_report_and_response(
-                patient_data=patient_data,
-                cpt_matches=cpt_matches,
-                icd_matches=icd_matches,
-                file_path=temp_file_path
-            )
+                # Data extraction and code matching
+                patient_data, cpt_matches, icd_matches = process_report_text(raw_text, skip_empty_exam=True)
 
-            return Response(response_data)
+                # Build response
+                response_data = save_report_and_response(
+                    patient_data=patient_data,
+                    cpt_matches=cpt_matches,
+                    icd_matches=icd_matches,
+                    file_name=uploaded_file.name
+                )
 
-        except Exception as processing_error:
-            logger.error(f"Processing error: {str(processing_error)}")
-            traceback.print_exc()
-            return Response({"error": "Document processing failed"}, status=500)
-        finally:
-            # Cleanup temporary file
-            if os.path.exists(full_temp_path):
-                os.remove(full_temp_path)
+                return Response(response_data)
+
+            except OCRQueueFull:
+                logger.warning("OCR queue full, rejecting upload")
+                return Response({"error": "OCR queue is full, retry later"}, status=429,
+                                headers={"Retry-After": "5"})
+            except Exception as processing_error:
+                logger.error(f"Processing error: {str(processing_error)}")
+                traceback.print_exc()
+                return Response({"error": "Document processing failed"}, status=500)
 
+    except UploadRejected as rejected:
+        logger.warning(f"Upload rejected: {rejected.message}")
+        return Response({"error": rejected.message}, status=rejected.status)
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         traceback.print_exc()
@@ -88,6 +113,7 @@ def predict_cpt_from_image(request):
 @api_view(['POST'])
 def predict_cpt_from_text(request):
     """Handle text input with integrated code matching"""
+    started = time.time()
     try:
         raw_text = request.data.get("text", "")
         if not raw_text.strip():
@@ -97,30 +123,22 @@ def predict_cpt_from_text(request):
         processed_text = raw_text.replace("`n", "\n").replace("\\n", "\n")
         
         try:
-            # Data extraction
-            patient_data = extract_fields(processed_text)
-            patient_data['exam_description'] = normalize_exam_description(patient_data)
-
-            # Code matching
-            cpt_matches = match_cpt_code(
-                patient_data.get('exam_description', ''),
-                top_n=3
-            )
-            
-            icd_matches = match_icd10_code(
-                patient_data.get('icd_diagnosis_description', ''),
-                top_n=3
-            )
-
-            # Build response
-            response_data = save_report_and_response(
-                patient_data=patient_data,
-                cpt_matches=cpt_matches,
-                icd_matches=icd_matches
-            )
+            # Data extraction and code matching in the text lane
+            with deadlines.scope(deadlines.from_request(request, request.data, started)):
+                patient_data, cpt_matches, icd_matches = text_lane.run(process_report_text, processed_text)
+
+                # Build response
+                response_data = save_report_and_response(
+                    patient_data=patient_data,
+                    cpt_matches=cpt_matches,
+                    icd_matches=icd_matches
+                )
 
             return Response(response_data)
 
+        except LaneFull:
+            logger.warning("Text lane full, rejecting request")
+            return Response({"error": "Server busy, retry later"}, status=429, headers={"Retry-After": "1"})
         except Exception as processing_error:
             logger.error(f"Processing error: {str(processing_error)}")
             traceback.print_exc()
@@ -131,42 +149,177 @@ def predict_cpt_from_text(request):
         traceback.print_exc()
         return Response({"error": "Server error"}, status=500)
 
-def save_report_and_response(patient_data, cpt_matches, icd_matches, file_path=None):
-    """Save results to database and format API response"""
+def encode_ndjson(event, payload):
+    return json.dumps({"event": event, **payload}) + "\n"
+
+def encode_sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@report_upload_handlers
+@api_view(['POST'])
+def predict_cpt_from_image_stream(request):
+    """Streaming variant of predict_cpt_from_image.
+
+    Emits one event per stage (page, fields, cpt, icd, done) as NDJSON, or as
+    server-sent events with ?format=sse or Accept: text/event-stream.
+    """
+    started = time.time()
     try:
-        # Parse dates
-        dos = parse_date(patient_data.get('date_of_service'))
-        dob = parse_date(patient_data.get('dob'))
+        uploaded_file = get_report_upload(request)
+        if not uploaded_file:
+            return Response({"error": "No file provided"}, status=400)
 
+        file_ext = os.path.splitext(uploaded_file.name)[1].lower().lstrip('.')
+        if file_ext not in ALLOWED_EXTENSIONS:
+            uploaded_file.close()
+            return Response({"error": f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"}, status=400)
+
+        use_sse = (request.query_params.get('format') == 'sse'
+                   or 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''))
+        encode = encode_sse if use_sse else encode_ndjson
+
+        response = StreamingHttpResponse(
+            stream_report_events(uploaded_file, encode, deadlines.from_request(request, request.data, started)),
+            content_type='text/event-stream' if use_sse else 'application/x-ndjson'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # keep reverse proxies from buffering events
+        return response
+
+    except UploadRejected as rejected:
+        logger.warning(f"Upload rejected: {rejected.message}")
+        return Response({"error": rejected.message}, status=rejected.status)
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        traceback.print_exc()
+        return Response({"error": "Server error"}, status=500)
+
+def stream_report_events(uploaded_file, encode, deadline=None):
+    """Run the image pipeline, yielding an encoded event after every stage.
+
+    The response iterates this generator, each stage runs under the
+    request's deadline but the yields are outside it. The document holds
+    one OCR lane slot from before it is staged, and each page is read as
+    an OCR lane job, so streamed uploads get the same admission control
+    as predict_cpt_from_image.
+    """
+    try:
+        with ocr_slot(), staged_upload(uploaded_file) as temp_path:
+            page_texts = []
+            pages = page_count(temp_path)
+            for number in range(1, pages + 1):
+                if deadline is not None and deadline.expired():
+                    # Out of time: the pages read so far are the partial result
+                    deadline.degrade('ocr_pages')
+                    break
+                with deadlines.scope(deadline):
+                    page_text = ocr_lane.submit(extract_page_text, temp_path, number).result()
+                page_texts.append(page_text)
+                yield encode("page", {"page": number, "pages": pages, "text": page_text})
+
+            raw_text = join_page_texts(temp_path, page_texts)
+            if not raw_text.strip() or len(raw_text.strip()) < 30:
+                if deadline is not None and deadline.degraded:
+                    logger.warning("Deadline reached during OCR")
+                    yield encode("error", {"error": "Deadline reached before enough text was extracted",
+                                           "degraded": True, "degraded_stages": deadline.degraded})
+                    return
+                logger.warning("Insufficient OCR content")
+                yield encode("error", {"error": "Insufficient text extracted"})
+                return
+
+            with deadlines.scope(deadline):
+                patient_data = extract_fields(raw_text)
+                patient_data['exam_description'] = normalize_exam_description(patient_data)
+            yield encode("fields", {"patient_data": patient_data})
+
+            with deadlines.scope(deadline):
+                cpt_matches = match_cpt_code(
+                    patient_data['exam_description'],
+                    top_n=3
+                ) if patient_data.get('exam_description') else []
+            yield encode("cpt", {"top_cpt_matches": cpt_matches})
+
+            with deadlines.scope(deadline):
+                icd_matches = match_icd10_code(
+                    patient_data.get('icd_diagnosis_description', ''),
+                    top_n=3,
+                    scopes=()
+                )
+            yield encode("icd", {"top_icd_matches": icd_matches})
+
+            with deadlines.scope(deadline):
+                done = save_report_and_response(
+                    patient_data=patient_data,
+                    cpt_matches=cpt_matches,
+                    icd_matches=icd_matches,
+                    file_name=uploaded_file.name
+                )
+            yield encode("done", done)
+
+    except OCRQueueFull:
+        uploaded_file.close()
+        logger.warning("OCR queue full, rejecting streamed upload")
+        yield encode("error", {"error": "OCR queue is full, retry later", "status": 429})
+    except UploadRejected as rejected:
+        yield encode("error", {"error": rejected.message})
+    except Exception as processing_error:
+        logger.error(f"Processing error: {str(processing_error)}")
+        traceback.print_exc()
+        yield encode("error", {"error": "Document processing failed"})
+
+def build_response(patient_data, cpt_matches, icd_matches, report_id):
+    best_cpt = cpt_matches[0] if cpt_matches else None
+    best_icd = icd_matches[0] if icd_matches else None
+    # Stages that took a cheaper path to meet the request's deadline
+    degraded = deadlines.degraded()
+    return {
+        "patient_data": patient_data,
+        "cpt_prediction": best_cpt or {"code": "-", "description": "No match"},
+        "icd_prediction": best_icd or {"code": "-", "description": "No match"},
+        "top_cpt_matches": cpt_matches,
+        "top_icd_matches": icd_matches,
+        "report_id": report_id,
+        "degraded": bool(degraded),
+        "degraded_stages": degraded
+    }
+
+
+def save_report_and_response(patient_data, cpt_matches, icd_matches, file_name=None):
+    """Save results to database and format API response"""
+    try:
         # Get best matches
         best_cpt = cpt_matches[0] if cpt_matches else None
         best_icd = icd_matches[0] if icd_matches else None
 
         # Create database records
         report = MedicalReport.objects.create(
-            patient_name=patient_data.get('name', '-'),
-            age=patient_data.get('age', '-'),
-            gender=patient_data.get('sex', '-'),
-            dob=dob,
-            mrn=patient_data.get('mrn', '-'),
-            date_of_service=dos,
-            exam=patient_data.get('exam', '-'),
-            clinical_indication=patient_data.get('clinical_indication', '-'),
-            findings=patient_data.get('findings', '-'),
-            impression=patient_data.get('impression', '-'),
-            cpt_code=get_or_create_cpt(best_cpt),  # Remove 'self' reference
-            icd10_code=get_or_create_icd(best_icd),  # Remove 'self' reference
-            uploaded_file=file_path or ''
+            **report_fields(patient_data, file_name),
+            cpt_code=get_or_create_cpt(best_cpt),
+            icd10_code=get_or_create_icd(best_icd)
         )
 
-        return {
-            "patient_data": patient_data,
-            "cpt_prediction": best_cpt or {"code": "-", "description": "No match"},
-            "icd_prediction": best_icd or {"code": "-", "description": "No match"},
-            "top_cpt_matches": cpt_matches,
-            "top_icd_matches": icd_matches,
-            "report_id": report.id
-        }
+        return build_response(patient_data, cpt_matches, icd_matches, report.id)
+
+    except Exception as e:
+        logger.error(f"Save error: {str(e)}")
+        traceback.print_exc()
+        raise
+
+
+async def asave_report_and_response(patient_data, cpt_matches, icd_matches, file_name=None):
+    """Async ORM variant of save_report_and_response"""
+    try:
+        best_cpt = cpt_matches[0] if cpt_matches else None
+        best_icd = icd_matches[0] if icd_matches else None
+
+        report = await MedicalReport.objects.acreate(
+            **report_fields(patient_data, file_name),
+            cpt_code=await aget_or_create_cpt(best_cpt),
+            icd10_code=await aget_or_create_icd(best_icd)
+        )
+
+        return build_response(patient_data, cpt_matches, icd_matches, report.id)
 
     except Exception as e:
         logger.error(f"Save error: {str(e)}")
@@ -174,16 +327,6 @@ def save_report_and_response(patient_data, cpt_matches, icd_matches, file_path=N
         raise
 
 
-def parse_date(date_str):
-    """Safe date parsing with multiple formats"""
-    if not date_str or date_str == '-':
-        return None
-    for fmt in ('%Y-%m-%d', '%m/%d/%Y', '%d-%b-%y'):
-        try:
-            return datetime.strptime(date_str, fmt).date()
-        except ValueError:
-            continue
-    return None
 def get_or_create_cpt(match):
     if not match or match.get('code') in ('N/A', '-'):
         return None
@@ -199,5 +342,236 @@ def get_or_create_icd(match):
         code=match['code'],
         defaults={'description': match['description']}
     )[0]
+async def aget_or_create_cpt(match):
+    if not match or match.get('code') in ('N/A', '-'):
+        return None
+    return (await CPTCode.objects.aget_or_create(
+        code=match['code'],
+        defaults={'description': match['description']}
+    ))[0]
+
+async def aget_or_create_icd(match):
+    if not match or match.get('code') in ('N/A', '-'):
+        return None
+    return (await ICD10Code.objects.aget_or_create(
+        code=match['code'],
+        defaults={'description': match['description']}
+    ))[0]
+
+# ---------- ASYNC (ASGI) VIEWS ----------
+@csrf_exempt
+@report_upload_handlers
+@require_POST
+async def predict_cpt_from_image_async(request):
+    """ASGI variant of predict_cpt_from_image: OCR runs in a bounded process pool"""
+    started = time.time()
+    try:
+        uploaded_file = await sync_to_async(get_report_upload)(request)
+        if not uploaded_file:
+            return JsonResponse({"error": "No file provided"}, status=400)
+
+        file_ext = os.path.splitext(uploaded_file.name)[1].lower().lstrip('.')
+        if file_ext not in ALLOWED_EXTENSIONS:
+            uploaded_file.close()
+            return JsonResponse({"error": f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"}, status=400)
+
+        async def admitted_ocr(path):
+            with ocr_slot():
+                return [await run_ocr(extract_text, path), deadlines.degraded()]
+
+        deadline = deadlines.from_request(request, request.POST, started)
+        with deadlines.scope(deadline):
+            try:
+                # Identical uploads in flight wait for one OCR job and share its text
+                async with astaged_upload(uploaded_file) as temp_path:
+                    (raw_text, degraded), _ = await coalesce_async(content_key(uploaded_file, temp_path),
+                                                                   lambda: admitted_ocr(temp_path),
+                                                                   complete_read, deadline.expires_at)
+                deadline.degrade(*degraded)
+            except OCRQueueFull:
+                uploaded_file.close()
+                logger.warning("OCR queue full, rejecting upload")
+                return JsonResponse({"error": "OCR queue is full, retry later"}, status=429,
+                                    headers={"Retry-After": "5"})
+
+            if not raw_text.strip() or len(raw_text.strip()) < 30:
+                if deadline.degraded:
+                    logger.warning("Deadline reached during OCR")
+                    return out_of_time_response(JsonResponse)
+                logger.warning("Insufficient OCR content")
+                return JsonResponse({"error": "Insufficient text extracted"}, status=400)
+
+            try:
+                patient_data, cpt_matches, icd_matches = await run_matching(
+                    process_report_text, raw_text, True
+                )
+                response_data = await asave_report_and_response(
+                    patient_data=patient_data,
+                    cpt_matches=cpt_matches,
+                    icd_matches=icd_matches,
+                    file_name=uploaded_file.name
+                )
+                return JsonResponse(response_data)
+
+            except Exception as processing_error:
+                logger.error(f"Processing error: {str(processing_error)}")
+                traceback.print_exc()
+                return JsonResponse({"error": "Document processing failed"}, status=500)
+
+    except UploadRejected as rejected:
+        logger.warning(f"Upload rejected: {rejected.message}")
+        return JsonResponse({"error": rejected.message}, status=rejected.status)
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        traceback.print_exc()
+        return JsonResponse({"error": "Server error"}, status=500)
+
+@csrf_exempt
+@require_POST
+async def predict_cpt_from_text_async(request):
+    """ASGI variant of predict_cpt_from_text: matching runs in a thread pool"""
+    started = time.time()
+    try:
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError:
+            payload = request.POST
+        if not isinstance(payload, dict):
+            return JsonResponse({"error": "Expected a JSON object"}, status=400)
+        raw_text = str(payload.get("text", ""))
+        if not raw_text.strip():
+            return JsonResponse({"error": "No text provided"}, status=400)
+
+        processed_text = raw_text.replace("`n", "\n").replace("\\n", "\n")
+
+        try:
+            with deadlines.scope(deadlines.from_request(request, payload, started)):
+                patient_data, cpt_matches, icd_matches = await run_matching(process_report_text, processed_text)
+                response_data = await asave_report_and_response(
+                    patient_data=patient_data,
+                    cpt_matches=cpt_matches,
+                    icd_matches=icd_matches
+                )
+            return JsonResponse(response_data)
+
+        except Exception as processing_error:
+            logger.error(f"Processing error: {str(processing_error)}")
+            traceback.print_exc()
+            return JsonResponse({"error": "Text processing failed"}, status=500)
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        traceback.print_exc()
+        return JsonResponse({"error": "Server error"}, status=500)
+
+# ---------- CODE SEARCH ----------
+@api_view(['GET'])
+def search_code_catalogue(request):
+    """Typeahead over the CPT/ICD-10 catalogue loaded by `load_catalogue`"""
+    query = request.GET.get("q", "").strip()
+    kind = request.GET.get("kind") or None
+    if kind not in (None, "cpt", "icd"):
+        return Response({"error": "kind must be cpt or icd"}, status=400)
+    try:
+        limit = query_int(request, "limit", 20, 100)
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=400)
+    if len(query) < 2:
+        return Response({"results": []})
+
+    try:
+        return Response({"results": search_codes(query, kind=kind, limit=limit)})
+    except Exception as e:
+        logger.error(f"Code search failed: {str(e)}")
+        traceback.print_exc()
+        return Response({"error": "Search failed"}, status=500)
+
+# ---------- ANALYTICS EXPORT ----------
+@staff_member_required
+@require_GET
+def export_reports(request):
+    """Stream coded reports (patient data included) as Parquet (default) or an Arrow IPC stream, staff only"""
+    # pyarrow is only loaded by the processes that export
+    from .export import STREAM_FORMATS, iter_export_stream, parse_export_date, resolve_columns
+
+    fmt = request.GET.get("format", "parquet")
+    if fmt not in STREAM_FORMATS:
+        return JsonResponse({"error": f"Unsupported format. Allowed: {', '.join(STREAM_FORMATS)}"}, status=400)
+    try:
+        columns = resolve_columns([c.strip() for c in request.GET.get("columns", "").split(",") if c.strip()])
+        since = parse_export_date(request.GET.get("since"))
+        until = parse_export_date(request.GET.get("until"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        iter_export_stream(fmt, columns, since=since, until=until),
+        content_type=STREAM_FORMATS[fmt],
+    )
+    extension = "arrows" if fmt == "arrow" else "parquet"
+    response["Content-Disposition"] = f'attachment; filename="medical_reports.{extension}"'
+    return response
+
 def index(request):
-    return render(request, 'index.html')
\ No newline at end of file
+    return render(request, 'index.html')
+
+
+# ---------- HEALTH ----------
+@require_GET
+def readiness_check(request):
+    """Whether the worker answering is ready, with its warm-up timings and memory for staff users"""
+    report = readiness()
+    if not (request.user.is_active and request.user.is_staff):
+        report = {"ready": report["ready"]}
+    return JsonResponse(report, status=200 if report["ready"] else 503)
+
+
+@staff_member_required
+@require_GET
+def metrics_snapshot(request):
+    """Counters of the worker answering (single-flight coalescing, ...)"""
+    return JsonResponse(metrics.snapshot())
+
+
+@staff_member_required
+@require_GET
+def memory_report(request):
+    """Per-stage memory of recent OCR jobs and the allocation sites that grew across them"""
+    try:
+        limit = query_int(request, "limit", 20, memtrack.RECENT)
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+    return JsonResponse(memtrack.report(limit))
+
+
+# ---------- PROFILES ----------
+@staff_member_required
+@require_GET
+def profile_list(request):
+    """Newest stored request profiles"""
+    try:
+        limit = query_int(request, "limit", 50, 1000)
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+    return JsonResponse({"profiles": profiling.list_profiles(limit)})
+
+
+@staff_member_required
+@require_GET
+def profile_detail(request, profile_id):
+    """Hottest coding functions of one profile, ?all=1 for every module, ?download=1 for the .pstats file"""
+    try:
+        top = query_int(request, "top", 20, 500)
+    except ValueError:
+        return JsonResponse({"error": "top must be an integer"}, status=400)
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        raise Http404("No such profile")
+    if request.GET.get("download"):
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=os.path.basename(path))
+    meta = {}
+    meta_path = profiling.profile_path(profile_id, '.json')
+    if meta_path:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    return JsonResponse({**meta, **profiling.hot_functions(path, top, package_only=not request.GET.get("all"))})
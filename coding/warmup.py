@@ -0,0 +1,187 @@
+"""Warm-up of every shared index, model and cache before workers fork.
+
+run_warmup() runs the WARMUP_STEPS in order, then collects and freezes
+the garbage collector (``gc.freeze()``). The frozen objects are never
+scanned again, so the collector does not write to their pages and a
+forked worker keeps sharing them copy-on-write with the master instead
+of copying them on its first collection.
+
+gunicorn.conf.py runs it from its on_starting hook, in the master
+process. Servers without such a hook can set WARMUP_ON_READY so that
+CodingConfig.ready() runs it. The readiness view answers the ready
+flag, staff users also get the warm-up state, the timings and this
+worker's memory.
+"""
+import gc
+import os
+import time
+import logging
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STEPS = ('mappings', 'cpt_index', 'icd_spotter', 'embeddings', 'model', 'pipeline')
+WARMUP_STEPS = tuple(getattr(settings, 'WARMUP_STEPS', DEFAULT_STEPS))
+
+# Report run through the whole pipeline to time the first and a warm request
+PROBE_REPORT = (
+    "Exam: XR CHEST 2 VIEWS\n"
+    "Clinical Indication: cough, shortness of breath\n"
+    "Findings: No focal consolidation. No pleural effusion.\n"
+    "Impression: Possible early pneumonia, headache\n"
+)
+
+state = {
+    'started_at': None,
+    'completed_at': None,
+    'pid': None,
+    'steps': {},
+    'failed': {},
+    'first_request_ms': None,
+    'warm_request_ms': None,
+    'frozen_objects': 0,
+}
+
+
+def _warm_mappings():
+    from .matching import get_code_mapping
+
+    for kind in ('cpt', 'icd'):
+        get_code_mapping(kind)
+
+
+def _warm_cpt_index():
+    from .cpt_attributes import get_cpt_attribute_index
+    from .matching import get_code_mapping
+
+    store = get_code_mapping('cpt')
+    if store is not None:
+        get_cpt_attribute_index(store)
+
+
+def _warm_icd_spotter():
+    from .diagnosis_spotter import get_diagnosis_spotter
+    from .matching import MAPPING_PREPROCESSORS, get_code_mapping
+    from .negation import get_negation_engine
+
+    get_diagnosis_spotter(get_code_mapping('icd'), MAPPING_PREPROCESSORS['icd'])
+    get_negation_engine()
+
+
+def _warm_embeddings():
+    from .embedding_index import get_embedding_index
+
+    for kind in ('cpt', 'icd'):
+        get_embedding_index(kind)
+
+
+def _warm_model():
+    from ai_model import predict
+
+    predict.predict_cpt("xr chest 2 views")
+
+
+def _warm_ocr():
+    # Only for processes that OCR, text-only workers should leave it out
+    from . import ocr  # noqa: F401
+    import textract  # noqa: F401
+
+
+def _probe():
+    from .reports import process_report_text
+
+    start = time.perf_counter()
+    process_report_text(PROBE_REPORT)
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _warm_pipeline():
+    state['first_request_ms'] = _probe()
+    state['warm_request_ms'] = _probe()
+
+
+STEPS = {
+    'mappings': _warm_mappings,
+    'cpt_index': _warm_cpt_index,
+    'icd_spotter': _warm_icd_spotter,
+    'embeddings': _warm_embeddings,
+    'model': _warm_model,
+    'ocr': _warm_ocr,
+    'pipeline': _warm_pipeline,
+}
+
+
+def run_warmup(steps=None, freeze=True):
+    """Run the warm-up steps and return the state dict.
+
+    A failing step is logged and recorded, the others still run, so a
+    missing optional artifact never keeps a worker from starting.
+    """
+    steps = WARMUP_STEPS if steps is None else steps
+    state.update(started_at=time.time(), completed_at=None, pid=os.getpid(), steps={}, failed={})
+    for name in steps:
+        if name not in STEPS:
+            logger.error(f"Unknown warm-up step: {name}")
+            state['failed'][name] = "unknown step"
+            continue
+        start = time.perf_counter()
+        try:
+            STEPS[name]()
+        except Exception as e:
+            logger.error(f"Warm-up step {name} failed: {e}")
+            state['failed'][name] = str(e)
+        state['steps'][name] = round((time.perf_counter() - start) * 1000, 1)
+
+    # Connections opened by the probe must not be inherited by forked workers
+    connections.close_all()
+    if freeze:
+        gc.collect()
+        gc.freeze()
+        state['frozen_objects'] = gc.get_freeze_count()
+    state['completed_at'] = time.time()
+    logger.info(f"Warm-up finished in {sum(state['steps'].values()):.0f} ms: {state['steps']}")
+    return state
+
+
+def is_warm():
+    return state['completed_at'] is not None
+
+
+def process_memory():
+    """Resident memory of this process in bytes, split into shared and private when Linux reports it."""
+    memory = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                field, _, value = line.partition(':')
+                if field in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'):
+                    memory[field.lower()] = int(value.split()[0]) * 1024
+    except OSError:
+        import resource
+
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory['max_rss'] = peak if os.uname().sysname == 'Darwin' else peak * 1024
+        return memory
+    memory['shared'] = memory.pop('shared_clean', 0) + memory.pop('shared_dirty', 0)
+    memory['private'] = memory.pop('private_clean', 0) + memory.pop('private_dirty', 0)
+    return memory
+
+
+def readiness():
+    """Warm-up state and memory of this worker."""
+    return {
+        'ready': is_warm() or not getattr(settings, 'WARMUP_REQUIRED', False),
+        'warm': is_warm(),
+        'pid': os.getpid(),
+        'warmed_in_pid': state['pid'],
+        'inherited': state['pid'] is not None and state['pid'] != os.getpid(),
+        'warmup_ms': state['steps'],
+        'failed_steps': state['failed'],
+        'first_request_ms': state['first_request_ms'],
+        'warm_request_ms': state['warm_request_ms'],
+        'frozen_objects': state['frozen_objects'],
+        'memory': process_memory(),
+    }
@@ -1,11 +1,18 @@
-import pandas as pd
+"""Append templated training sentences for the CPT codes in cpt_codes_enhanced.csv to labeled_data.csv.
+
+For full synthetic radiology reports with CPT and ICD ground truth, at any
+scale, use `python manage.py generate_corpus` (coding/synthetic.py).
+"""
 import random
 import csv
 import os
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Load enhanced CPT descriptions
-cpt_file = r"C:\Users\AbiReddy\OneDrive\Desktop\Autocoding\medical_coding_ai\dataset\cpt_codes_enhanced.csv"
-cpt_df = pd.read_csv(cpt_file)
+cpt_file = os.path.join(BASE_DIR, "dataset", "cpt_codes_enhanced.csv")
+with open(cpt_file, newline="", encoding="utf-8") as f:
+    cpt_rows = list(csv.DictReader(f))
 
 # Synthetic sentence templates
 templates = [
@@ -19,13 +26,13 @@ templates = [
 
 # Generate synthetic examples
 synthetic_rows = [("Report Description", "CPT Code")]
-for _, row in cpt_df.iterrows():
+for row in cpt_rows:
     for _ in range(8):  # Generate ~8 variants per CPT (total ~80+)
         description = random.choice(templates).format(row["Description"])
         synthetic_rows.append((description, row["CPT Code"]))
 
 # Save path
-labeled_data_file = r"C:\Users\AbiReddy\OneDrive\Desktop\Autocoding\medical_coding_ai\dataset\labeled_data.csv"
+labeled_data_file = os.path.join(BASE_DIR, "dataset", "labeled_data.csv")
 
 # Ensure folder exists
 os.makedirs(os.path.dirname(labeled_data_file), exist_ok=True)
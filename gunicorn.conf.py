@@ -0,0 +1,40 @@
+"""Gunicorn settings: load and warm the app once in the master, then fork.
+
+    gunicorn -c gunicorn.conf.py
+
+Every mapping, index and model is built in the master by the on_starting
+hook (see coding/warmup.py), so workers start warm and share those pages
+copy-on-write.
+"""
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medical_coding_ai.settings')
+# Readiness reports not-ready until the warm-up has run
+os.environ.setdefault('CODING_WARMUP', '1')
+
+wsgi_app = 'medical_coding_ai.wsgi:application'
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+# Request threads must outnumber the OCR lane's admission (OCR_MAX_WORKERS +
+# OCR_MAX_QUEUE), or queued uploads can hold every thread and text waits
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', (os.cpu_count() or 1) * 5 + 8))
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+timeout = 120
+
+
+def on_starting(server):
+    # Runs in the master after preload_app imported the app, before any fork
+    import django
+
+    django.setup()
+    from coding.warmup import run_warmup
+
+    state = run_warmup()
+    server.log.info(f"Warm-up finished: {state['steps']}, {state['frozen_objects']} objects frozen")
+
+
+def post_fork(server, worker):
+    from coding.warmup import process_memory
+
+    server.log.info(f"Worker {worker.pid} forked, memory {process_memory()}")
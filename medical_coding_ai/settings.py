@@ -31,6 +31,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'coding.profiling.ProfilingMiddleware',  # removes itself unless profiling is configured
 ]
 
 ROOT_URLCONF = 'medical_coding_ai.urls'
@@ -94,3 +95,44 @@ CORS_ALLOW_ALL_ORIGINS = True  # Allow all origins (for local frontend POSTs)
 
 # ----------------------------- DEFAULT FIELD TYPE
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# ----------------------------- CPT MODEL (ai_model/predict.py)
+CPT_LINEAR_MODEL = False                     # serve ai_model/cpt_linear.npz (train_linear.py, retrain_model) over the RandomForest
+
+# ----------------------------- SCHEDULING LANES (coding/executors.py)
+OCR_MAX_WORKERS = os.cpu_count() or 1        # OCR processes
+OCR_MAX_QUEUE = OCR_MAX_WORKERS * 4          # extra queued OCR jobs before answering 429
+OCR_NICE = 10                                # OCR processes yield the CPU to text requests
+MATCH_MAX_WORKERS = 8                        # threads for CPT/ICD matching
+TEXT_MAX_QUEUE = MATCH_MAX_WORKERS * 8       # extra queued text jobs before answering 429
+
+# ----------------------------- UPLOADS
+UPLOAD_TEMP_DIR = BASE_DIR / 'upload_tmp'    # report uploads being coded (coding/uploads.py), swept, not shared
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024           # bytes per report file, larger uploads get 413
+MAX_UPLOAD_PAGES = 20                        # PDF pages per report
+UPLOAD_TEMP_MAX_AGE = 3600                   # seconds before the sweeper removes an orphaned temp file
+SINGLEFLIGHT_RESULT_TTL = 60                 # seconds an OCR result is shared with identical uploads
+SINGLEFLIGHT_WAIT_TIMEOUT = 300              # seconds a duplicate waits for the first upload's OCR
+
+# ----------------------------- WARM-UP (gunicorn.conf.py, coding/warmup.py)
+WARMUP_REQUIRED = os.environ.get('CODING_WARMUP') == '1'   # readiness answers 503 until the warm-up ran
+WARMUP_ON_READY = False                      # warm in CodingConfig.ready(), for servers without a preload hook
+WARMUP_STEPS = ['mappings', 'cpt_index', 'icd_spotter', 'embeddings', 'model', 'pipeline']   # add 'ocr' where workers OCR
+
+# ----------------------------- PROFILING (coding/profiling.py)
+PROFILE_HEADER_TOKEN = os.environ.get('CODING_PROFILE_TOKEN', '')   # "X-Profile: <token>" profiles that request
+PROFILE_SAMPLE_RATE = 0.0                    # share of predict requests profiled at random
+PROFILE_DIR = BASE_DIR / 'profiles'          # <request id>.pstats and .json files
+PROFILE_KEEP = 200                           # newest profiles kept
+
+# ----------------------------- MEMORY ACCOUNTING (coding/memtrack.py)
+MEMTRACK_ENABLED = os.environ.get('CODING_MEMTRACK') == '1'   # tracemalloc + RSS per OCR job and stage
+MEMTRACK_RECENT = 200                        # OCR job records kept for the memory view
+MEMTRACK_FRAMES = 1                          # traceback depth of allocation sites
+MEMTRACK_SNAPSHOT_EVERY = 50                 # OCR jobs between two allocation-site snapshots
+
+# ----------------------------- DEADLINES (coding/deadlines.py)
+REQUEST_DEADLINE_MS = 60000                  # budget of a predict request without ?deadline_ms=
+REQUEST_DEADLINE_MAX_MS = 110000             # largest budget a request may ask for (under gunicorn's timeout)
+DEADLINE_OCR_RETRY_MS = 5000                 # budget left needed to retry OCR on a page with little text
+DEADLINE_FUZZY_MS = 1000                     # budget left needed to fuzzy-scan every mapping key